@@ -12,7 +12,6 @@ setup(
         "autopep8==1.5.7",
         "iso8601",
         "h5py",
-        "cachetools",
         "loguru",
         "pynacl",
         "psutil",
@@ -18,6 +18,9 @@ ORM_CLASS_NAMES = {'Variable', 'Hash', 'ForeignVariable', 'ForeignHash', 'LogEve
 MAX_HASH_DIMENSIONS = 16
 MAX_KEY_SIZE = 1024
 
+# Recently used keys whose parsing or validation is cached
+KEY_CACHE_SIZE = 65536
+
 READ_COST_PER_BYTE = 1
 WRITE_COST_PER_BYTE = 25
 
@@ -28,4 +31,28 @@ FILENAME_LEN_MAX = 255
 
 DEFAULT_STAMPS = 1000000
 
+CACHE_SIZE_BYTES = 64 * 1024 * 1024
+
+# Blocks applied with Driver.hard_apply whose previous values are kept for reads as of a block and rollbacks
+STATE_HISTORY_BLOCKS = 0
+
+# Records per chunk when streaming state out of or into the backend
+EXPORT_CHUNK_SIZE = 10000
+
+# Records per entry of the sparse index of a state snapshot, at most scanned by a lookup
+SNAPSHOT_INDEX_INTERVAL = 64
+
+# Write sets logged per fsync, and logged before they are applied to the backend, when a Driver has a write-ahead log
+WAL_SYNC_EVERY = 1
+WAL_APPLY_EVERY = 1
+
+# Write sets waiting to be written by the background committer before committing more blocks waits for it
+BACKGROUND_COMMIT_QUEUE = 64
+
+# Files the default HDF5 backend splits every contract's keys over, 1 for a file per contract
+HDF5_SHARDS = 1
+
+# Codec values are stored on disk with, 'json' or 'binary'. Either can read values written by the other.
+STORAGE_CODEC = 'json'
+
 STORAGE_HOME = Path().home().joinpath(".cometbft/xian")
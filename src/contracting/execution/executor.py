@@ -4,7 +4,6 @@ from contracting.execution.module import install_database_loader, uninstall_buil
 from contracting.stdlib.bridge.decimal import ContractingDecimal, CONTEXT
 from contracting.stdlib.bridge.random import Seeded
 from contracting import constants
-from copy import deepcopy
 
 import importlib
 import decimal
@@ -19,7 +18,8 @@ class Executor:
                  balances_hash='balances',
                  bypass_privates=False,
                  bypass_balance_amount=False,
-                 bypass_cache=False):
+                 bypass_cache=False,
+                 tracer=None):
 
         self.metering = metering
         self.driver = driver
@@ -36,6 +36,10 @@ class Executor:
 
         runtime.rt.env.update({'__Driver': self.driver})
 
+        # Metering engine, e.g. a ContractTracer. Shared by all executors like the rest of the runtime
+        if tracer is not None:
+            runtime.rt.use_tracer(tracer)
+
     def wipe_modules(self):
         uninstall_builtins()
         install_database_loader()
@@ -48,13 +52,6 @@ class Executor:
                 stamp_cost=constants.STAMPS_PER_TAU,
                 metering=None) -> dict:
 
-        current_driver_pending_writes = deepcopy(self.driver.pending_writes)
-        self.driver.clear_transaction_writes()
-        self.driver.clear_events()
-
-        if not self.bypass_privates:
-            assert not function_name.startswith(constants.PRIVATE_METHOD_PREFIX), 'Private method not callable.'
-
         if metering is None:
             metering = self.metering
 
@@ -66,9 +63,98 @@ class Executor:
             driver = runtime.rt.env.get('__Driver')
 
         install_database_loader(driver=driver)
+        decimal.setcontext(CONTEXT)
+
+        try:
+            output = self.execute_transaction(driver, sender, contract_name, function_name, kwargs,
+                                              environment=environment,
+                                              auto_commit=auto_commit,
+                                              stamps=stamps,
+                                              stamp_cost=stamp_cost,
+                                              metering=metering)
+        finally:
+            runtime.rt.clean_up()
+            runtime.rt.env.update({'__Driver': driver})
+            disable_restricted_imports()
+
+        return output
+
+    def execute_batch(self, transactions, environment={}, auto_commit=False) -> list:
+        """
+        Execute a list of transactions, such as the transactions of a block, in order and return their outputs.
+        Transactions are dicts of sender, contract_name, function_name and kwargs, and optionally stamps, stamp_cost,
+        metering and an environment applied on top of the shared one. The results are the same as calling execute
+        for each transaction, but the database loader, decimal context and environment are set up once for the
+        whole batch. A transaction that fails is reverted on its own; the others stay pending (or are committed
+        once at the end with auto_commit).
+        """
+        driver = self.driver
+
+        runtime.rt.env.update({'__Driver': driver})
+        runtime.rt.env.update(environment)
+        batch_environment = dict(runtime.rt.env)
+
+        install_database_loader(driver=driver)
+        decimal.setcontext(CONTEXT)
+
+        outputs = []
+        try:
+            for transaction in transactions:
+                metering = transaction.get('metering')
+                if metering is None:
+                    metering = self.metering
+
+                transaction_environment = transaction.get('environment', {})
+
+                try:
+                    output = self.execute_transaction(driver,
+                                                      transaction['sender'],
+                                                      transaction['contract_name'],
+                                                      transaction['function_name'],
+                                                      transaction['kwargs'],
+                                                      environment=transaction_environment,
+                                                      stamps=transaction.get('stamps', constants.DEFAULT_STAMPS),
+                                                      stamp_cost=transaction.get('stamp_cost',
+                                                                                 constants.STAMPS_PER_TAU),
+                                                      metering=metering)
+                finally:
+                    runtime.rt.clean_up_transaction()
+                    if transaction_environment:
+                        runtime.rt.env.clear()
+                        runtime.rt.env.update(batch_environment)
+
+                outputs.append(output)
+
+            if auto_commit:
+                driver.commit()
+        finally:
+            runtime.rt.clean_up()
+            runtime.rt.env.update({'__Driver': driver})
+            disable_restricted_imports()
+
+        return outputs
+
+    def execute_transaction(self, driver, sender, contract_name, function_name, kwargs,
+                            environment={},
+                            auto_commit=False,
+                            stamps=constants.DEFAULT_STAMPS,
+                            stamp_cost=constants.STAMPS_PER_TAU,
+                            metering=True) -> dict:
+        """
+        Run a single transaction on driver, with the database loader installed. Leaves the runtime to be cleaned up
+        by the caller.
+        """
+        driver.clear_transaction_writes()
+        driver.clear_events()
+
+        if not self.bypass_privates:
+            assert not function_name.startswith(constants.PRIVATE_METHOD_PREFIX), 'Private method not callable.'
 
         balances_key = None
 
+        # Records the keys the transaction writes so they can be reverted if it fails
+        driver.begin_savepoint()
+
         try:
             if metering:
                 balances_key = (f'{self.currency_contract}'
@@ -110,8 +196,6 @@ class Executor:
             if runtime.rt.context.owner is not None and runtime.rt.context.owner != runtime.rt.context.caller:
                 raise Exception(f'Caller {runtime.rt.context.caller} is not the owner {runtime.rt.context.owner}!')
 
-            decimal.setcontext(CONTEXT)
-
             module = importlib.import_module(contract_name)
             func = getattr(module, function_name)
 
@@ -126,8 +210,13 @@ class Executor:
             enable_restricted_imports()
             runtime.rt.set_up(stmps=stamps * 1000, meter=metering)
             result = func(**kwargs)
-            transaction_writes = deepcopy(driver.transaction_writes)
-            events = deepcopy(driver.log_events)
+
+            # Hand the transaction's writes and events to the output rather than copying them
+            transaction_writes = driver.transaction_writes
+            events = driver.log_events
+            driver.transaction_writes = {}
+            driver.log_events = []
+
             runtime.rt.tracer.stop()
             disable_restricted_imports()
 
@@ -138,18 +227,20 @@ class Executor:
             result = e
             status_code = 1
             # Revert the writes if the transaction fails
-            driver.pending_writes = current_driver_pending_writes
+            driver.rollback_savepoint()
             transaction_writes = {}
             events = []
             if auto_commit:
                 driver.flush_cache()
 
+        else:
+            driver.release_savepoint()
+
         finally:
             driver.clear_events()
             driver.clear_transaction_writes()
             runtime.rt.tracer.stop()
-
-        #runtime.rt.tracer.stop()
+            disable_restricted_imports()
 
         # Deduct the stamps if that is enabled
         stamps_used = runtime.rt.tracer.get_stamp_used()
@@ -180,10 +271,8 @@ class Executor:
                 driver.commit()
 
         Seeded.s = False
-        runtime.rt.clean_up()
-        runtime.rt.env.update({'__Driver': driver})
 
-        output = {
+        return {
             'status_code': status_code,
             'result': result,
             'stamps_used': stamps_used,
@@ -191,6 +280,3 @@ class Executor:
             'reads': driver.pending_reads,
             'events': events
         }
-
-        disable_restricted_imports()
-        return output
@@ -2,9 +2,15 @@ from importlib.abc import Loader
 from importlib import invalidate_caches, __import__
 from importlib.machinery import ModuleSpec
 from contracting.storage.driver import Driver
+from contracting.storage.orm import Datum, LogEvent
 from contracting.stdlib import env
 from contracting.execution.runtime import rt
+from contracting.execution.tracer import precompute_costs
+from contracting import constants
+from collections import OrderedDict
 
+import ast
+import copy
 import marshal
 import builtins
 import sys
@@ -82,7 +88,176 @@ class DatabaseFinder:
         return ModuleSpec(self, DatabaseLoader(DatabaseFinder.driver))
 
 
-MODULE_CACHE = {}
+# Executed contract modules kept across transactions, least recently used first
+MODULE_CACHE = OrderedDict()
+MODULE_CACHE_SIZE = 256
+
+# Unmarshalled contract code by name, as (blob, code). Reusing the code object keeps its cost tables in the tracer
+CODE_CACHE = OrderedDict()
+
+# Names a cacheable module body may refer to outside of constants
+STATIC_NAMES = {'str', 'int', 'float', 'bool', 'dict', 'list', 'tuple', 'bytes', 'Any', 'decimal'}
+
+
+def _is_immutable_expr(node):
+    if isinstance(node, ast.Constant):
+        return True
+    if isinstance(node, ast.Tuple):
+        return all(_is_immutable_expr(e) for e in node.elts)
+    if isinstance(node, ast.UnaryOp):
+        return _is_immutable_expr(node.operand)
+    if isinstance(node, ast.Name):
+        return node.id in STATIC_NAMES
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'decimal':
+        return all(_is_immutable_expr(a) for a in node.args) and not node.keywords
+    return False
+
+
+def _is_literal_expr(node):
+    if isinstance(node, (ast.List, ast.Set)):
+        return all(_is_literal_expr(e) for e in node.elts)
+    if isinstance(node, ast.Dict):
+        return all(k is not None and _is_literal_expr(k) for k in node.keys) and \
+            all(_is_literal_expr(v) for v in node.values)
+    return _is_immutable_expr(node)
+
+
+def _is_known_decorator(node):
+    # @export and @construct, or @__export('con_name') as the compiler rewrites @export
+    if isinstance(node, ast.Call):
+        return isinstance(node.func, ast.Name) and \
+            node.func.id == constants.PRIVATE_METHOD_PREFIX + constants.EXPORT_DECORATOR_STRING and \
+            all(isinstance(a, ast.Constant) for a in node.args) and not node.keywords
+    return isinstance(node, ast.Name) and node.id in constants.VALID_DECORATORS
+
+
+def _is_cacheable_function(node):
+    # Defaults, annotations and decorators are evaluated once when the module runs, so a mutable default (or
+    # anything else they build) would be shared by every transaction reusing the module
+    args = node.args
+    annotations = [a.annotation for a in args.posonlyargs + args.args + args.kwonlyargs]
+    annotations += [a.annotation for a in (args.vararg, args.kwarg) if a is not None] + [node.returns]
+    return all(_is_immutable_expr(d) for d in args.defaults) and \
+        all(d is None or _is_immutable_expr(d) for d in args.kw_defaults) and \
+        all(a is None or isinstance(a, (ast.Name, ast.Constant)) for a in annotations) and \
+        all(_is_known_decorator(d) for d in node.decorator_list)
+
+
+def _is_cacheable_statement(node):
+    if isinstance(node, ast.FunctionDef):
+        return _is_cacheable_function(node)
+    if isinstance(node, ast.Expr):
+        return isinstance(node.value, ast.Constant)
+    if not isinstance(node, ast.Assign) or len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+        return False
+
+    value = node.value
+    if isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and \
+            value.func.id in constants.ORM_CLASS_NAMES:
+        # Only LogEvent keeps its (literal) arguments to itself, everything else must be immutable
+        is_arg = _is_literal_expr if value.func.id == 'LogEvent' else _is_immutable_expr
+        return all(is_arg(a) for a in value.args) and all(is_arg(k.value) for k in value.keywords)
+
+    return _is_immutable_expr(value)
+
+
+def is_cacheable(source):
+    """
+    A contract module can be reused across transactions if its body only defines functions, ORM objects and
+    immutable constants. Anything else (imports, mutable globals, reads at import time) could carry state from
+    one transaction into the next, so such modules are executed on every import.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, TypeError, ValueError):
+        return False
+    return all(_is_cacheable_statement(node) for node in tree.body)
+
+
+class CachedModule:
+    """
+    The executed scope of a contract module, or just its code blob (with scope None) if the module is known not
+    to be cacheable.
+    """
+    def __init__(self, blob, scope=None, before=None):
+        self.blob = blob
+        self.scope = scope
+        if scope is None:
+            return
+
+        # Names bound by the module body, which the environment must not overwrite
+        self.defined = {k for k, v in scope.items() if k not in before or before[k] is not v}
+        self.data = [k for k, v in scope.items() if k in self.defined and isinstance(v, Datum)]
+        self.env_keys = set(rt.env) - self.defined
+
+        # Attributes of the objects the module defines as it left them. Contracts can set attributes on ORM objects
+        # and functions, their own or another contract's, so they are put back before every reuse
+        self.attributes = {k: self.__copy_attributes(vars(v)) for k, v in scope.items()
+                           if k in self.defined and hasattr(v, '__dict__')}
+
+    @staticmethod
+    def __copy_attributes(attributes):
+        # The driver is rebound on every reuse, and can't be copied
+        return {k: v if k == '_driver' else copy.deepcopy(v) for k, v in attributes.items()}
+
+    def rebind(self):
+        """
+        Point the cached scope at the current transaction's environment, driver and signer.
+        """
+        # Keys the previous environment set fall back to the standard library, or disappear
+        stdlib = env.gather()
+        for k in self.env_keys.difference(rt.env):
+            if k in stdlib:
+                self.scope[k] = stdlib[k]
+            else:
+                self.scope.pop(k, None)
+
+        self.env_keys = set(rt.env) - self.defined
+        self.scope.update({k: rt.env[k] for k in self.env_keys})
+
+        for name, attributes in self.attributes.items():
+            state = vars(self.scope[name])
+            state.clear()
+            state.update(self.__copy_attributes(attributes))
+
+        driver = rt.env.get('__Driver')
+        for name in self.data:
+            datum = self.scope[name]
+            if driver is not None:
+                datum._driver = driver
+            if isinstance(datum, LogEvent):
+                datum._signer = rt.context.signer
+
+        return self.scope
+
+
+def clear_module_cache():
+    MODULE_CACHE.clear()
+    CODE_CACHE.clear()
+
+
+def load_code(name, blob):
+    """
+    Unmarshal the compiled code of a contract, reusing the code object of the last load if the blob is unchanged.
+    The cost tables of new code objects are built here so metering never has to.
+    """
+    cached = CODE_CACHE.get(name)
+    if cached is not None and cached[0] == blob:
+        CODE_CACHE.move_to_end(name)
+        return cached[1]
+
+    code = marshal.loads(blob)
+    if code is None:
+        return None
+
+    precompute_costs(code)
+
+    CODE_CACHE[name] = (blob, code)
+    CODE_CACHE.move_to_end(name)
+    while len(CODE_CACHE) > MODULE_CACHE_SIZE:
+        CODE_CACHE.popitem(last=False)
+
+    return code
 
 
 class DatabaseLoader(Loader):
@@ -94,31 +269,56 @@ class DatabaseLoader(Loader):
 
     def exec_module(self, module):
         # fetch the individual contract
-        code = self.d.get_compiled(module.__name__)
-        if code is None:
+        blob = self.d.get_compiled(module.__name__)
+        if blob is None:
             raise ImportError("Module {} not found".format(module.__name__))
 
-        if type(code) != bytes:
-            code = bytes.fromhex(code)
+        if type(blob) != bytes:
+            blob = bytes.fromhex(blob)
 
-        code = marshal.loads(code)
+        # Module bodies run under the tracer are metered, so only reuse a cached module outside of metering
+        cached = MODULE_CACHE.get(module.__name__)
+        if cached is not None and cached.blob != blob:
+            cached = None
+
+        if cached is not None and cached.scope is not None and not rt.tracer.is_started():
+            MODULE_CACHE.move_to_end(module.__name__)
+            scope = cached.rebind()
+        else:
+            scope = self.__exec_code(module.__name__, blob, cache=cached is None and not rt.tracer.is_started())
+
+        # Update the module's attributes with the new scope
+        vars(module).update(scope)
+        del vars(module)['__builtins__']
+
+        rt.loaded_modules.append(module.__name__)
+
+    def __exec_code(self, name, blob, cache=False):
+        code = load_code(name, blob)
 
         if code is None:
-            raise ImportError("Module {} not found".format(module.__name__))
+            raise ImportError("Module {} not found".format(name))
 
         scope = env.gather()
         scope.update(rt.env)
 
         scope.update({'__contract__': True})
+        before = dict(scope)
 
         # execute the module with the std env and update the module to pass forward
         exec(code, scope)
 
-        # Update the module's attributes with the new scope
-        vars(module).update(scope)
-        del vars(module)['__builtins__']
+        if cache:
+            if is_cacheable(self.d.get_contract(name)):
+                MODULE_CACHE[name] = CachedModule(blob, scope, before)
+            else:
+                MODULE_CACHE[name] = CachedModule(blob)
 
-        rt.loaded_modules.append(module.__name__)
+            MODULE_CACHE.move_to_end(name)
+            while len(MODULE_CACHE) > MODULE_CACHE_SIZE:
+                MODULE_CACHE.popitem(last=False)
+
+        return scope
 
     def module_repr(self, module):
         return '<module {!r} (smart contract)>'.format(module.__name__)
@@ -0,0 +1,218 @@
+from contracting.execution.executor import Executor
+from contracting.execution.module import DatabaseFinder
+from contracting.execution import runtime
+from contracting.storage.driver import Driver
+
+import multiprocessing
+import math
+import sys
+import os
+
+
+class RecordingDriver(Driver):
+    """
+    Driver that records the keys a transaction reads and writes and the prefixes it scans, so speculative
+    executions can be checked for conflicts with the transactions before them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_keys = set()
+        self.written_keys = set()
+        self.scanned_prefixes = set()
+
+    def clear_access_sets(self):
+        self.read_keys = set()
+        self.written_keys = set()
+        self.scanned_prefixes = set()
+
+    def get(self, key: str, save: bool = True, at=None):
+        self.read_keys.add(key)
+        return super().get(key, save, at)
+
+    def set(self, key, value, is_txn_write=False):
+        self.written_keys.add(key)
+        super().set(key, value, is_txn_write)
+
+    def items(self, prefix=""):
+        self.scanned_prefixes.add(prefix)
+        return super().items(prefix)
+
+
+# State of a worker process: its executor and the block its driver cache is valid for
+worker = {}
+
+
+def init_worker(backend, storage_home, cache_size, bypass_cache, executor_args, tracer_class):
+    driver = RecordingDriver(bypass_cache=bypass_cache, storage_home=storage_home, backend=backend,
+                             cache_size=cache_size)
+    worker['executor'] = Executor(driver=driver, tracer=tracer_class(), **executor_args)
+    worker['block'] = None
+
+
+def execute_chunk(block, base_writes, base_reads, transactions):
+    """
+    Execute (index, transaction) pairs one by one, each against the state at the start of the block, and return
+    for each the output with the read and write sets of the execution.
+    """
+    executor = worker['executor']
+    driver = executor.driver
+
+    if worker['block'] != block:
+        # The state on disk may have been committed to since the last block
+        driver.cache.clear()
+        worker['block'] = block
+
+    results = []
+    driver.pending_writes = dict(base_writes)
+    try:
+        for index, transaction in transactions:
+            driver.pending_reads = dict(base_reads)
+            driver.clear_access_sets()
+
+            # Every transaction runs against the writes pending at the start of the block
+            driver.begin_savepoint()
+            try:
+                output = executor.execute(**transaction)
+                del output['reads']
+
+                writes = {k: driver.pending_writes[k] for k in driver.written_keys if k in driver.pending_writes}
+                reads = {k: driver.pending_reads[k] for k in driver.read_keys if k in driver.pending_reads}
+            finally:
+                driver.rollback_savepoint()
+
+            results.append((index, output, driver.read_keys, driver.written_keys, driver.scanned_prefixes,
+                            writes, reads))
+    finally:
+        # Don't hold on to files the block executor's process commits to
+        driver.backend.reload()
+
+    return results
+
+
+def changed_keys(before, after):
+    return {k for k, v in after.items() if k not in before or (before[k] is not v and before[k] != v)}
+
+
+class BlockExecutor:
+    """
+    Executes the transactions of a block optimistically in parallel. Every transaction is first run in a worker
+    process against the state at the start of the block, recording the keys it read and wrote. The results are
+    then validated in block order: a transaction that read a key written earlier in the block, scanned a prefix
+    such a key falls under, or wrote a key whose read bookkeeping differs from the start of the block (which
+    changes what the write is charged) is executed again, in order, by the executor of this process. Outputs and
+    the resulting pending state are the same as executing the block sequentially with Executor.execute.
+
+    Transactions are dicts of keyword arguments to Executor.execute. They can't pass a driver or auto commit, as
+    the state on disk must not change while a block is being executed.
+    """
+
+    def __init__(self, executor: Executor, processes=None, chunk_size=None):
+        self.executor = executor
+        self.processes = processes or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.pool = None
+        self.blocks = 0
+        self.reexecutions = 0
+
+    def start(self):
+        if self.pool is not None:
+            return
+
+        driver = self.executor.driver
+        executor_args = {
+            'metering': self.executor.metering,
+            'currency_contract': self.executor.currency_contract,
+            'balances_hash': self.executor.balances_hash,
+            'bypass_privates': self.executor.bypass_privates,
+            'bypass_balance_amount': self.executor.bypass_balance_amount,
+        }
+
+        # Modules imported while starting the pool must not be looked up as contracts, which records reads
+        finder_installed = DatabaseFinder in sys.meta_path
+        if finder_installed:
+            sys.meta_path.remove(DatabaseFinder)
+
+        try:
+            # Workers are spawned rather than forked so they don't share open files or connections with this process
+            self.pool = multiprocessing.get_context('spawn').Pool(
+                self.processes,
+                initializer=init_worker,
+                initargs=(driver.backend, driver.contract_state.parent, driver.cache.max_bytes, driver.bypass_cache,
+                          executor_args, type(runtime.rt.tracer))
+            )
+        finally:
+            if finder_installed:
+                sys.meta_path.insert(0, DatabaseFinder)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def execute(self, transactions) -> list:
+        transactions = list(transactions)
+        for transaction in transactions:
+            assert transaction.get('driver') is None, 'Transactions of a block run on the executor driver.'
+            assert not transaction.get('auto_commit'), 'Transactions of a block can not auto commit.'
+
+        if len(transactions) == 0:
+            return []
+
+        self.start()
+        self.blocks += 1
+
+        driver = self.executor.driver
+        base_reads = dict(driver.pending_reads)
+
+        # Workers can't open files this process holds open
+        driver.backend.release()
+
+        chunk_size = self.chunk_size or math.ceil(len(transactions) / (self.processes * 4))
+        indexed = list(enumerate(transactions))
+        chunks = [indexed[i:i + chunk_size] for i in range(0, len(indexed), chunk_size)]
+
+        speculative = {}
+        for results in self.pool.starmap(execute_chunk,
+                                         [(self.blocks, driver.pending_writes, base_reads, c) for c in chunks]):
+            for index, *result in results:
+                speculative[index] = result
+
+        outputs = []
+        written = set()
+        for index, transaction in enumerate(transactions):
+            output, read_keys, written_keys, scanned_prefixes, writes, reads = speculative[index]
+
+            if self.conflicts(read_keys, written_keys, scanned_prefixes, written, base_reads):
+                self.reexecutions += 1
+                before = dict(driver.pending_writes)
+                output = self.executor.execute(**transaction)
+                written.update(changed_keys(before, driver.pending_writes))
+            else:
+                driver.pending_writes.update(writes)
+                for k, v in reads.items():
+                    if driver.pending_reads.get(k) is None:
+                        driver.pending_reads[k] = v
+                written.update(writes)
+                output['reads'] = driver.pending_reads
+
+            outputs.append(output)
+
+        return outputs
+
+    def conflicts(self, read_keys, written_keys, scanned_prefixes, written, base_reads):
+        if not written.isdisjoint(read_keys):
+            return True
+
+        for prefix in scanned_prefixes:
+            if any(k.startswith(prefix) for k in written):
+                return True
+
+        # Driver.set charges a read for keys not read yet in the block, so this has to match the start of the block
+        pending_reads = self.executor.driver.pending_reads
+        for k in written_keys:
+            if (pending_reads.get(k) is None) != (base_reads.get(k) is None):
+                return True
+
+        return False
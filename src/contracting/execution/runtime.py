@@ -99,6 +99,11 @@ class Runtime:
 
     context = _context
 
+    @classmethod
+    def use_tracer(cls, tracer):
+        cls.tracer.stop()
+        cls.tracer = tracer
+
     @classmethod
     def set_up(cls, stmps, meter):
         if meter:
@@ -110,6 +115,15 @@ class Runtime:
 
     @classmethod
     def clean_up(cls):
+        cls.clean_up_transaction()
+        cls.env = {}
+
+    @classmethod
+    def clean_up_transaction(cls):
+        """
+        Reset the metering and unload the contract modules of a transaction, keeping the environment for the next
+        transaction of a batch.
+        """
         cls.tracer.stop()
         cls.tracer.reset()
         cls.stamps = 0
@@ -122,24 +136,33 @@ class Runtime:
                 del sys.modules[mod]
 
         cls.loaded_modules = []
-        cls.env = {}
 
     @classmethod
     def deduct_read(cls, key, value):
         if cls.tracer.is_started():
-            cost = len(key) + len(value)
-            cost *= constants.READ_COST_PER_BYTE
-            cls.tracer.add_cost(cost)
+            cls.charge_read(len(key) + len(value))
 
     @classmethod
     def deduct_write(cls, key, value, multiplier=1):
         if key is not None and cls.tracer.is_started():
-            cost = len(key) + len(value)
-            cls.writes += math.floor(cost * multiplier)
-            assert cls.writes < WRITE_MAX, 'You have exceeded the maximum write capacity per transaction!'
+            cls.charge_write(len(key) + len(value), multiplier)
 
-            stamp_cost = cost * constants.WRITE_COST_PER_BYTE
-            cls.tracer.add_cost(stamp_cost)
+    @classmethod
+    def charge_read(cls, size):
+        """
+        Charge for reading a key and encoded value of size bytes in total. Only call this while metering.
+        """
+        cls.tracer.add_cost(size * constants.READ_COST_PER_BYTE)
+
+    @classmethod
+    def charge_write(cls, size, multiplier=1):
+        """
+        Charge for writing a key and encoded value of size bytes in total. Only call this while metering.
+        """
+        cls.writes += math.floor(size * multiplier)
+        assert cls.writes < WRITE_MAX, 'You have exceeded the maximum write capacity per transaction!'
+
+        cls.tracer.add_cost(size * constants.WRITE_COST_PER_BYTE)
 
 
 rt = Runtime()
@@ -1,6 +1,7 @@
+from array import array
+
 import sys
-import dis
-import threading
+import types
 import psutil
 import os
 
@@ -27,29 +28,45 @@ cu_costs = {
 # Define maximum stamps
 MAX_STAMPS = 6500000
 
+# Maximum growth of the resident memory of the process during a transaction
+MAX_MEMORY_USAGE = 500 * 1024 * 1024
+
+# Maximum number of code objects with a precomputed cost table
+COST_TABLES_SIZE = 4096
+
+# The resident memory is sampled every this many metered lines instead of on every line
+MEMORY_CHECK_INTERVAL = 64
+
 class Tracer:
     def __init__(self):
         self.cost = 0
         self.stamp_supplied = 0
         self.last_frame_mem_usage = 0
         self.total_mem_usage = 0
+        self.lines_until_memory_check = 0
+        self.process = None
         self.started = False
         self.call_count = 0
         self.max_call_count = 800000
-        self.instruction_cache = {}
-        self.lock = threading.Lock()
 
     def start(self):
-        sys.settrace(self.trace_func)
+        self.enable()
         self.cost = 0
         self.call_count = 0
+        self.lines_until_memory_check = 0
         self.started = True
 
     def stop(self):
         if self.started:
-            sys.settrace(None)
+            self.disable()
             self.started = False
 
+    def enable(self):
+        sys.settrace(self.trace_func)
+
+    def disable(self):
+        sys.settrace(None)
+
     def reset(self):
         self.stop()
         self.cost = 0
@@ -80,67 +97,116 @@ class Tracer:
         return self.started
 
     def get_memory_usage(self):
-        process = psutil.Process(os.getpid())
-        mem_info = process.memory_info()
+        # Reuse the Process handle, unless the process was forked since it was created
+        if self.process is None or self.process.pid != os.getpid():
+            self.process = psutil.Process(os.getpid())
         # Return the RSS (Resident Set Size)
-        return mem_info.rss
+        return self.process.memory_info().rss
+
+    def check_memory_usage(self):
+        new_memory_usage = self.get_memory_usage()
+
+        # The first sample of a transaction is the baseline
+        if self.last_frame_mem_usage == 0:
+            self.last_frame_mem_usage = new_memory_usage
+
+        if new_memory_usage > self.last_frame_mem_usage:
+            self.total_mem_usage += (new_memory_usage - self.last_frame_mem_usage)
+        self.last_frame_mem_usage = new_memory_usage
+
+        if self.total_mem_usage > MAX_MEMORY_USAGE:
+            self.stop()
+            raise AssertionError(f"Transaction exceeded memory usage! Total usage: {self.total_mem_usage} bytes")
+
+    def count_line(self):
+        self.call_count += 1
+        if self.call_count > self.max_call_count:
+            self.stop()
+            raise AssertionError("Call count exceeded threshold! Infinite Loop?")
+
+    def charge_line(self, code, lasti):
+        # Sampling the memory is a syscall, so only do it every MEMORY_CHECK_INTERVAL lines
+        self.lines_until_memory_check -= 1
+        if self.lines_until_memory_check <= 0:
+            self.lines_until_memory_check = MEMORY_CHECK_INTERVAL
+            self.check_memory_usage()
+
+        # Add cost based on the opcode at the current instruction
+        self.cost += cost_table(code)[lasti // 2]
+
+        if self.cost > self.stamp_supplied or self.cost > MAX_STAMPS:
+            self.stop()
+            raise AssertionError("The cost has exceeded the stamp supplied!")
 
     def trace_func(self, frame, event, arg):
         if event == 'line':
-            self.call_count += 1
-            if self.call_count > self.max_call_count:
-                self.stop()
-                raise AssertionError("Call count exceeded threshold! Infinite Loop?")
-
-            # Check if the function matches the target module and function names
-            code = frame.f_code
-            current_function_name = code.co_name
-            globals_dict = frame.f_globals
-            module_name = globals_dict.get('__name__', '')
+            self.count_line()
 
             # Only trace code within contracts (if '__contract__' in globals)
-            if '__contract__' not in globals_dict:
+            if '__contract__' not in frame.f_globals:
                 return
 
-            # Get the opcode at the current instruction
-            lasti = frame.f_lasti
-            opcode = self.get_opcode(code, lasti)
+            self.charge_line(frame.f_code, frame.f_lasti)
 
-            # Update memory usage
-            if self.last_frame_mem_usage == 0:
-                self.last_frame_mem_usage = self.get_memory_usage()
+        return self.trace_func
 
-            new_memory_usage = self.get_memory_usage()
-            if new_memory_usage > self.last_frame_mem_usage:
-                self.total_mem_usage += (new_memory_usage - self.last_frame_mem_usage)
-            self.last_frame_mem_usage = new_memory_usage
 
-            # Check for memory usage limit (set an arbitrary limit, e.g., 500MB)
-            if self.total_mem_usage > 500 * 1024 * 1024:
-                self.stop()
-                raise AssertionError(f"Transaction exceeded memory usage! Total usage: {self.total_mem_usage} bytes")
+# id(code) -> (code, costs). The entry holds on to the code object, so its id can't be reused while it is cached
+cost_tables = {}
 
-            # Add cost based on opcode
-            opcode_cost = cu_costs.get(opcode, 1)  # Default cost if opcode not found
-            self.cost += opcode_cost
 
-            if self.cost > self.stamp_supplied or self.cost > MAX_STAMPS:
-                self.stop()
-                raise AssertionError("The cost has exceeded the stamp supplied!")
+def cost_table(code):
+    """
+    The cost of the instruction at every code unit of a code object, indexed by f_lasti // 2. Inline cache entries
+    are charged like opcode 0 and unknown opcodes cost 1.
+    """
+    entry = cost_tables.get(id(code))
+    if entry is not None and entry[0] is code:
+        return entry[1]
 
-        return self.trace_func
+    costs = array('H', (cu_costs.get(opcode, 1) for opcode in code.co_code[::2]))
+
+    # Evict the oldest table. Readers never hold on to an entry, so no lock is needed
+    while len(cost_tables) >= COST_TABLES_SIZE:
+        cost_tables.pop(next(iter(cost_tables)), None)
+
+    cost_tables[id(code)] = (code, costs)
+    return costs
 
-    def get_opcode(self, code, offset):
-        # Cache the instruction map per code object
-        with self.lock:
-            instruction_map = self.instruction_cache.get(code)
-            if instruction_map is None:
-                instruction_map = {}
-                for instr in dis.get_instructions(code):
-                    instruction_map[instr.offset] = instr.opcode
-                self.instruction_cache[code] = instruction_map
-            opcode = instruction_map.get(offset, None)
-            if opcode is None:
-                # Instruction not found; default to 0
-                opcode = 0
-            return opcode
+
+def precompute_costs(code):
+    """
+    Build the cost tables of a code object and of all functions, classes and comprehensions defined in it.
+    """
+    cost_table(code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            precompute_costs(const)
+
+
+class ContractTracer(Tracer):
+    """
+    Charges and counts exactly what Tracer does, but decides once per frame, on its call event, whether the frame
+    runs contract code instead of checking on every line. Contract frames get a line tracer; any other frame only
+    has its first line counted, as Tracer does, and is then no longer traced.
+    """
+
+    def enable(self):
+        sys.settrace(self.call_func)
+
+    def call_func(self, frame, event, arg):
+        if '__contract__' in frame.f_globals:
+            return self.line_func
+        return self.first_line_func
+
+    def line_func(self, frame, event, arg):
+        if event == 'line':
+            self.count_line()
+            self.charge_line(frame.f_code, frame.f_lasti)
+        return self.line_func
+
+    def first_line_func(self, frame, event, arg):
+        if event == 'line':
+            self.count_line()
+            return None
+        return self.first_line_func
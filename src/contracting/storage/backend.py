@@ -0,0 +1,524 @@
+from contracting import constants
+from contracting.storage import hdf5
+from contracting.storage.index import KeyIndex
+
+from collections import defaultdict
+from functools import lru_cache
+from itertools import islice
+
+import heapq
+import os
+import shutil
+import zlib
+
+
+class StorageBackend:
+    """
+    Interface between the Driver and the on-disk state. Keys are full state keys
+    (e.g. 'currency.balances:stu') and values are already encoded, so backends
+    never need to know about contracting types. A value of None means the key
+    is deleted.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def get_block(self, key):
+        raise NotImplementedError
+
+    def write_batch(self, writes, block_num=None):
+        """
+        Apply a dict of key -> encoded value writes in one go.
+        """
+        raise NotImplementedError
+
+    def iter_keys(self, prefix="", length=0):
+        """
+        Yield existing keys starting with prefix in sorted order, at most length of them if length > 0.
+        """
+        raise NotImplementedError
+
+    def filenames(self):
+        """
+        Get the sorted names of all contract and run state files.
+        """
+        raise NotImplementedError
+
+    def has_file(self, filename):
+        raise NotImplementedError
+
+    def delete_file(self, filename):
+        raise NotImplementedError
+
+    def snapshot(self, path):
+        """
+        Write a consistent copy of the whole state under path.
+        """
+        raise NotImplementedError
+
+    def compact(self, filename):
+        """
+        Rewrite a file without the space left behind by deleted keys, and return its size in bytes before and after,
+        or None if there is nothing to compact, as for backends that give space back as keys are deleted.
+        """
+        return None
+
+    def file_stats(self, filename):
+        """
+        A dict of the number of keys in a file holding a value (live) and of entries left behind by deleted keys
+        (dead), or None if the file doesn't exist.
+        """
+        if not self.has_file(filename):
+            return None
+        live = sum(1 for key in self.iter_keys(filename) if filename_for_key(key) == filename)
+        return {"live": live, "dead": 0}
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        """
+        Force the writes made so far to stable storage, so they survive a power failure.
+        """
+        self.flush()
+
+    def barrier(self):
+        """
+        Block until the writes made so far are persisted.
+        """
+        self.sync()
+
+    def close(self):
+        pass
+
+    def release(self):
+        """
+        Close open files so other processes can open them. Anything held in memory about them is kept.
+        """
+        pass
+
+    def reload(self):
+        """
+        Close open files and forget anything held in memory about them, so the next access sees the changes made
+        by other processes.
+        """
+        self.release()
+
+    def clear(self):
+        raise NotImplementedError
+
+    def set(self, key, value, block_num=None):
+        self.write_batch({key: value}, block_num)
+
+    def delete(self, key):
+        self.write_batch({key: None})
+
+    def iter_items(self, prefix="", length=0):
+        for key in self.iter_keys(prefix, length):
+            yield key, self.get(key)
+
+    def iter_records(self, prefix="", start_after=None):
+        """
+        Yield (key, encoded value, block) for the keys starting with prefix in sorted order, only those after
+        start_after if given. Records are read as they are yielded, so the whole state can be streamed.
+        """
+        for key in self.iter_keys(prefix):
+            if start_after is not None and key <= start_after:
+                continue
+            yield key, self.get(key), self.get_block(key)
+
+
+class BackendWrapper(StorageBackend):
+    """
+    Backend holding writes on their way to the backend it wraps. Point reads of keys it holds are served from
+    overlay, a dict of key -> (encoded value, block) (value None if deleted); anything else that needs the wrapped
+    backend first settles what is held, by applying it or waiting for it to be applied.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.overlay = {}
+
+    def __reduce__(self):
+        # Other processes only read, and see the wrapped backend once what is held is settled on release
+        return self.backend.__reduce__()
+
+    def settle(self):
+        raise NotImplementedError
+
+    def hold(self, writes, block_num):
+        # Blocks are held as the backend stores them
+        block = block_num if block_num is not None else constants.BLOCK_NUM_DEFAULT
+        for key, value in writes.items():
+            self.overlay[key] = (value, block)
+
+    def get(self, key):
+        held = self.overlay.get(key)
+        if held is not None:
+            return held[0]
+        return self.backend.get(key)
+
+    def get_block(self, key):
+        held = self.overlay.get(key)
+        if held is not None:
+            return held[1] if held[0] is not None else None
+        return self.backend.get_block(key)
+
+    def iter_keys(self, prefix="", length=0):
+        self.settle()
+        return self.backend.iter_keys(prefix, length)
+
+    def iter_items(self, prefix="", length=0):
+        self.settle()
+        return self.backend.iter_items(prefix, length)
+
+    def iter_records(self, prefix="", start_after=None):
+        self.settle()
+        return self.backend.iter_records(prefix, start_after)
+
+    def filenames(self):
+        self.settle()
+        return self.backend.filenames()
+
+    def has_file(self, filename):
+        self.settle()
+        return self.backend.has_file(filename)
+
+    def delete_file(self, filename):
+        self.settle()
+        self.backend.delete_file(filename)
+
+    def snapshot(self, path):
+        self.settle()
+        self.backend.snapshot(path)
+
+    def compact(self, filename):
+        self.settle()
+        return self.backend.compact(filename)
+
+    def file_stats(self, filename):
+        self.settle()
+        return self.backend.file_stats(filename)
+
+    def flush(self):
+        self.backend.flush()
+
+    def sync(self):
+        self.settle()
+        self.backend.sync()
+
+    def barrier(self):
+        self.settle()
+        self.backend.barrier()
+
+    def close(self):
+        self.settle()
+        self.backend.close()
+
+    def release(self):
+        self.settle()
+        self.backend.release()
+
+    def reload(self):
+        self.settle()
+        self.backend.reload()
+
+
+def filename_for_key(key):
+    """
+    The file (or namespace) a key lives in, e.g. 'currency' for 'currency.balances:stu'.
+    """
+    return key.split(constants.INDEX_SEPARATOR, 1)[0].split(constants.DELIMITER, 1)[0]
+
+
+@lru_cache(maxsize=constants.KEY_CACHE_SIZE)
+def parse_key(key):
+    """
+    The file and group path a key is stored under in HDF5, e.g. ('currency', 'balances/stu') for
+    'currency.balances:stu'. Cached, as the same keys are parsed over and over.
+    """
+    parts = key.split(constants.INDEX_SEPARATOR, 1)
+
+    # The rest (after the first '.') becomes the group and attribute inside the HDF5 file
+    variable = parts[1] if len(parts) > 1 else parts[0]
+    return filename_for_key(key), variable.replace(constants.DELIMITER, constants.HDF5_GROUP_SEPARATOR)
+
+
+class HDF5Backend(StorageBackend):
+    """
+    Stores every contract in its own HDF5 file, with one group per key holding
+    the value and block number as attributes. Files of names starting with '__'
+    live in run_state, all others in contract_state.
+
+    With shards > 1, every contract is instead split over that many shard files
+    in a directory named after it, each key stored in the shard picked by a
+    stable hash of it, so a large contract isn't one big file behind one lock.
+    The number of shards is recorded in contract_state, and opening state with
+    another raises ValueError.
+
+    Open files are pooled. HDF5 locks a file while it is open for writing, so
+    other processes can read it only after flush; a process that reads state
+    another one writes should release its files once done reading.
+
+    Each file gets a sorted KeyIndex, built on its first scan and kept up to
+    date on writes, so prefix scans don't walk the file. Indexes are saved
+    under index_home on close and reused while their file is unchanged.
+    """
+
+    # Indexes are shared by every backend on the same directories, so writes through one are seen by all
+    index_registry = {}
+
+    # Records the number of shards in contract_state; its name can't be a contract's
+    SHARDS_FILE = ".shards"
+
+    def __init__(self, contract_state, run_state, index_home=None, shards=1):
+        self.contract_state = contract_state
+        self.run_state = run_state
+        self.index_home = index_home if index_home is not None else contract_state.parent.joinpath("key_index")
+        self.shards = shards
+        self.indexes, self.unindexed = HDF5Backend.index_registry.setdefault(str(self.index_home), ({}, set()))
+        # Paths of the files written since they were last synced
+        self.unsynced = set()
+        self.__build_directories()
+        hdf5.size_pool(shards)
+
+    def __reduce__(self):
+        # Pickled as its directories, e.g. to open the same state in a worker process
+        return HDF5Backend, (self.contract_state, self.run_state, self.index_home, self.shards)
+
+    def __build_directories(self):
+        self.contract_state.mkdir(exist_ok=True, parents=True)
+        self.run_state.mkdir(exist_ok=True, parents=True)
+        self.index_home.mkdir(exist_ok=True, parents=True)
+        self.__check_shards()
+
+    def __check_shards(self):
+        # Keys of state opened with another number of shards would be looked for in the wrong files and silently
+        # read as missing. State from before the count was recorded is in the unsharded layout.
+        shards_file = self.contract_state.joinpath(self.SHARDS_FILE)
+        recorded = shards_file.exists()
+        if recorded:
+            shards = int(shards_file.read_text())
+        else:
+            shards = 1 if any(self.contract_state.iterdir()) else self.shards
+
+        if shards != self.shards:
+            raise ValueError(f'State in {self.contract_state} was written with {shards} shards, not {self.shards}.')
+        if not recorded:
+            shards_file.write_text(str(self.shards))
+
+    def __make_key(self, filename, variable):
+        # Keys without an index separator are stored in a group named like their file
+        if variable == filename:
+            return filename
+        return f"{filename}{constants.INDEX_SEPARATOR}" \
+               f"{variable.replace(constants.HDF5_GROUP_SEPARATOR, constants.DELIMITER)}"
+
+    def filename_to_path(self, filename):
+        if filename.startswith("__"):
+            return str(self.run_state.joinpath(filename))
+        else:
+            return str(self.contract_state.joinpath(filename))
+
+    def __is_sharded(self, filename):
+        return self.shards > 1 and not filename.startswith("__")
+
+    def __shard(self, variable):
+        # crc32 rather than hash(), which differs between processes
+        return zlib.crc32(variable.encode()) % self.shards
+
+    def __shard_names(self, filename):
+        """
+        The names of the files a contract is stored in, which its indexes are kept under: just the contract's, or
+        one per shard, e.g. 'currency.3'.
+        """
+        if not self.__is_sharded(filename):
+            return [filename]
+        return [f"{filename}{constants.INDEX_SEPARATOR}{shard}" for shard in range(self.shards)]
+
+    def __shard_name(self, filename, variable):
+        if not self.__is_sharded(filename):
+            return filename
+        return f"{filename}{constants.INDEX_SEPARATOR}{self.__shard(variable)}"
+
+    def __shard_path(self, name):
+        filename, _, shard = name.partition(constants.INDEX_SEPARATOR)
+        if not shard:
+            return self.filename_to_path(filename)
+        return os.path.join(self.filename_to_path(filename), shard)
+
+    def __path(self, filename, variable):
+        # The file a key is stored in
+        if not self.__is_sharded(filename):
+            return self.filename_to_path(filename)
+        return os.path.join(self.filename_to_path(filename), str(self.__shard(variable)))
+
+    def __index_path(self, name):
+        return str(self.index_home.joinpath(name))
+
+    def get_index(self, name):
+        """
+        The KeyIndex of a file or shard, loaded from index_home if still valid or built from the file.
+        """
+        index = self.indexes.get(name)
+        if index is None:
+            filename = name.partition(constants.INDEX_SEPARATOR)[0]
+            file_path = self.__shard_path(name)
+            index = KeyIndex.load(self.__index_path(name), file_path)
+            if index is None:
+                index = KeyIndex(self.__make_key(filename, v) for v in hdf5.get_keys(file_path))
+                index.dirty = True
+            self.indexes[name] = index
+            self.unindexed.discard(name)
+        return index
+
+    def __drop_index(self, name):
+        self.indexes.pop(name, None)
+        self.unindexed.discard(name)
+        if os.path.isfile(self.__index_path(name)):
+            os.unlink(self.__index_path(name))
+
+    def get(self, key):
+        filename, variable = parse_key(key)
+        return hdf5.get_value(self.__path(filename, variable), variable)
+
+    def get_block(self, key):
+        filename, variable = parse_key(key)
+        return hdf5.get_block(self.__path(filename, variable), variable)
+
+    def write_batch(self, writes, block_num=None):
+        files = defaultdict(list)
+        for key, value in writes.items():
+            filename, variable = parse_key(key)
+            if len(filename) < constants.FILENAME_LEN_MAX:
+                files[self.__shard_name(filename, variable)].append((key, variable, value))
+
+        blocknum = block_num if block_num is not None else constants.BLOCK_NUM_DEFAULT
+        for name, file_writes in files.items():
+            filename = name.partition(constants.INDEX_SEPARATOR)[0]
+            if self.__is_sharded(filename):
+                os.makedirs(self.filename_to_path(filename), exist_ok=True)
+
+            file_path = self.__shard_path(name)
+            hdf5.write_batch(file_path, [(v, value) for _, v, value in file_writes], blocknum)
+            self.unsynced.add(file_path)
+
+            index = self.indexes.get(name)
+            if index is not None:
+                index.update(
+                    added=[key for key, _, value in file_writes if value is not None],
+                    removed=[key for key, _, value in file_writes if value is None]
+                )
+            elif name not in self.unindexed:
+                # A saved index no longer matches the file
+                self.__drop_index(name)
+                self.unindexed.add(name)
+
+    def iter_records(self, prefix="", start_after=None):
+        for key in self.iter_keys(prefix):
+            if start_after is not None and key <= start_after:
+                continue
+            filename, variable = parse_key(key)
+            value, block = hdf5.get_record(self.__path(filename, variable), variable)
+            if value is not None:
+                yield key, value, block
+
+    def iter_keys(self, prefix="", length=0):
+        if constants.INDEX_SEPARATOR in prefix:
+            filenames = [filename_for_key(prefix)]
+        else:
+            filenames = [f for f in self.filenames() if f.startswith(prefix)]
+
+        # Keys of different files (and shards) can interleave (e.g. 'con_a-b.x' < 'con_a.x'), so merge the scans
+        keys = heapq.merge(*[
+            self.get_index(name).iter_prefix(prefix) for f in filenames for name in self.__shard_names(f)
+        ])
+        return islice(keys, length) if length > 0 else keys
+
+    def filenames(self):
+        contract_files = [name for name in os.listdir(self.contract_state) if name != self.SHARDS_FILE]
+        return sorted(contract_files + os.listdir(self.run_state))
+
+    def has_file(self, filename):
+        return os.path.exists(self.filename_to_path(filename))
+
+    def delete_file(self, filename):
+        for name in self.__shard_names(filename):
+            hdf5.close(self.__shard_path(name))
+            self.__drop_index(name)
+
+        file_path = self.filename_to_path(filename)
+        if os.path.isdir(file_path):
+            shutil.rmtree(file_path)
+        elif os.path.isfile(file_path):
+            os.unlink(file_path)
+
+    def snapshot(self, path):
+        hdf5.flush()
+        shutil.copytree(self.contract_state, os.path.join(path, self.contract_state.name))
+        shutil.copytree(self.run_state, os.path.join(path, self.run_state.name))
+
+    def compact(self, filename):
+        # Compacted copies are written next to the state directories, so they are swapped in by a rename but never
+        # listed as state files
+        compaction_home = self.contract_state.parent.joinpath("compaction")
+        compaction_home.mkdir(exist_ok=True, parents=True)
+
+        sizes = None
+        for name in self.__shard_names(filename):
+            shard_sizes = hdf5.compact(self.__shard_path(name), str(compaction_home.joinpath(name)))
+            if shard_sizes is None:
+                continue
+            sizes = shard_sizes if sizes is None else (sizes[0] + shard_sizes[0], sizes[1] + shard_sizes[1])
+
+            index = self.indexes.get(name)
+            if index is not None:
+                # Same keys, but a saved copy would no longer match the file
+                index.dirty = True
+        return sizes
+
+    def file_stats(self, filename):
+        stats = None
+        for name in self.__shard_names(filename):
+            shard_stats = hdf5.file_stats(self.__shard_path(name))
+            if shard_stats is None:
+                continue
+            stats = shard_stats if stats is None else {k: v + shard_stats[k] for k, v in stats.items()}
+        return stats
+
+    def flush(self):
+        hdf5.flush()
+
+    def sync(self):
+        # Directories are synced too, for the files created in them
+        directories = {os.path.dirname(path) for path in self.unsynced}
+        for path in self.unsynced:
+            hdf5.sync(path)
+        for directory in directories:
+            hdf5.sync(directory)
+        self.unsynced.clear()
+
+    def close(self):
+        hdf5.close()
+
+        for name, index in self.indexes.items():
+            file_path = self.__shard_path(name)
+            if index.dirty and os.path.isfile(file_path):
+                index.save(self.__index_path(name), file_path)
+
+    def release(self):
+        hdf5.close()
+
+    def reload(self):
+        hdf5.close()
+        self.indexes.clear()
+        self.unindexed.clear()
+
+    def clear(self):
+        hdf5.close()
+        self.indexes.clear()
+        self.unindexed.clear()
+        shutil.rmtree(self.run_state, ignore_errors=True)
+        shutil.rmtree(self.contract_state, ignore_errors=True)
+        shutil.rmtree(self.index_home, ignore_errors=True)
+        self.__build_directories()
@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from contracting import constants
+from contracting.storage.encoder import encode
+
+# Cached in place of a value for keys known not to exist on disk
+MISSING = object()
+
+
+class StateCache:
+    """
+    Least recently used cache of decoded state values bounded by the encoded
+    size of its entries in bytes, rather than by entry count. Keys known to be
+    absent are cached as MISSING so repeated misses never reach the disk.
+
+    Entries can also keep the length of the JSON encoding of their value, which
+    reads are charged stamps for, so it is worked out once per entry.
+    """
+
+    def __init__(self, max_bytes=constants.CACHE_SIZE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.negative_hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key):
+        return self.entries[key][0]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.size -= self.entries.pop(key)[1]
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        if entry[0] is MISSING:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value, size=None, cost_size=None):
+        """
+        Cache a value, evicting the least recently used entries to stay within max_bytes. A value of None
+        removes the key. Pass size (the encoded length of the value) and cost_size (the length of its JSON
+        encoding) when they are already known.
+        """
+        self.pop(key)
+        if value is None:
+            return
+
+        if value is MISSING:
+            size = 0
+        elif size is None:
+            size = len(encode(value))
+        size += len(key)
+
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = (value, size, cost_size)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted[1]
+            self.evictions += 1
+
+    def get_cost_size(self, key):
+        """
+        The length of the JSON encoding of a cached value, or None if the key isn't cached or it isn't known.
+        """
+        entry = self.entries.get(key)
+        return entry[2] if entry is not None else None
+
+    def set_cost_size(self, key, cost_size):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries[key] = (entry[0], entry[1], cost_size)
+
+    def pop(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return default
+        self.size -= entry[1]
+        return entry[0]
+
+    def items(self):
+        return ((k, entry[0]) for k, entry in self.entries.items())
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'negative_hits': self.negative_hits,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+        }
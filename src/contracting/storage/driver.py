@@ -1,17 +1,23 @@
-from contracting.storage.encoder import encode_kv
+from contracting.storage.encoder import encode, decode, is_binary, CODECS
 from contracting.execution.runtime import rt
 from contracting.stdlib.bridge.time import Datetime
 from contracting.stdlib.bridge.decimal import ContractingDecimal
 from datetime import datetime
-from pathlib import Path
-from cachetools import TTLCache
 from contracting import constants
-from contracting.storage import hdf5
+from contracting.storage.backend import HDF5Backend, filename_for_key
+from contracting.storage.cache import StateCache, MISSING
+from contracting.storage.history import StateHistory
+from contracting.storage.merkle import StateCommitment, DB_NAME as STATE_ROOT_DB_NAME
+from contracting.storage.wal import LoggedBackend, FILE_NAME as WAL_FILE_NAME
+from contracting.storage.pipeline import PipelinedBackend
+from contracting.storage.snapshot import write_snapshot
+from contracting.storage import export
+from collections import defaultdict
+from copy import deepcopy
 
 import marshal
 import decimal
 import os
-import shutil
 
 FILE_EXT = ".d"
 HASH_EXT = ".x"
@@ -27,77 +33,126 @@ TIME_KEY = "__submitted__"
 COMPILED_KEY = "__compiled__"
 DEVELOPER_KEY = "__developer__"
 
+# Recorded in a savepoint for keys that had no pending write when the savepoint began
+ABSENT = object()
+
 
 class Driver:
-    def __init__(self, bypass_cache=False, storage_home=constants.STORAGE_HOME):
+    def __init__(self, bypass_cache=False, storage_home=constants.STORAGE_HOME, backend=None,
+                 cache_size=constants.CACHE_SIZE_BYTES, history=constants.STATE_HISTORY_BLOCKS, state_root=False,
+                 codec=constants.STORAGE_CODEC, wal=False, wal_sync_every=constants.WAL_SYNC_EVERY,
+                 wal_apply_every=constants.WAL_APPLY_EVERY, background_commit=False,
+                 shards=constants.HDF5_SHARDS):
+        assert codec in CODECS, f'Unknown codec {codec}.'
         self.pending_deltas = {}
         self.pending_writes = {}
         self.pending_reads = {}
         self.transaction_writes = {}
+        # Key -> (value, encoding to store, length of its JSON encoding or None) of immutable pending writes,
+        # made when they are set and reused while the key is still pending that same value
+        self.pending_encoded = {}
         self.log_events = []
-        self.cache = TTLCache(maxsize=1000, ttl=6*3600)
+        # Stack of open savepoints, each mapping the keys written since it began to their previous pending value
+        self.savepoints = []
+        self.cache = StateCache(max_bytes=cache_size)
+        self.history = StateHistory(max_blocks=history)
         self.bypass_cache = bypass_cache
         self.contract_state = storage_home.joinpath("contract_state")
         self.run_state = storage_home.joinpath("run_state")
-        self.__build_directories()
-
-    def __build_directories(self):
-        self.contract_state.mkdir(exist_ok=True, parents=True)
-        self.run_state.mkdir(exist_ok=True, parents=True)
-
-    def __parse_key(self, key):
-        # Split the key into parts (filename, group, etc.)
-        parts = key.split(constants.INDEX_SEPARATOR, 1)  # Ensure key contains the INDEX_SEPARATOR
-        
-        # The first part should be the filename (e.g., "currency")
-        filename = parts[0].split(constants.DELIMITER, 1)[0]  # Get only 'currency' from 'currency.balances'
-        
-        # The rest (after the first '.') becomes the group and attribute inside the HDF5 file
-        if len(parts) > 1:
-            variable = parts[1].replace(constants.DELIMITER, constants.HDF5_GROUP_SEPARATOR)
-        else:
-            variable = parts[0].replace(constants.DELIMITER, constants.HDF5_GROUP_SEPARATOR)
-        
-        return filename, variable
-
-
-    def __filename_to_path(self, filename):
-        if filename.startswith("__"):
-            return str(self.run_state.joinpath(filename))
-        else:
-            return str(self.contract_state.joinpath(filename))
+        self.backend = backend if backend is not None else HDF5Backend(self.contract_state, self.run_state,
+                                                                       shards=shards)
+        if wal:
+            # Write sets are logged before they reach the backend, and applied in batches of wal_apply_every
+            self.backend = LoggedBackend(self.backend, storage_home.joinpath(WAL_FILE_NAME),
+                                         sync_every=wal_sync_every, apply_every=wal_apply_every)
+        # Merkle commitment to the contract state, kept up to date with every write to disk if enabled
+        self.commitment = StateCommitment(storage_home.joinpath(STATE_ROOT_DB_NAME)) if state_root else None
+        # Values are written with this codec; values on disk are read whichever codec wrote them
+        self.codec = codec
+        self.encode_value = CODECS[codec]
+
+        if wal:
+            # Finish applying what a previous process logged but didn't get to apply
+            for _, writes in self.backend.replay():
+                if self.commitment is not None:
+                    self.__commit_to_state_root(writes)
+
+        if background_commit:
+            # Write sets are written on a worker thread while the next block executes; barrier waits for them
+            self.backend = PipelinedBackend(self.backend)
 
     def __get_files(self):
-        return sorted(os.listdir(self.contract_state) + os.listdir(self.run_state))
-    
+        return self.backend.filenames()
+
     def is_file(self, filename):
-        file_path = Path(self.__filename_to_path(filename))
-        return file_path.is_file()
+        return self.backend.has_file(filename)
 
-    def get(self, key: str, save: bool = True):
+    def get(self, key: str, save: bool = True, at=None):
         """
         Get a value from the cache, pending reads, or disk. If save is True, 
-        the value will be saved to pending_reads.
+        the value will be saved to pending_reads. If at is given, get the value as of the block applied at those
+        nanos instead, which must be one of the last blocks kept in the history.
         """ 
-        # Parse the key to get the filename and group
+        if at is not None:
+            return self.find_at(key, at)
+
         value = self.find(key)
         if save and self.pending_reads.get(key) is None:
             self.pending_reads[key] = value
-        if value is not None:
-            rt.deduct_read(*encode_kv(key, value))
+        if value is not None and rt.tracer.is_started():
+            rt.charge_read(len(key.encode()) + self.__cost_size(key, value))
         return value
 
-
     def set(self, key, value, is_txn_write=False):
-        rt.deduct_write(*encode_kv(key, value))
+        converted = ContractingDecimal(str(value)) if type(value) in [decimal.Decimal, float] else value
+
+        # Encoded once here, both to be charged for and to be stored on commit
+        stored = self.encode_value(converted) if converted is not None else None
+        cost_size = len(stored) if stored is not None and self.encode_value is encode else None
+        if rt.tracer.is_started():
+            if converted is not value:
+                # Floats and Decimals are charged as they were given, not as they are stored
+                write_size = len(encode(value))
+            else:
+                if cost_size is None:
+                    cost_size = len(encode(value))
+                write_size = cost_size
+            rt.charge_write(len(key.encode()) + write_size)
+
         if self.pending_reads.get(key) is None:
             self.get(key)
-        if type(value) in [decimal.Decimal, float]:
-            value = ContractingDecimal(str(value))
+        value = converted
+        if self.savepoints:
+            self.__journal(key)
         self.pending_writes[key] = value
+        if value is not None and not isinstance(value, (dict, list)):
+            # Containers can still change in place until they are committed, so they are encoded then
+            self.pending_encoded[key] = (value, stored, cost_size)
         if is_txn_write:
             self.transaction_writes[key] = value
 
+    def __cost_size(self, key, value):
+        """
+        The length of the JSON encoding of a value just found for key, which reads are charged for, worked out
+        once for pending writes and cached values.
+        """
+        if self.bypass_cache:
+            return len(encode(value))
+
+        pending = self.pending_writes.get(key)
+        if pending is not None:
+            entry = self.pending_encoded.get(key)
+            if entry is None or entry[0] is not pending:
+                return len(encode(value))
+            if entry[2] is None:
+                self.pending_encoded[key] = entry = (entry[0], entry[1], len(encode(value)))
+            return entry[2]
+
+        cost_size = self.cache.get_cost_size(key)
+        if cost_size is None:
+            cost_size = len(encode(value))
+            self.cache.set_cost_size(key, cost_size)
+        return cost_size
 
     def find(self, key: str):
         """
@@ -105,69 +160,58 @@ class Driver:
         it will look it up from the disk.
         """
         if self.bypass_cache:
-            # Parse the key to get the filename and group
-            filename, variable = self.__parse_key(key)
-            value = hdf5.get_value_from_disk(self.__filename_to_path(filename), variable)
-            return value
+            return self.value_from_disk(key)
 
         value = self.pending_writes.get(key)
+        if value is not None:
+            # Pending values are kept as they are in savepoints, so they must not change in place
+            return deepcopy(value) if isinstance(value, (dict, list)) else value
+
+        value = self.cache.get(key)
+        if value is MISSING:
+            return None
         if value is None:
-            value = self.cache.get(key)
-        if value is None:
-            # Parse the key to get the filename and group for disk lookup
-            filename, variable = self.__parse_key(key)
-            value = hdf5.get_value_from_disk(self.__filename_to_path(filename), variable)
-        return value
+            encoded = self.backend.get(key)
+            value = decode(encoded)
+            if value is None:
+                self.cache.set(key, MISSING)
+                return None
+            self.cache.set(key, value, len(encoded))
+
+        # Contracts must not be able to mutate the cached copy in place
+        return deepcopy(value) if isinstance(value, (dict, list)) else value
+
+    def find_at(self, key: str, nanos):
+        """
+        Find the value a key had on disk once the block at nanos was applied, ignoring pending writes.
+        """
+        changed, previous = self.history.lookup(key, nanos)
+        value = previous[0] if changed else self.__committed_value(key)
 
+        return deepcopy(value) if isinstance(value, (dict, list)) else value
 
-    def __get_keys_from_file(self, filename):
-        return hdf5.get_groups(self.__filename_to_path(filename))
+    def __committed_value(self, key):
+        value = self.cache.get(key)
+        if value is MISSING:
+            return None
+        if value is None:
+            return decode(self.backend.get(key))
+        return value
 
     def keys_from_disk(self, prefix=None, length=0):
         """
         Get all keys from disk with a given prefix
         """
-        keys = set()
-        try:
-            for filename in self.__get_files():
-                for key in self.__get_keys_from_file(filename):
-                    if prefix and key.startswith(prefix):
-                        keys.add(key)
-                    elif not prefix:
-                        keys.add(key)
-
-                    if 0 < length <= len(keys):
-                        raise AssertionError("Length threshold has been hit. Continuing.")
-        except AssertionError:
-            pass
-
-        keys = list(keys)
-        keys.sort()
-        return keys
+        return list(self.backend.iter_keys(prefix or "", length))
 
     def iter_from_disk(self, prefix="", length=0):
-        try:
-            filename, _ = self.__parse_key(prefix)
-        except Exception:
-            return self.keys(prefix=prefix)
-
-        if not self.is_file(filename=filename):
-            return []
-
-        keys_from_file = self.__get_keys_from_file(filename)
-
-        keys = [key for key in keys_from_file if key.startswith(prefix)]
-        keys.sort()
-
-        return keys if length == 0 else keys[:length]
+        return list(self.backend.iter_keys(prefix, length))
 
     def value_from_disk(self, key):
         """
-        Retrieve a value from the disk based on the parsed key.
+        Retrieve a value from the disk through the storage backend.
         """
-        # Parse the key to get the filename and group
-        filename, variable = self.__parse_key(key)
-        return hdf5.get_value_from_disk(self.__filename_to_path(filename), variable)
+        return decode(self.backend.get(key))
 
     def items(self, prefix=""):
         """
@@ -179,13 +223,7 @@ class Driver:
         # Collect pending writes with matching prefix
         for k, v in self.pending_writes.items():
             if k.startswith(prefix) and v is not None:
-                _items[k] = v
-                keys.add(k)
-
-        # Collect cache items with matching prefix
-        for k, v in self.cache.items():
-            if k.startswith(prefix) and v is not None:
-                _items[k] = v
+                _items[k] = deepcopy(v) if isinstance(v, (dict, list)) else v
                 keys.add(k)
 
         # Collect keys from the disk
@@ -266,10 +304,11 @@ class Driver:
         Fully delete a contract from the caches and disk
         """
         for key in self.keys(name):
-            if self.cache.get(key) is not None:
-                del self.cache[key]
+            self.cache.pop(key)
 
             if self.pending_writes.get(key) is not None:
+                if self.savepoints:
+                    self.__journal(key)
                 del self.pending_writes[key]
 
             self.delete_key_from_disk(key)
@@ -278,19 +317,59 @@ class Driver:
         """
         Get all contract files as a list of strings
         """
-        return sorted(os.listdir(self.contract_state))
+        return [f for f in self.__get_files() if not f.startswith("__")]
 
     def delete_key_from_disk(self, key):
         """
         Delete a key from the disk by parsing the filename and group from the key.
         """
-        # Parse the key to get the filename and group
-        filename, variable = self.__parse_key(key)
-        if len(filename) < constants.FILENAME_LEN_MAX:
-            hdf5.delete_key_from_disk(self.__filename_to_path(filename), variable)
+        self.backend.delete(key)
+        self.cache.set(key, MISSING)
+        if self.commitment is not None:
+            self.__commit_to_state_root({key: None})
+
+    def begin_savepoint(self):
+        """
+        Start recording the pending writes that follow, so they can be undone with rollback_savepoint. Savepoints
+        nest; only the keys written are recorded, so this is cheap however many writes are pending.
+        """
+        self.savepoints.append({})
+
+    def rollback_savepoint(self):
+        """
+        Undo the pending writes made since the innermost savepoint began, and close it.
+        """
+        for key, value in self.savepoints.pop().items():
+            if value is ABSENT:
+                self.pending_writes.pop(key, None)
+            else:
+                self.pending_writes[key] = value
+
+    def release_savepoint(self):
+        """
+        Keep the pending writes made since the innermost savepoint began, and close it. They can still be undone
+        by rolling back the savepoint it is nested in.
+        """
+        savepoint = self.savepoints.pop()
+        if self.savepoints:
+            outer = self.savepoints[-1]
+            for key, value in savepoint.items():
+                outer.setdefault(key, value)
+
+    def __journal(self, key):
+        savepoint = self.savepoints[-1]
+        if key not in savepoint:
+            savepoint[key] = self.pending_writes.get(key, ABSENT)
+
+    def __clear_savepoints(self):
+        # The pending writes are gone, so there is nothing left to undo
+        for savepoint in self.savepoints:
+            savepoint.clear()
 
     def flush_cache(self):
+        self.__clear_savepoints()
         self.pending_writes.clear()
+        self.pending_encoded.clear()
         self.pending_reads.clear()
         self.pending_deltas.clear()
         self.transaction_writes.clear()
@@ -298,15 +377,64 @@ class Driver:
         self.cache.clear()
 
     def flush_disk(self):
-        shutil.rmtree(self.run_state, ignore_errors=True)
-        shutil.rmtree(self.contract_state, ignore_errors=True)
-        self.__build_directories()
+        self.backend.clear()
+        self.cache.clear()
+        self.history.clear()
+        if self.commitment is not None:
+            self.commitment.clear()
 
     def flush_file(self, filename):
-        file_path = self.__filename_to_path(filename)
-        if os.path.isfile(file_path):
-            os.unlink(file_path)
-            
+        self.backend.delete_file(filename)
+        if self.commitment is not None:
+            self.commitment.delete_prefix(f"{filename}{DELIMITER}")
+            self.commitment.update({filename: None})
+        for key in [k for k, _ in self.cache.items() if filename_for_key(k) == filename]:
+            self.cache.pop(key)
+
+    def close(self):
+        """
+        Persist everything committed and close the backend and state root: waits for the background committer,
+        applies the write-ahead log and saves the key indexes. Call it before the process exits; the Driver can't
+        be used after.
+        """
+        self.backend.close()
+        if self.commitment is not None:
+            self.commitment.close()
+
+    def snapshot(self, path):
+        """
+        Write a consistent copy of the state on disk under path.
+        """
+        self.backend.snapshot(path)
+
+    def compact(self, filenames=None):
+        """
+        Rewrite state files without the entries and free space left behind by deleted keys, all of them if no
+        filenames are given. Safe while the state is in use: each file is swapped for its compacted copy at once,
+        and writes to it wait until then. Other processes see the compacted files once they reload. Returns
+        filename -> (bytes before, bytes after) of the files compacted.
+        """
+        filenames = filenames if filenames is not None else self.__get_files()
+        sizes = {}
+        for filename in filenames:
+            result = self.backend.compact(filename)
+            if result is not None:
+                sizes[filename] = result
+        return sizes
+
+    def file_stats(self, filenames=None):
+        """
+        Get filename -> stats of state files, all of them if no filenames are given, with the number of keys
+        holding a value (live) and of entries left behind by deleted keys (dead), which compact removes.
+        """
+        filenames = filenames if filenames is not None else self.__get_files()
+        stats = {}
+        for filename in filenames:
+            result = self.backend.file_stats(filename)
+            if result is not None:
+                stats[filename] = result
+        return stats
+
     def set_event(self, event):
         self.log_events.append(event)
 
@@ -326,12 +454,15 @@ class Driver:
     def rollback(self, nanos=None):
         """
         Rollback to a given Nanoseconds in L2 cache or if no Nanoseconds is given, rollback to the latest state on disk.
+        Blocks applied at or after the given Nanoseconds that are kept in the history are undone on disk as well.
         """
         if nanos is None:
             # Resets to the latest state on disk
+            self.__clear_savepoints()
             self.cache.clear()
             self.pending_reads.clear()
             self.pending_writes.clear()
+            self.pending_encoded.clear()
             self.pending_deltas.clear()
         else:
             to_delete = []
@@ -345,23 +476,79 @@ class Driver:
             for _nanos in to_delete:
                 self.pending_deltas.pop(_nanos, None)
 
+            undo = self.history.pop_since(nanos)
+            if len(undo) > 0:
+                # Pending state was built on top of the blocks being undone
+                self.__clear_savepoints()
+                self.pending_reads.clear()
+                self.pending_writes.clear()
+                self.pending_encoded.clear()
+
+                # Keys get back the blocks they were written at too
+                blocks = defaultdict(dict)
+                for key, (value, block) in undo.items():
+                    blocks[block][key] = value
+                for block, writes in blocks.items():
+                    self.__write_to_disk(writes, block, record=False)
+
+    def __write_to_disk(self, writes, block_num=None, record=True):
+        """
+        Write a dict of key -> value to the backend and keep the cache, including known missing keys, in step
+        with what was written. Unless record is False, the values the keys had, and the blocks they were written at,
+        are kept in the history.
+        """
+        if record and self.history.max_blocks > 0:
+            self.history.record(block_num, {
+                k: (self.__committed_value(k), self.backend.get_block(k)) for k in writes
+            })
+
+        encoded = {}
+        cost_sizes = {}
+        for k, v in writes.items():
+            entry = self.pending_encoded.get(k)
+            if entry is not None and entry[0] is v:
+                encoded[k], cost_sizes[k] = entry[1], entry[2]
+            else:
+                encoded[k] = self.encode_value(v) if v is not None else None
+                if self.encode_value is encode:
+                    cost_sizes[k] = len(encoded[k]) if v is not None else None
+
+        self.backend.write_batch(encoded, block_num)
+        if self.commitment is not None:
+            if self.encode_value is encode:
+                self.__commit_to_state_root(encoded)
+            else:
+                self.__commit_to_state_root({k: encode(v) if v is not None else None for k, v in writes.items()})
+
+        for k, v in writes.items():
+            if v is None:
+                self.cache.set(k, MISSING)
+            elif type(v) in (str, int, bool):
+                self.cache.set(k, v, len(encoded[k]), cost_sizes.get(k))
+            else:
+                # Cached as it reads back from disk (e.g. tuples as lists, dict keys as strings), so warm and cold
+                # caches give contracts the same values. Its JSON encoding, and so its cost size, is the same.
+                self.cache.set(k, decode(encoded[k]), len(encoded[k]), cost_sizes.get(k))
+
     def commit(self):
         """
-        Save the current state to disk and clear the L1 and L2 caches.
+        Save the current state to disk, updating the cache with the committed values, and clear the L1 caches.
         """
-        for k, v in self.pending_writes.items():
-            # Parse the key before applying to HDF5
-            filename, variable = self.__parse_key(k)
-            if v is None:
-                hdf5.delete_key_from_disk(self.__filename_to_path(filename), variable)
-            else:
-                hdf5.set_value_to_disk(self.__filename_to_path(filename), variable, v, None)
+        self.__write_to_disk(self.pending_writes)
+        self.backend.flush()
 
-        self.cache.clear()
+        self.__clear_savepoints()
         self.pending_writes.clear()
+        self.pending_encoded.clear()
         self.pending_reads.clear()
 
 
+    def barrier(self):
+        """
+        Wait until everything committed so far is persisted by the backend.
+        """
+        self.backend.barrier()
+
     def hard_apply(self, nanos):
         """
         Save the current state to disk and L1 cache and clear the L2 cache.
@@ -372,43 +559,186 @@ class Driver:
             current = self.pending_reads.get(k)
             deltas[k] = (current, v)
 
-            self.cache[k] = v
-
         self.pending_deltas[nanos] = {"writes": deltas, "reads": self.pending_reads}
 
         # Clear the top cache
+        self.__clear_savepoints()
         self.pending_reads = {}
         self.pending_writes.clear()
 
-        # Run through the sorted HCLs from oldest to newest applying each one
+        # Run through the sorted HCLs from oldest to newest, collapsing them into one write set
         to_delete = []
+        writes = {}
         for _nanos, _deltas in sorted(self.pending_deltas.items()):
             # Run through all state changes, taking the second value, which is the post delta
             for key, delta in _deltas["writes"].items():
-                # Parse the key before applying to HDF5
-                filename, variable = self.__parse_key(key)
-                hdf5.set_value_to_disk(self.__filename_to_path(filename), variable, delta[1], nanos)
+                writes[key] = delta[1]
 
             to_delete.append(_nanos)
             if _nanos == nanos:
                 break
 
+        self.__write_to_disk(writes, nanos)
+        self.backend.flush()
+        self.pending_encoded.clear()
+
         # Remove the deltas from the set
         [self.pending_deltas.pop(key) for key in to_delete]
 
 
+    def __commit_to_state_root(self, encoded):
+        # Run state (files starting with '__') is not part of the state root. Leaves hash the JSON encoding of
+        # values, so the root doesn't depend on the codec they are stored with.
+        self.commitment.update({
+            k: encode(decode(v)) if is_binary(v) else v
+            for k, v in encoded.items() if not filename_for_key(k).startswith("__")
+        })
+
+    def state_root(self):
+        """
+        Hex digest committing to all contract state on disk. Requires the driver to be created with state_root.
+        """
+        assert self.commitment is not None, 'State root is not enabled for this driver.'
+        return self.commitment.root()
+
+    def prove(self, key):
+        """
+        Proof of the value of a key on disk (or that it does not exist) against state_root, to be checked with
+        contracting.storage.merkle.verify_proof.
+        """
+        assert self.commitment is not None, 'State root is not enabled for this driver.'
+        return self.commitment.prove(key)
+
+    def rebuild_state_root(self, batch_size=10000):
+        """
+        Compute the state root from scratch by reading all contract state, e.g. when enabling it on existing state.
+        """
+        assert self.commitment is not None, 'State root is not enabled for this driver.'
+        self.commitment.clear()
+        for filename in self.get_contract_files():
+            batch = {}
+            for key, value, _ in self.__iter_file_records(filename):
+                batch[key] = value
+                if len(batch) >= batch_size:
+                    self.__commit_to_state_root(batch)
+                    batch = {}
+            self.__commit_to_state_root(batch)
+
+    def __iter_file_records(self, filename, start_after=None):
+        # The records of one file in key order: the key named like it, then those under it. A scan of the bare name
+        # would read every file whose name starts with it, e.g. con_t1 and con_t12 for con_t
+        if start_after is None or filename > start_after:
+            value = self.backend.get(filename)
+            if value is not None:
+                yield filename, value, self.backend.get_block(filename)
+
+        for separator in (DELIMITER, HASH_DEPTH_DELIMITER):
+            yield from self.backend.iter_records(f"{filename}{separator}", start_after=start_after)
+
+    def iter_state(self, chunk_size=constants.EXPORT_CHUNK_SIZE, run_state=True, start_after=None):
+        """
+        Yield the state on disk as lists of at most chunk_size (key, encoded value, block) records, file by file in
+        sorted key order, reading it as it goes. Pass the last key of a chunk as start_after to continue from it
+        later. Neither pending state nor the cache is touched.
+        """
+        start_file = filename_for_key(start_after) if start_after is not None else None
+
+        chunk = []
+        for filename in self.__get_files():
+            if filename.startswith("__") and not run_state:
+                continue
+            if start_file is not None and filename < start_file:
+                continue
+
+            # Files are exported in order of their names, so only keys of the file resumed in are skipped
+            start = start_after if filename == start_file else None
+            for record in self.__iter_file_records(filename, start_after=start):
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+
+        if len(chunk) > 0:
+            yield chunk
+
+    def export_state(self, path, run_state=True, chunk_size=constants.EXPORT_CHUNK_SIZE):
+        """
+        Stream the state on disk to a binary export file at path, in memory bounded by chunk_size records.
+        Returns the number of records written.
+        """
+        records = (record for chunk in self.iter_state(chunk_size, run_state) for record in chunk)
+
+        # Written next to the target and moved into place, so a partial export is never left at path
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            count = export.write_records(f, records)
+        os.replace(tmp_path, path)
+
+        return count
+
+    def export_snapshot(self, path, block=None, run_state=True):
+        """
+        Write the state on disk to a read-only snapshot file at path, taken at block, e.g. the block just applied,
+        to be served by SnapshotDriver in other processes. Returns the number of records written.
+        """
+        records = self.backend.iter_records()
+        if not run_state:
+            records = (record for record in records if not filename_for_key(record[0]).startswith("__"))
+
+        # Written next to the target and moved into place, so readers only ever map a whole snapshot
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            count = write_snapshot(f, records, block)
+        os.replace(tmp_path, path)
+
+        return count
+
+    def import_state(self, path, batch_size=constants.EXPORT_CHUNK_SIZE):
+        """
+        Write the records of an export file to disk in batches of up to batch_size writes, keeping their block
+        numbers. Keys already on disk are overwritten, others are kept. The whole file is checked for corruption
+        before anything is written, raising ValueError if it is corrupted. Returns the number of records imported.
+        """
+        count = 0
+        batch = {}
+        batch_block = None
+
+        with open(path, "rb") as f:
+            # Read through once first, as the count and digest can only be checked at the end
+            for _ in export.read_records(f):
+                pass
+            f.seek(0)
+
+            for key, value, block in export.read_records(f):
+                if len(batch) >= batch_size or (len(batch) > 0 and block != batch_block):
+                    self.__import_batch(batch, batch_block)
+                    batch = {}
+
+                batch[key] = value
+                batch_block = block
+                count += 1
+
+        if len(batch) > 0:
+            self.__import_batch(batch, batch_block)
+        self.backend.flush()
+
+        return count
+
+    def __import_batch(self, batch, block_num):
+        self.backend.write_batch(batch, block_num)
+        for key in batch:
+            self.cache.pop(key)
+        if self.commitment is not None:
+            self.__commit_to_state_root(batch)
+
     def get_all_contract_state(self):
         """
         Queries the disk storage and returns a dictionary with all the state from the contract storage directory.
         """
         all_contract_state = {}
-        for file_path in self.contract_state.iterdir():
-            filename = file_path.name
-            keys = hdf5.get_all_keys_from_file(self.__filename_to_path(filename))
-            for key in keys:
-                full_key = f"{filename}{DELIMITER}{key}"
-                value = self.get(full_key)
-                all_contract_state[full_key] = value
+        for filename in self.get_contract_files():
+            for key in self.backend.iter_keys(f"{filename}{DELIMITER}"):
+                all_contract_state[key] = self.get(key)
 
         return all_contract_state
     
@@ -418,13 +748,11 @@ class Driver:
         Retrieves the latest state information from the run state directory.
         """
         run_state = {}
-        for file_path in self.run_state.iterdir():
-            filename = file_path.name
-            keys = self.__get_keys_from_file(self.__filename_to_path(filename))
-            for key in keys:
-                full_key = f"{filename}{DELIMITER}{key}"
-                value = hdf5.get_value_from_disk(self.__filename_to_path(filename), key)
-                run_state[full_key] = value
+        for filename in self.__get_files():
+            if not filename.startswith("__"):
+                continue
+            for key, value in self.backend.iter_items(f"{filename}{DELIMITER}"):
+                run_state[key] = decode(value)
 
         return run_state
 
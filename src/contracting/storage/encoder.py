@@ -1,5 +1,6 @@
 import json
 import decimal
+import struct
 
 from contracting.stdlib.bridge.time import Datetime, Timedelta
 from contracting.stdlib.bridge.decimal import ContractingDecimal, MAX_LOWER_PRECISION, fix_precision
@@ -89,6 +90,10 @@ def encode_ints_in_dict(data: dict):
 
 
 # JSON library from Python 3 doesn't let you instantiate your custom Encoder. You have to pass it as an obj to json
+# functions, which builds a new one on every call, so a single encoder and decoder are made here and reused.
+_json_encoder = Encoder(separators=(',', ':'))
+
+
 def encode(data: str):
     """ NOTE:
     Normally encoding behavior is overriden in 'default' method inside
@@ -97,12 +102,23 @@ def encode(data: str):
     
     Due to MongoDB integer limitation (8 bytes), we need to preprocess 'big' integers.
     """
+    # Fast path for the most common values, giving the same output as json.dumps
+    t = type(data)
+    if t is str:
+        return json.encoder.encode_basestring_ascii(data)
+    elif t is int and MONGO_MIN_INT < data < MONGO_MAX_INT:
+        return int.__repr__(data)
+    elif t is bool:
+        return 'true' if data else 'false'
+    elif data is None:
+        return 'null'
+
     if isinstance(data, int):
         data = encode_int(data)
     elif isinstance(data, dict):
         data = encode_ints_in_dict(data)
 
-    return json.dumps(data, cls=Encoder, separators=(',', ':'))
+    return _json_encoder.encode(data)
 
 
 def as_object(d):
@@ -119,21 +135,270 @@ def as_object(d):
     return dict(d)
 
 
+_json_decoder = json.JSONDecoder(object_hook=as_object)
+
+
 # Decode has a hook for JSON objects, which are just Python dictionaries. You have to specify the logic in this hook.
 # This is not uniform, but this is how Python made it.
 def decode(data):
+    """
+    Decode a value encoded with either encode or encode_binary, telling them apart by the first byte.
+    """
     if data is None:
         return None
 
     if isinstance(data, bytes):
+        if data[:1] == BINARY_PREFIX:
+            return decode_binary(data)
         data = data.decode()
 
     try:
-        return json.loads(data, object_hook=as_object)
+        return _json_decoder.decode(data)
     except json.decoder.JSONDecodeError as e:
         return None
 
 
+##
+# BINARY CODEC
+# A compact, deterministic alternative to JSON for values stored on disk. A value is BINARY_PREFIX followed by a
+# tagged value: a tag byte, then
+#   int:            zigzag varint, of any size
+#   float:          IEEE 754 double, big endian
+#   str, bytes:     varint length, then the utf-8 or raw bytes
+#   decimal:        varint length, then the fixed precision string as in JSON
+#   Datetime:       varints of year, month, day, hour, minute, second, microsecond
+#   Timedelta:      zigzag varints of days and seconds, as in JSON
+#   list:           varint count, then the tagged items; tuples are lists as in JSON
+#   dict:           varint count, then a varint length and utf-8 key and a tagged value per item
+# Values decode to what decoding their JSON encoding gives, so state can hold both and move between them.
+##
+
+# Never the first byte of JSON, nor of any utf-8 text
+BINARY_PREFIX = b'\xc1'
+
+TAG_NONE = 0x00
+TAG_FALSE = 0x01
+TAG_TRUE = 0x02
+TAG_INT = 0x03
+TAG_FLOAT = 0x04
+TAG_STR = 0x05
+TAG_BYTES = 0x06
+TAG_LIST = 0x07
+TAG_DICT = 0x08
+TAG_FIXED = 0x09
+TAG_TIME = 0x0A
+TAG_DELTA = 0x0B
+
+FLOAT = struct.Struct('>d')
+
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _write_zigzag(out, n):
+    _write_varint(out, n << 1 if n >= 0 else (-n << 1) - 1)
+
+
+def _write_text(out, tag, text):
+    data = text.encode()
+    out.append(tag)
+    _write_varint(out, len(data))
+    out += data
+
+
+def _json_key(k):
+    # Dict keys become strings in JSON, so they do here as well
+    if isinstance(k, str):
+        return k
+    elif k is True:
+        return 'true'
+    elif k is False:
+        return 'false'
+    elif k is None:
+        return 'null'
+    elif isinstance(k, int):
+        return int.__repr__(k)
+    elif isinstance(k, float):
+        return float.__repr__(k)
+    raise TypeError(f'keys must be str, int, float, bool or None, not {k.__class__.__name__}')
+
+
+def _write_value(out, o):
+    t = type(o)
+    if t is str:
+        _write_text(out, TAG_STR, o)
+    elif t is int:
+        out.append(TAG_INT)
+        _write_zigzag(out, o)
+    elif o is None:
+        out.append(TAG_NONE)
+    elif o is True:
+        out.append(TAG_TRUE)
+    elif o is False:
+        out.append(TAG_FALSE)
+    elif isinstance(o, str):
+        _write_text(out, TAG_STR, str(o))
+    elif isinstance(o, int):
+        out.append(TAG_INT)
+        _write_zigzag(out, int(o))
+    elif isinstance(o, float):
+        out.append(TAG_FLOAT)
+        out += FLOAT.pack(o)
+    elif isinstance(o, dict):
+        out.append(TAG_DICT)
+        _write_varint(out, len(o))
+        for k, v in o.items():
+            key = _json_key(k).encode()
+            _write_varint(out, len(key))
+            out += key
+            _write_value(out, v)
+    elif isinstance(o, (list, tuple)):
+        out.append(TAG_LIST)
+        _write_varint(out, len(o))
+        for v in o:
+            _write_value(out, v)
+    elif isinstance(o, bytes):
+        out.append(TAG_BYTES)
+        _write_varint(out, len(o))
+        out += o
+    elif isinstance(o, Datetime) or o.__class__.__name__ == Datetime.__name__:
+        out.append(TAG_TIME)
+        for part in (o.year, o.month, o.day, o.hour, o.minute, o.second, o.microsecond):
+            _write_varint(out, part)
+    elif isinstance(o, Timedelta) or o.__class__.__name__ == Timedelta.__name__:
+        out.append(TAG_DELTA)
+        _write_zigzag(out, o._timedelta.days)
+        _write_zigzag(out, o._timedelta.seconds)
+    elif isinstance(o, decimal.Decimal) or o.__class__.__name__ == decimal.Decimal.__name__:
+        _write_text(out, TAG_FIXED, str(fix_precision(o)))
+    elif isinstance(o, ContractingDecimal) or o.__class__.__name__ == ContractingDecimal.__name__:
+        _write_text(out, TAG_FIXED, str(fix_precision(o._d)))
+    else:
+        raise TypeError(f'Object of type {o.__class__.__name__} is not serializable')
+
+
+def encode_binary(data) -> bytes:
+    """
+    Encode a value with the binary codec. Raises TypeError for values JSON can't encode either.
+    """
+    # Fast path for short strings and small ints, which most state values are
+    t = type(data)
+    if t is str:
+        b = data.encode()
+        if len(b) < 0x80:
+            return bytes((0xC1, TAG_STR, len(b))) + b
+    elif t is int and 0 <= data < 0x40:
+        return bytes((0xC1, TAG_INT, data << 1))
+
+    out = bytearray(BINARY_PREFIX)
+    _write_value(out, data)
+    return bytes(out)
+
+
+def _read_varint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _read_zigzag(data, pos):
+    n, pos = _read_varint(data, pos)
+    return (n >> 1) if not n & 1 else -((n + 1) >> 1), pos
+
+
+def _read_text(data, pos):
+    length, pos = _read_varint(data, pos)
+    end = pos + length
+    if end > len(data):
+        raise ValueError('Truncated value.')
+    return data[pos:end].decode(), end
+
+
+def _read_value(data, pos):
+    tag = data[pos]
+    pos += 1
+
+    if tag == TAG_STR:
+        return _read_text(data, pos)
+    elif tag == TAG_INT:
+        return _read_zigzag(data, pos)
+    elif tag == TAG_NONE:
+        return None, pos
+    elif tag == TAG_TRUE:
+        return True, pos
+    elif tag == TAG_FALSE:
+        return False, pos
+    elif tag == TAG_FLOAT:
+        return FLOAT.unpack_from(data, pos)[0], pos + FLOAT.size
+    elif tag == TAG_DICT:
+        count, pos = _read_varint(data, pos)
+        d = {}
+        for _ in range(count):
+            k, pos = _read_text(data, pos)
+            d[k], pos = _read_value(data, pos)
+        # Dicts that look like encoded types decode to them, as with the JSON object hook
+        return (d if TYPES.isdisjoint(d) else as_object(d)), pos
+    elif tag == TAG_LIST:
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            v, pos = _read_value(data, pos)
+            items.append(v)
+        return items, pos
+    elif tag == TAG_BYTES:
+        length, pos = _read_varint(data, pos)
+        if pos + length > len(data):
+            raise ValueError('Truncated value.')
+        return data[pos:pos + length], pos + length
+    elif tag == TAG_FIXED:
+        s, pos = _read_text(data, pos)
+        return ContractingDecimal(s), pos
+    elif tag == TAG_TIME:
+        parts = []
+        for _ in range(7):
+            part, pos = _read_varint(data, pos)
+            parts.append(part)
+        return Datetime(*parts), pos
+    elif tag == TAG_DELTA:
+        days, pos = _read_zigzag(data, pos)
+        seconds, pos = _read_zigzag(data, pos)
+        return Timedelta(days=days, seconds=seconds), pos
+
+    raise ValueError(f'Unknown tag {tag}.')
+
+
+def decode_binary(data: bytes):
+    """
+    Decode a value encoded with encode_binary, or return None if it is malformed, like decode does for JSON.
+    """
+    try:
+        value, pos = _read_value(data, len(BINARY_PREFIX))
+    except (IndexError, ValueError, struct.error):
+        return None
+    return value if pos == len(data) else None
+
+
+def is_binary(data):
+    return isinstance(data, bytes) and data[:1] == BINARY_PREFIX
+
+
+# Value codecs a Driver can store state with, by name
+CODECS = {
+    'json': encode,
+    'binary': encode_binary,
+}
+
+
 def make_key(contract, variable, args=[]):
     contract_variable = INDEX_SEPARATOR.join((contract, variable))
     if args:
@@ -0,0 +1,118 @@
+from contracting.storage.encoder import is_binary
+
+from hashlib import sha3_256
+
+import struct
+
+# Streaming state export format:
+#
+#   MAGIC, VERSION
+#   records: varint key length, key, varint value length, value, block as signed 64 bit big endian int
+#   footer:  a zero byte (keys are never empty), varint record count, sha3-256 of all record bytes
+#
+# Keys are utf-8 encoded; values are the encoded values as stored by the backend, utf-8 encoded if they are JSON.
+
+MAGIC = b'XSTATE'
+VERSION = 1
+
+BLOCK = struct.Struct('>q')
+
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(f):
+    n = 0
+    shift = 0
+    while True:
+        b = f.read(1)
+        if not b:
+            raise ValueError('Truncated state export.')
+        n |= (b[0] & 0x7F) << shift
+        if b[0] < 0x80:
+            return n
+        shift += 7
+
+
+def read_exact(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        raise ValueError('Truncated state export.')
+    return data
+
+
+def encode_record(key, value, block):
+    record = bytearray()
+    key = key.encode()
+    value = value if isinstance(value, bytes) else value.encode()
+
+    write_varint(record, len(key))
+    record += key
+    write_varint(record, len(value))
+    record += value
+    record += BLOCK.pack(block if block is not None else -1)
+    return bytes(record)
+
+
+def write_records(f, records):
+    """
+    Write an iterable of (key, encoded value, block) records to a binary file object, one at a time. Returns the
+    number of records written.
+    """
+    digest = sha3_256()
+    count = 0
+
+    f.write(MAGIC + bytes([VERSION]))
+    for key, value, block in records:
+        record = encode_record(key, value, block)
+        digest.update(record)
+        f.write(record)
+        count += 1
+
+    footer = bytearray(b'\x00')
+    write_varint(footer, count)
+    f.write(bytes(footer) + digest.digest())
+
+    return count
+
+
+def read_records(f):
+    """
+    Yield the (key, encoded value, block) records of a binary file object written by write_records. The record
+    count and digest are checked once the last record has been read, raising ValueError if they don't match.
+    """
+    if read_exact(f, len(MAGIC)) != MAGIC:
+        raise ValueError('Not a state export.')
+    version = read_exact(f, 1)[0]
+    if version != VERSION:
+        raise ValueError(f'Unsupported state export version {version}.')
+
+    digest = sha3_256()
+    count = 0
+    while True:
+        key_length = read_varint(f)
+        if key_length == 0:
+            break
+
+        key = read_exact(f, key_length)
+        value_length = read_varint(f)
+        value = read_exact(f, value_length)
+        block = read_exact(f, BLOCK.size)
+
+        record = bytearray()
+        write_varint(record, key_length)
+        record += key
+        write_varint(record, value_length)
+        record += value
+        record += block
+        digest.update(record)
+        count += 1
+
+        yield key.decode(), value if is_binary(value) else value.decode(), BLOCK.unpack(block)[0]
+
+    if read_varint(f) != count or read_exact(f, digest.digest_size) != digest.digest():
+        raise ValueError('State export is corrupted.')
@@ -1,22 +1,158 @@
 import h5py
+import numpy as np
+import os
 
-from threading import Lock
-from collections import defaultdict
+from threading import RLock
+from collections import defaultdict, OrderedDict
 from contracting.storage.encoder import encode, decode
 from contracting import constants
 
-# A dictionary to maintain file-specific locks
-file_locks = defaultdict(Lock)
+# A dictionary to maintain file-specific locks. A file's lock is held while its pooled handle is used, so reads
+# and writes of different files don't wait for each other
+file_locks = defaultdict(RLock)
+
+# Pool of open file handles, least recently used first. handles_lock guards the pool itself and is only held to
+# look up, add or evict a handle
+file_handles = OrderedDict()
+handles_lock = RLock()
 
 # Constants
 ATTR_LEN_MAX = 64000
 ATTR_VALUE = "value"
 ATTR_BLOCK = "block"
+# Contracts whose files the pool keeps open, grown to a file per shard by size_pool
+OPEN_CONTRACTS = 64
+MAX_OPEN_FILES = OPEN_CONTRACTS
 
 
 def get_file_lock(file_path):
     """Retrieve a lock for a specific file path."""
-    return file_locks[file_path]
+    with handles_lock:
+        return file_locks[file_path]
+
+
+def size_pool(shards):
+    """
+    Make room in the pool for the files of OPEN_CONTRACTS contracts split
+    over shards files each. The pool is shared by every backend, so it is
+    only ever grown.
+    """
+    global MAX_OPEN_FILES
+    MAX_OPEN_FILES = max(MAX_OPEN_FILES, OPEN_CONTRACTS * shards)
+
+
+def get_file(file_path, mode='r'):
+    """
+    Return a pooled handle for the file path. Handles opened for reading are
+    reopened writable when a write mode is requested. Raises OSError if the
+    file doesn't exist and is opened for reading. Callers hold the file's lock
+    while they use the handle.
+    """
+    with handles_lock:
+        f = file_handles.get(file_path)
+        if f is not None and f.id.valid and (mode == 'r' or f.mode == 'r+'):
+            file_handles.move_to_end(file_path)
+            return f
+        file_handles.pop(file_path, None)
+
+    if f is not None:
+        _close_handle(f)
+    f = h5py.File(file_path, 'r' if mode == 'r' else 'a')
+
+    with handles_lock:
+        file_handles[file_path] = f
+        evicted = _evict(file_path)
+
+    for lock, handle in evicted:
+        try:
+            _close_handle(handle)
+        finally:
+            lock.release()
+
+    return f
+
+
+def get_existing_file(file_path):
+    """
+    Return a pooled handle for reading the file path, or None if there is no
+    such file. Other errors opening it, e.g. another process holding it open
+    for writing, are raised.
+    """
+    try:
+        return get_file(file_path)
+    except OSError:
+        if os.path.exists(file_path):
+            raise
+        return None
+
+
+def _evict(file_path):
+    # Take the least recently used handles out of the pool until it fits, skipping those in use, which are
+    # evicted by a later call instead. Returns them with their file locks held, to be closed by the caller.
+    evicted = []
+    for path in list(file_handles):
+        if len(file_handles) <= MAX_OPEN_FILES:
+            break
+        lock = file_locks[path]
+        if path != file_path and lock.acquire(blocking=False):
+            evicted.append((lock, file_handles.pop(path)))
+    return evicted
+
+
+def _close_handle(f):
+    if f.id.valid:
+        f.close()
+
+
+def flush(file_path=None):
+    """
+    Flush and close one pooled writable handle, or every one if no path is
+    given. HDF5 locks a file for as long as it is open for writing, so other
+    processes can only open it once the writes are flushed; handles opened for
+    reading stay pooled.
+    """
+    with handles_lock:
+        paths = [file_path] if file_path is not None else list(file_handles)
+    for path in paths:
+        with get_file_lock(path):
+            with handles_lock:
+                f = file_handles.get(path)
+            if f is not None and f.id.valid and f.mode == 'r+':
+                f.flush()
+                with handles_lock:
+                    if file_handles.get(path) is f:
+                        del file_handles[path]
+                _close_handle(f)
+
+
+def sync(path):
+    """
+    Flush the pooled handle of a file, if it has one, and force the file (or directory) to disk. Files no longer
+    there are skipped.
+    """
+    flush(path)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def close(file_path=None):
+    """
+    Close one pooled handle, or every handle if no path is given.
+    """
+    with handles_lock:
+        paths = [file_path] if file_path is not None else list(file_handles)
+    for path in paths:
+        with get_file_lock(path):
+            with handles_lock:
+                f = file_handles.pop(path, None)
+            if f is not None:
+                _close_handle(f)
 
 
 def get_value(file_path, group_name):
@@ -27,28 +163,46 @@ def get_block(file_path, group_name):
     return get_attr(file_path, group_name, ATTR_BLOCK)
 
 
+def _from_attr(value):
+    # Binary values are stored opaque so HDF5 keeps them byte for byte, text values as strings
+    if isinstance(value, np.void):
+        return value.tobytes()
+    return value.decode() if isinstance(value, bytes) else value
+
+
 def get_attr(file_path, group_name, attr_name):
-    try:
-        with h5py.File(file_path, 'r') as f:
-            try:
-                value = f[group_name].attrs[attr_name]
-                return value.decode() if isinstance(value, bytes) else value
-            except KeyError:
-                return None
-    except OSError:
-        # File doesn't exist
-        return None
+    with get_file_lock(file_path):
+        f = get_existing_file(file_path)
+        if f is None:
+            return None
+        try:
+            return _from_attr(f[group_name].attrs[attr_name])
+        except KeyError:
+            return None
 
 
+def get_record(file_path, group_name):
+    """
+    The (value, block) attributes of a group, read with one lookup, or (None, None) if it holds no value.
+    """
+    with get_file_lock(file_path):
+        f = get_existing_file(file_path)
+        if f is None:
+            return None, None
+        try:
+            attrs = f[group_name].attrs
+            value = attrs[ATTR_VALUE]
+            block = attrs.get(ATTR_BLOCK)
+        except KeyError:
+            return None, None
+
+    return _from_attr(value), int(block) if block is not None else None
 
-def get_groups(file_path):
-    try:
-        with h5py.File(file_path, 'r') as f:
-            return list(f.keys())
-    except OSError:
-        # File doesn't exist
-        return []
 
+def get_groups(file_path):
+    with get_file_lock(file_path):
+        f = get_existing_file(file_path)
+        return list(f.keys()) if f is not None else []
 
 
 def set(file_path, group_name, value, blocknum, timeout=20):
@@ -59,11 +213,11 @@ def set(file_path, group_name, value, blocknum, timeout=20):
     lock = get_file_lock(file_path if isinstance(file_path, str) else file_path.filename)
     if lock.acquire(timeout=timeout):
         try:
-            with h5py.File(file_path, 'a') as f:
+            f = get_file(file_path, 'a') if isinstance(file_path, str) else file_path
 
-                # Write value and blocknum to the group attributes
-                write_attr(f, group_name, ATTR_VALUE, value, timeout)
-                write_attr(f, group_name, ATTR_BLOCK, blocknum, timeout)
+            # Write value and blocknum to the group attributes
+            write_attr(f, group_name, ATTR_VALUE, value, timeout)
+            write_attr(f, group_name, ATTR_BLOCK, blocknum, timeout)
         finally:
             # Always release the lock after operation
             lock.release()
@@ -78,8 +232,8 @@ def write_attr(file_or_path, group_name, attr_name, value, timeout=20):
 
     # Open the file and ensure group exists, then write the attribute
     if isinstance(file_or_path, str):
-        with h5py.File(file_or_path, 'a') as f:
-            _write_attr_to_file(f, group_name, attr_name, value, timeout)
+        with get_file_lock(file_or_path):
+            _write_attr_to_file(get_file(file_or_path, 'a'), group_name, attr_name, value, timeout)
     else:
         _write_attr_to_file(file_or_path, group_name, attr_name, value, timeout)
 
@@ -94,7 +248,9 @@ def _write_attr_to_file(file, group_name, attr_name, value, timeout):
     # Write or update the attribute in the group
     if attr_name in grp.attrs:
         del grp.attrs[attr_name]
-    if value is not None:
+    if isinstance(value, bytes):
+        grp.attrs[attr_name] = np.void(value)
+    elif value is not None:
         grp.attrs[attr_name] = value
 
 
@@ -103,12 +259,12 @@ def delete(file_path, group_name, timeout=20):
     lock = get_file_lock(file_path if isinstance(file_path, str) else file_path.filename)
     if lock.acquire(timeout=timeout):
         try:
-            with h5py.File(file_path, 'a') as f:
-                try:
-                    del f[group_name].attrs[ATTR_VALUE]
-                    del f[group_name].attrs[ATTR_BLOCK]
-                except KeyError:
-                    pass
+            f = get_file(file_path, 'a') if isinstance(file_path, str) else file_path
+            try:
+                del f[group_name].attrs[ATTR_VALUE]
+                del f[group_name].attrs[ATTR_BLOCK]
+            except KeyError:
+                pass
         finally:
             lock.release()
     else:
@@ -124,6 +280,32 @@ def set_value_to_disk(file_path, group_name, value, block_num=None, timeout=20):
     set(file_path, group_name, encoded_value, block_num if block_num is not None else -1, timeout)
 
 
+def write_batch(file_path, writes, blocknum=-1, timeout=20):
+    """
+    Apply a batch of (group_name, value) writes to one file, opening it and
+    acquiring its lock once. A value of None deletes the key.
+    """
+    lock = get_file_lock(file_path)
+    if lock.acquire(timeout=timeout):
+        try:
+            f = get_file(file_path, 'a')
+            for group_name, value in writes:
+                if value is None:
+                    try:
+                        del f[group_name].attrs[ATTR_VALUE]
+                        del f[group_name].attrs[ATTR_BLOCK]
+                    except KeyError:
+                        pass
+                else:
+                    _write_attr_to_file(f, group_name, ATTR_VALUE, value, timeout)
+                    _write_attr_to_file(f, group_name, ATTR_BLOCK, blocknum, timeout)
+            f.flush()
+        finally:
+            lock.release()
+    else:
+        raise TimeoutError("Lock acquisition timed out")
+
+
 def delete_key_from_disk(file_path, group_name, timeout=20):
     delete(file_path, group_name, timeout)
 
@@ -146,7 +328,110 @@ def get_all_keys_from_file(file_path):
     def visit_func(name, node):
         keys.append(name.replace(constants.HDF5_GROUP_SEPARATOR, constants.DELIMITER))
 
-    with h5py.File(file_path, 'r') as f:
+    with get_file_lock(file_path):
+        get_file(file_path).visititems(visit_func)
+
+    return keys
+
+
+def get_keys(file_path):
+    """
+    Retrieve the paths of all groups holding a value in an HDF5 file.
+    """
+    keys = []
+
+    def visit_func(name, node):
+        if ATTR_VALUE in node.attrs:
+            keys.append(name)
+
+    with get_file_lock(file_path):
+        f = get_existing_file(file_path)
+        if f is None:
+            return []
         f.visititems(visit_func)
 
     return keys
+
+
+def _scan_groups(f):
+    """
+    The paths of the groups of an open file holding a value, and of those neither holding one nor leading to one,
+    which deletes leave behind.
+    """
+    groups = []
+    live = []
+
+    def visit_func(name, node):
+        if isinstance(node, h5py.Group):
+            groups.append(name)
+            if ATTR_VALUE in node.attrs:
+                live.append(name)
+
+    f.visititems(visit_func)
+
+    needed = {name for name in live}
+    for name in live:
+        parts = name.split(constants.HDF5_GROUP_SEPARATOR)
+        for i in range(1, len(parts)):
+            needed.add(constants.HDF5_GROUP_SEPARATOR.join(parts[:i]))
+
+    return live, [name for name in groups if name not in needed]
+
+
+def file_stats(file_path):
+    """
+    Entry and space counts of a file: groups holding a value (live), groups left behind by deletes (dead), the
+    size of the file and the space in it HDF5 has freed but not given back, or None if the file doesn't exist.
+    """
+    with get_file_lock(file_path):
+        f = get_existing_file(file_path)
+        if f is None:
+            return None
+        live, dead = _scan_groups(f)
+        free_bytes = f.id.get_freespace()
+
+    return {
+        "live": len(live),
+        "dead": len(dead),
+        "bytes": os.path.getsize(file_path),
+        "free_bytes": free_bytes
+    }
+
+
+def compact(file_path, temp_path=None, timeout=20):
+    """
+    Rewrite a file with only the groups holding a value, dropping the dead groups and free space deletes leave
+    behind. The copy is written to temp_path, on the same filesystem, and swapped in by an atomic rename, so the
+    file is whole at any point; reads and writes of it wait for the compaction. Returns the size of the file before and
+    after, or None if it doesn't exist.
+    """
+    temp_path = temp_path if temp_path is not None else file_path + ".compact"
+
+    lock = get_file_lock(file_path)
+    if lock.acquire(timeout=timeout):
+        try:
+            source = get_existing_file(file_path)
+            if source is None:
+                return None
+            before = os.path.getsize(file_path)
+
+            live, _ = _scan_groups(source)
+            with h5py.File(temp_path, "w") as target:
+                for name in live:
+                    attrs = source[name].attrs
+                    group = target.require_group(name)
+                    for attr_name in attrs:
+                        # Copied with their stored types, so values read back exactly as before
+                        group.attrs.create(attr_name, attrs[attr_name], dtype=attrs.get_id(attr_name).dtype)
+
+                target.flush()
+                os.fsync(target.id.get_vfd_handle())
+
+            close(file_path)
+            os.replace(temp_path, file_path)
+        finally:
+            lock.release()
+    else:
+        raise TimeoutError("Lock acquisition timed out")
+
+    return before, os.path.getsize(file_path)
@@ -0,0 +1,104 @@
+from collections import deque
+from contracting import constants
+
+
+class StateHistory:
+    """
+    Previous values of the keys written to disk by the last max_blocks blocks, oldest first, so the state as of
+    any of those blocks can be read, and the blocks undone, without copying the state. Each entry holds the block's
+    nanos and what every key it wrote was before it, as the Driver records it: the (value, block) the key had on
+    disk, both None if the key did not exist. Writes committed outside of a block are kept as entries with nanos
+    None, consecutive ones merged into one.
+    """
+
+    def __init__(self, max_blocks=constants.STATE_HISTORY_BLOCKS):
+        self.max_blocks = max_blocks
+        self.entries = deque()
+        self.blocks = 0
+        # Nanos of the newest block no longer kept. The entries undo everything written after it
+        self.evicted = None
+
+    def __len__(self):
+        return self.blocks
+
+    def record(self, nanos, previous):
+        if self.max_blocks <= 0:
+            return
+
+        if nanos is None and len(self.entries) > 0 and self.entries[-1][0] is None:
+            merged = self.entries[-1][1]
+            for k, v in previous.items():
+                merged.setdefault(k, v)
+            return
+
+        self.entries.append((nanos, previous))
+        if nanos is None:
+            return
+
+        self.blocks += 1
+        while self.blocks > self.max_blocks:
+            evicted, _ = self.entries.popleft()
+            if evicted is not None:
+                self.evicted = evicted
+                self.blocks -= 1
+
+    def oldest(self):
+        """
+        Nanos of the oldest block the state can still be read as of, or None if there is none.
+        """
+        if self.evicted is not None:
+            return self.evicted
+        for nanos, _ in self.entries:
+            if nanos is not None:
+                return nanos
+        return None
+
+    def __since(self, nanos, inclusive):
+        # Entries written after the block at nanos (or at it too, if inclusive), newest first
+        for entry in reversed(self.entries):
+            if entry[0] is not None and (entry[0] < nanos or (not inclusive and entry[0] == nanos)):
+                return
+            yield entry
+
+        # Past the oldest entry, which undoes everything after the newest evicted block (if any)
+        if self.evicted is None:
+            if inclusive:
+                return
+        elif self.evicted < nanos or (not inclusive and self.evicted == nanos):
+            return
+
+        raise ValueError(f'State as of {nanos} is no longer kept. The oldest block kept is {self.oldest()}.')
+
+    def lookup(self, key, nanos):
+        """
+        Returns (changed, value): whether key was written after the block at nanos, and if so the value it had as
+        of that block.
+        """
+        changed, value = False, None
+        for _, previous in self.__since(nanos, inclusive=False):
+            if key in previous:
+                changed, value = True, previous[key]
+        return changed, value
+
+    def pop_since(self, nanos):
+        """
+        Remove the blocks at and after nanos, and the commits after them, returning the values that undo their
+        writes.
+        """
+        undo = {}
+        count = 0
+        for _, previous in self.__since(nanos, inclusive=True):
+            undo.update(previous)
+            count += 1
+
+        for _ in range(count):
+            entry_nanos, _ = self.entries.pop()
+            if entry_nanos is not None:
+                self.blocks -= 1
+
+        return undo
+
+    def clear(self):
+        self.entries.clear()
+        self.blocks = 0
+        self.evicted = None
@@ -0,0 +1,109 @@
+from bisect import bisect_left, insort
+from itertools import islice
+
+import json
+import os
+
+# Above this many changes in one update the index is rebuilt instead of patched key by key
+REBUILD_THRESHOLD = 1024
+
+
+class KeyIndex:
+    """
+    Sorted list of the keys stored in one state file. Prefix scans bisect to
+    the first match and walk forward, so they cost O(log n + k).
+    """
+
+    def __init__(self, keys=()):
+        self.keys = sorted(keys)
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        i = bisect_left(self.keys, key)
+        return i < len(self.keys) and self.keys[i] == key
+
+    def add(self, key):
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            self.keys.insert(i, key)
+            self.dirty = True
+
+    def remove(self, key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+            self.dirty = True
+
+    def update(self, added=(), removed=()):
+        """
+        Apply a write set: keys in added now exist, keys in removed no longer do.
+        """
+        if len(added) + len(removed) > REBUILD_THRESHOLD:
+            keys = set(self.keys)
+            keys.difference_update(removed)
+            keys.update(added)
+            self.keys = sorted(keys)
+            self.dirty = True
+            return
+
+        for key in removed:
+            self.remove(key)
+        for key in added:
+            self.add(key)
+
+    def iter_prefix(self, prefix="", length=0):
+        """
+        Yield the keys starting with prefix in order, at most length of them if length > 0.
+        """
+        def scan():
+            i = bisect_left(self.keys, prefix)
+            while i < len(self.keys) and self.keys[i].startswith(prefix):
+                yield self.keys[i]
+                i += 1
+
+        return islice(scan(), length) if length > 0 else scan()
+
+    def iter_range(self, start, end=None, length=0):
+        """
+        Yield the keys k with start <= k < end in order, at most length of them if length > 0.
+        """
+        def scan():
+            i = bisect_left(self.keys, start)
+            while i < len(self.keys) and (end is None or self.keys[i] < end):
+                yield self.keys[i]
+                i += 1
+
+        return islice(scan(), length) if length > 0 else scan()
+
+    def save(self, path, source_path):
+        """
+        Persist the index, stamped with the state of the file it describes so stale copies are ignored on load.
+        """
+        stat = os.stat(source_path)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "keys": self.keys}, f)
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path, source_path):
+        """
+        Load a persisted index, or return None if it is missing or the file it describes changed since it was saved.
+        """
+        try:
+            stat = os.stat(source_path)
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("mtime_ns") != stat.st_mtime_ns or data.get("size") != stat.st_size:
+            return None
+
+        index = cls()
+        index.keys = data["keys"]
+        return index
@@ -0,0 +1,211 @@
+from contracting.storage.sqlite import prefix_upper_bound
+
+from hashlib import sha3_256
+from pathlib import Path
+from threading import RLock
+
+import sqlite3
+
+DB_NAME = "state_root.db"
+
+# Keys are spread over 2 ** DEPTH buckets, the leaves of a binary hash tree
+DEPTH = 16
+
+
+def sha3(data: bytes):
+    return sha3_256(data).digest()
+
+
+def bucket_of(key: str, depth=DEPTH):
+    return int.from_bytes(sha3(key.encode())[:4], 'big') >> (32 - depth)
+
+
+def value_hash(encoded: str):
+    return sha3(encoded.encode())
+
+
+def leaf_hash(key: str, hashed_value: bytes):
+    return sha3(key.encode() + b'\x00' + hashed_value)
+
+
+def bucket_hash(leaves):
+    """
+    Hash of a bucket from its (key, value hash) pairs in key order.
+    """
+    return sha3(b''.join(leaf_hash(k, v) for k, v in leaves))
+
+
+def empty_hashes(depth=DEPTH):
+    # The hash of an empty subtree of each height, from a single empty bucket up to the root
+    hashes = [bucket_hash([])]
+    for _ in range(depth):
+        hashes.append(sha3(hashes[-1] + hashes[-1]))
+    return hashes
+
+
+def verify_proof(root: str, key: str, encoded, proof: dict):
+    """
+    Check a proof from StateCommitment.prove against a state root: that key has the encoded value, or that it
+    does not exist if encoded is None.
+    """
+    depth = len(proof['siblings'])
+    bucket = bucket_of(key, depth)
+    if bucket != proof['bucket']:
+        return False
+
+    leaves = [(k, bytes.fromhex(v)) for k, v in proof['leaves']]
+    keys = [k for k, _ in leaves]
+    if keys != sorted(set(keys)):
+        return False
+
+    found = dict(leaves).get(key)
+    if encoded is None:
+        if found is not None:
+            return False
+    elif found != value_hash(encoded):
+        return False
+
+    node = bucket_hash(leaves)
+    index = bucket
+    for sibling in proof['siblings']:
+        sibling = bytes.fromhex(sibling)
+        node = sha3(sibling + node) if index & 1 else sha3(node + sibling)
+        index >>= 1
+
+    return node.hex() == root
+
+
+class StateCommitment:
+    """
+    Merkle commitment to the contract state, kept in SQLite next to the state and updated from each write set, so
+    the root never needs a scan of the state. Keys are hashed into 2 ** depth buckets; a bucket hashes the key and
+    value hash of its entries in key order, and buckets are the leaves of a binary tree whose root commits to the
+    whole state. Only nodes that differ from the hash of an empty subtree are stored.
+    """
+
+    def __init__(self, db_path, depth=DEPTH):
+        self.db_path = Path(db_path)
+        self.depth = depth
+        self.empty = empty_hashes(depth)
+        self.lock = RLock()
+        self.conn = None
+        self.__connect()
+
+    def __reduce__(self):
+        return StateCommitment, (self.db_path, self.depth)
+
+    def __connect(self):
+        self.db_path.parent.mkdir(exist_ok=True, parents=True)
+        self.conn = sqlite3.connect(str(self.db_path), isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS leaves (key TEXT PRIMARY KEY, bucket INTEGER NOT NULL, hash BLOB NOT NULL) "
+            "WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS leaves_bucket ON leaves (bucket, key)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS nodes (height INTEGER, idx INTEGER, hash BLOB NOT NULL, "
+            "PRIMARY KEY (height, idx)) WITHOUT ROWID"
+        )
+
+    def update(self, writes):
+        """
+        Apply a write set of key -> encoded value, None deleting the key.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                buckets = set()
+                for key, encoded in writes.items():
+                    bucket = bucket_of(key, self.depth)
+                    buckets.add(bucket)
+                    if encoded is None:
+                        self.conn.execute("DELETE FROM leaves WHERE key = ?", (key,))
+                    else:
+                        self.conn.execute("INSERT OR REPLACE INTO leaves VALUES (?, ?, ?)",
+                                          (key, bucket, value_hash(encoded)))
+                self.__rehash(buckets)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def delete_prefix(self, prefix):
+        """
+        Remove every key starting with prefix, as when a whole state file is deleted.
+        """
+        upper = prefix_upper_bound(prefix)
+        with self.lock:
+            if upper is None:
+                rows = self.conn.execute("SELECT key FROM leaves WHERE key >= ?", (prefix,)).fetchall()
+            else:
+                rows = self.conn.execute("SELECT key FROM leaves WHERE key >= ? AND key < ?",
+                                         (prefix, upper)).fetchall()
+            self.update({key: None for key, in rows})
+
+    def __leaves(self, bucket):
+        return self.conn.execute("SELECT key, hash FROM leaves WHERE bucket = ? ORDER BY key",
+                                 (bucket,)).fetchall()
+
+    def __node(self, height, index):
+        row = self.conn.execute("SELECT hash FROM nodes WHERE height = ? AND idx = ?", (height, index)).fetchone()
+        return row[0] if row is not None else self.empty[height]
+
+    def __store(self, height, index, node):
+        if node == self.empty[height]:
+            self.conn.execute("DELETE FROM nodes WHERE height = ? AND idx = ?", (height, index))
+        else:
+            self.conn.execute("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)", (height, index, node))
+
+    def __rehash(self, buckets):
+        level = {}
+        for bucket in buckets:
+            level[bucket] = bucket_hash(self.__leaves(bucket))
+            self.__store(0, bucket, level[bucket])
+
+        # Each touched path is rehashed once per height, however many keys share it
+        for height in range(1, self.depth + 1):
+            parents = {}
+            for index in {i >> 1 for i in level}:
+                left = level.get(index * 2)
+                if left is None:
+                    left = self.__node(height - 1, index * 2)
+                right = level.get(index * 2 + 1)
+                if right is None:
+                    right = self.__node(height - 1, index * 2 + 1)
+
+                parents[index] = sha3(left + right)
+                self.__store(height, index, parents[index])
+            level = parents
+
+    def root(self):
+        with self.lock:
+            return self.__node(self.depth, 0).hex()
+
+    def prove(self, key):
+        """
+        Proof that key has its current value, or does not exist: the entries of its bucket and the sibling of
+        every node on the path from the bucket to the root.
+        """
+        bucket = bucket_of(key, self.depth)
+        with self.lock:
+            leaves = [(k, v.hex()) for k, v in self.__leaves(bucket)]
+            siblings = []
+            index = bucket
+            for height in range(self.depth):
+                siblings.append(self.__node(height, index ^ 1).hex())
+                index >>= 1
+
+        return {'bucket': bucket, 'leaves': leaves, 'siblings': siblings}
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM leaves")
+            self.conn.execute("DELETE FROM nodes")
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
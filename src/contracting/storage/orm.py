@@ -3,10 +3,51 @@ from contracting.execution.runtime import rt
 from contracting import constants
 from contracting.stdlib.bridge.decimal import ContractingDecimal
 from contracting.storage.encoder import encode_kv
+from functools import lru_cache
 
 driver = rt.env.get("__Driver") or Driver()
 
 
+def build_key(key):
+    """
+    Validate a Hash key, a single value or a tuple of up to MAX_HASH_DIMENSIONS of them, and join it into the
+    string it is stored under.
+    """
+    if isinstance(key, tuple):
+        assert len(key) <= constants.MAX_HASH_DIMENSIONS, (
+            f"Too many dimensions ({len(key)}) for hash. "
+            f"Max is {constants.MAX_HASH_DIMENSIONS}"
+        )
+
+        new_key_str = ""
+        for k in key:
+            assert not isinstance(k, slice), "Slices prohibited in hashes."
+
+            k = str(k)
+
+            assert constants.DELIMITER not in k, "Illegal delimiter in key."
+            assert constants.INDEX_SEPARATOR not in k, "Illegal separator in key."
+
+            new_key_str += f"{k}{constants.DELIMITER}"
+
+        key = new_key_str[: -len(constants.DELIMITER)]
+    else:
+        key = str(key)
+
+        assert constants.DELIMITER not in key, "Illegal delimiter in key."
+        assert constants.INDEX_SEPARATOR not in key, "Illegal separator in key."
+
+    assert (
+        len(key) <= constants.MAX_KEY_SIZE
+    ), f"Key is too long ({len(key)}). Max is {constants.MAX_KEY_SIZE}."
+    return key
+
+
+# The same keys (e.g. addresses) are looked up over and over, so built keys are cached. Invalid keys raise and are
+# never cached.
+build_cached_key = lru_cache(maxsize=constants.KEY_CACHE_SIZE)(build_key)
+
+
 class Datum:
     def __init__(self, contract, name, driver: Driver):
         self._driver = driver
@@ -40,11 +81,21 @@ class Hash(Datum):
         self._delimiter = constants.DELIMITER
         self._default_value = default_value
 
+    @property
+    def _key(self):
+        return self.__key
+
+    @_key.setter
+    def _key(self, key):
+        # Keys of the hash are built on the prefix, so it is made once
+        self.__key = key
+        self._prefix = f"{key}{constants.DELIMITER}"
+
     def _set(self, key, value):
-        self._driver.set(f"{self._key}{self._delimiter}{key}", value, True)
+        self._driver.set(self._prefix + key, value, True)
 
     def _get(self, item):
-        value = self._driver.get(f"{self._key}{self._delimiter}{item}")
+        value = self._driver.get(self._prefix + item)
 
         # Add Python defaultdict behavior for easier smart contracting
         if value is None:
@@ -56,38 +107,16 @@ class Hash(Datum):
         return value
 
     def _validate_key(self, key):
-        if isinstance(key, tuple):
-            assert len(key) <= constants.MAX_HASH_DIMENSIONS, (
-                f"Too many dimensions ({len(key)}) for hash. "
-                f"Max is {constants.MAX_HASH_DIMENSIONS}"
-            )
-
-            new_key_str = ""
-            for k in key:
-                assert not isinstance(k, slice), "Slices prohibited in hashes."
-
-                k = str(k)
-
-                assert constants.DELIMITER not in k, "Illegal delimiter in key."
-                assert constants.INDEX_SEPARATOR not in k, "Illegal separator in key."
-
-                new_key_str += f"{k}{self._delimiter}"
-
-            key = new_key_str[: -len(self._delimiter)]
-        else:
-            key = str(key)
-
-            assert constants.DELIMITER not in key, "Illegal delimiter in key."
-            assert constants.INDEX_SEPARATOR not in key, "Illegal separator in key."
-
-        assert (
-            len(key) <= constants.MAX_KEY_SIZE
-        ), f"Key is too long ({len(key)}). Max is {constants.MAX_KEY_SIZE}."
-        return key
+        t = type(key)
+        if t is str or (t is tuple and all(type(k) is str for k in key)):
+            # Only keys of strings are cached: keys of other types can be equal while their strings differ, e.g.
+            # 1 and True
+            return build_cached_key(key)
+        return build_key(key)
 
     def _prefix_for_args(self, args):
         multi = self._validate_key(args)
-        prefix = f"{self._key}{self._delimiter}"
+        prefix = self._prefix
         if multi != "":
             prefix += f"{multi}{self._delimiter}"
 
@@ -0,0 +1,102 @@
+from contracting.storage.backend import BackendWrapper
+from contracting import constants
+
+import atexit
+import queue
+import threading
+
+
+class PipelinedBackend(BackendWrapper):
+    """
+    Backend that writes write sets to the backend it wraps on a worker thread, so that the next block can execute
+    while the last one is still being written. Each write set is copied when it is handed over, and its keys are
+    read from overlay until the worker has written them.
+
+    Writes are applied in the order they were made. Callers that need them on disk, e.g. before answering a commit,
+    wait for them with barrier. If the worker fails to write a write set, it stops writing, and every barrier and
+    write_batch after raises the error until clear, as overlay then holds writes the backend doesn't have. The
+    worker doesn't keep the process alive: close waits for it, and is called at exit if it wasn't before.
+    """
+
+    def __init__(self, backend, queue_size=constants.BACKGROUND_COMMIT_QUEUE):
+        super().__init__(backend)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        # Key -> number of the last write set that wrote it, so it leaves overlay when that one is written
+        self.written_by = {}
+        self.sequence = 0
+        self.error = None
+        self.worker = None
+
+    def __start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.__work, name='background-commit', daemon=True)
+            self.worker.start()
+            atexit.register(self.close)
+
+    def __work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+
+                sequence, writes, block_num = item
+                if self.error is None:
+                    self.backend.write_batch(writes, block_num)
+                    self.backend.flush()
+
+                    with self.lock:
+                        for key in writes:
+                            if self.written_by.get(key) == sequence:
+                                del self.written_by[key]
+                                del self.overlay[key]
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def __raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def write_batch(self, writes, block_num=None):
+        self.__raise_error()
+        self.__start()
+
+        writes = dict(writes)
+        with self.lock:
+            self.sequence += 1
+            self.hold(writes, block_num)
+            for key in writes:
+                self.written_by[key] = self.sequence
+
+        # Blocks while the queue is full, so the worker is never more than queue_size write sets behind
+        self.queue.put((self.sequence, writes, block_num))
+
+    def settle(self):
+        self.queue.join()
+        self.__raise_error()
+
+    def flush(self):
+        # The worker flushes each write set it writes; waiting for it is what barrier is for
+        pass
+
+    def close(self):
+        try:
+            self.settle()
+        finally:
+            if self.worker is not None:
+                self.queue.put(None)
+                self.worker.join()
+                self.worker = None
+                atexit.unregister(self.close)
+            self.backend.close()
+
+    def clear(self):
+        self.queue.join()
+        self.error = None
+        with self.lock:
+            self.overlay = {}
+            self.written_by = {}
+        self.backend.clear()
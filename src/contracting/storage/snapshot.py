@@ -0,0 +1,186 @@
+from contracting.storage.encoder import decode, is_binary
+from contracting.storage.export import write_varint, encode_record, BLOCK
+from contracting.storage.wal import read_varint
+from contracting import constants
+
+from bisect import bisect_right
+
+import mmap
+import struct
+
+# Read-only state snapshot format, made to be memory mapped:
+#
+#   MAGIC, VERSION
+#   records: as in state exports, sorted by key: varint key length, key, varint value length, value, block as
+#            signed 64 bit big endian int
+#   index:   every index_interval-th record, starting with the first: varint key length, key, offset of the record
+#            as unsigned 64 bit big endian int
+#   footer:  offset of the index, number of index entries and of records as unsigned 64 bit ints, the block the
+#            snapshot was taken at as signed 64 bit int, all big endian, then MAGIC
+#
+# A lookup bisects the index, which is the only part of the file read into memory, and scans at most
+# index_interval records of the mapped file from there.
+
+MAGIC = b'XSNAP'
+VERSION = 1
+HEADER_SIZE = len(MAGIC) + 1
+
+FOOTER = struct.Struct('>QQQq')
+OFFSET = struct.Struct('>Q')
+
+
+def write_snapshot(f, records, block=None, index_interval=constants.SNAPSHOT_INDEX_INTERVAL):
+    """
+    Write an iterable of (key, encoded value, block) records, sorted by key, to a binary file object as a
+    snapshot taken at block. Returns the number of records written.
+    """
+    f.write(MAGIC + bytes([VERSION]))
+    offset = HEADER_SIZE
+
+    index = bytearray()
+    index_count = 0
+    count = 0
+    last_key = None
+    for key, value, record_block in records:
+        if last_key is not None and key <= last_key:
+            raise ValueError('Snapshot records must be sorted by key.')
+        last_key = key
+
+        if count % index_interval == 0:
+            encoded_key = key.encode()
+            write_varint(index, len(encoded_key))
+            index += encoded_key + OFFSET.pack(offset)
+            index_count += 1
+
+        record = encode_record(key, value, record_block)
+        f.write(record)
+        offset += len(record)
+        count += 1
+
+    f.write(bytes(index))
+    f.write(FOOTER.pack(offset, index_count, count, block if block is not None else -1) + MAGIC)
+
+    return count
+
+
+class SnapshotDriver:
+    """
+    Read-only view of the state in a snapshot file, for processes that only query state. The file is memory
+    mapped, so processes reading the same snapshot share its pages and only the sparse index is held in memory;
+    the state being written by the executor is never opened.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Keys are compared and values sliced through a view, so reading a record copies nothing out of the map
+        self.view = memoryview(self.map)
+
+        trailer = len(self.map) - FOOTER.size - len(MAGIC)
+        if self.view[:len(MAGIC)] != MAGIC or trailer < 0 or self.view[trailer + FOOTER.size:] != MAGIC:
+            self.close()
+            raise ValueError('Not a state snapshot.')
+        version = self.view[len(MAGIC)]
+        if version != VERSION:
+            self.close()
+            raise ValueError(f'Unsupported state snapshot version {version}.')
+
+        self.records_end, index_count, self.count, self.block = FOOTER.unpack_from(self.map, trailer)
+
+        # Key of every index_interval-th record, and where the record starts
+        self.index_keys = []
+        self.index_offsets = []
+        pos = self.records_end
+        for _ in range(index_count):
+            length, pos = read_varint(self.view, pos)
+            self.index_keys.append(self.map[pos:pos + length])
+            pos += length
+            self.index_offsets.append(OFFSET.unpack_from(self.map, pos)[0])
+            pos += OFFSET.size
+
+    def __len__(self):
+        return self.count
+
+    def __records(self, start, stop):
+        # Yield (key view, value start, value end) of the records from start to stop, reading only their keys
+        pos = start
+        while pos < stop:
+            length, pos = read_varint(self.view, pos)
+            key = self.view[pos:pos + length]
+            length, pos = read_varint(self.view, pos + length)
+            end = pos + length
+            yield key, pos, end
+            pos = end + BLOCK.size
+
+    def __segment(self, key):
+        # The records between the last indexed record not after key, or the first, and the next indexed record.
+        # The next indexed key is after key, so if key is in the snapshot it's in there.
+        i = bisect_right(self.index_keys, key)
+        start = self.index_offsets[i - 1] if i > 0 else HEADER_SIZE
+        stop = self.index_offsets[i] if i < len(self.index_offsets) else self.records_end
+        return start, stop
+
+    def __value(self, start, end):
+        value = bytes(self.view[start:end])
+        return decode(value if is_binary(value) else value.decode())
+
+    def __find(self, key):
+        key = key.encode()
+        for record_key, start, end in self.__records(*self.__segment(key)):
+            if record_key == key:
+                return start, end
+        return None
+
+    def get(self, key):
+        """
+        Get the value of a key, or None if it has none.
+        """
+        found = self.__find(key)
+        return self.__value(*found) if found is not None else None
+
+    def get_block(self, key):
+        found = self.__find(key)
+        return BLOCK.unpack_from(self.view, found[1])[0] if found is not None else None
+
+    def __scan(self, prefix):
+        # Keys with prefix are contiguous and, as the next indexed key is after prefix, start in prefix's segment
+        # or right at its end, so the scan stops at the first key without it once past either
+        prefix = prefix.encode()
+        start, stop = self.__segment(prefix)
+        found = False
+        for key, value_start, value_end in self.__records(start, stop):
+            if key[:len(prefix)] == prefix:
+                found = True
+                yield str(key, 'utf-8'), value_start, value_end
+            elif found:
+                return
+        for key, value_start, value_end in self.__records(stop, self.records_end):
+            if key[:len(prefix)] != prefix:
+                return
+            yield str(key, 'utf-8'), value_start, value_end
+
+    def keys(self, prefix=""):
+        """
+        Get the sorted keys starting with prefix.
+        """
+        return [key for key, _, _ in self.__scan(prefix)]
+
+    def items(self, prefix=""):
+        """
+        Get all items with keys starting with prefix.
+        """
+        return {key: self.__value(start, end) for key, start, end in self.__scan(prefix)}
+
+    def values(self, prefix=""):
+        return list(self.items(prefix).values())
+
+    def get_var(self, contract, variable, arguments=[]):
+        key = f"{contract}{constants.INDEX_SEPARATOR}{variable}"
+        if arguments:
+            key = constants.DELIMITER.join((key, *[str(arg) for arg in arguments]))
+        return self.get(key)
+
+    def close(self):
+        self.view.release()
+        self.map.close()
@@ -0,0 +1,215 @@
+from contracting import constants
+from contracting.storage.backend import StorageBackend, filename_for_key
+
+from pathlib import Path
+from threading import RLock
+
+import os
+import sqlite3
+
+DB_NAME = "state.db"
+
+
+def prefix_upper_bound(prefix):
+    """
+    The smallest string greater than every string starting with prefix, or None if there is none.
+    """
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores all state in a single SQLite table in WAL mode, ordered by key so
+    prefix scans are range queries on the primary key. Suited to stores with
+    far more keys than is practical as HDF5 groups.
+
+    Pages freed by deletes are kept for reuse rather than given back, until
+    compact returns them to the filesystem.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.lock = RLock()
+        self.conn = None
+        self.__connect()
+
+    def __reduce__(self):
+        return SQLiteBackend, (self.db_path,)
+
+    def __connect(self):
+        self.db_path.parent.mkdir(exist_ok=True, parents=True)
+        self.conn = sqlite3.connect(str(self.db_path), isolation_level=None, check_same_thread=False)
+        # Only takes effect on new databases; compact switches existing ones over
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value NOT NULL, block INTEGER NOT NULL) "
+            "WITHOUT ROWID"
+        )
+
+    def __range(self, prefix):
+        upper = prefix_upper_bound(prefix)
+        if upper is None:
+            return "key >= ?", (prefix,)
+        return "key >= ? AND key < ?", (prefix, upper)
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def get_block(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT block FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def write_batch(self, writes, block_num=None):
+        blocknum = block_num if block_num is not None else constants.BLOCK_NUM_DEFAULT
+        sets = [(k, v, blocknum) for k, v in writes.items() if v is not None]
+        deletes = [(k,) for k, v in writes.items() if v is None]
+
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO state (key, value, block) VALUES (?, ?, ?)", sets)
+                self.conn.executemany("DELETE FROM state WHERE key = ?", deletes)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def iter_keys(self, prefix="", length=0):
+        for key, _ in self.iter_items(prefix, length):
+            yield key
+
+    def iter_items(self, prefix="", length=0):
+        condition, params = self.__range(prefix)
+        query = f"SELECT key, value FROM state WHERE {condition} ORDER BY key"
+        if length > 0:
+            query += f" LIMIT {int(length)}"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        yield from rows
+
+    def iter_records(self, prefix="", start_after=None, page_size=1000):
+        # Read in pages from the last key seen, so neither memory nor the lock is held for the whole scan
+        condition, params = self.__range(prefix)
+        cursor = start_after
+        while True:
+            query = f"SELECT key, value, block FROM state WHERE {condition}"
+            page_params = params
+            if cursor is not None:
+                query += " AND key > ?"
+                page_params = (*params, cursor)
+            query += f" ORDER BY key LIMIT {int(page_size)}"
+
+            with self.lock:
+                rows = self.conn.execute(query, page_params).fetchall()
+            yield from rows
+
+            if len(rows) < page_size:
+                return
+            cursor = rows[-1][0]
+
+    def filenames(self):
+        # Skip from one file to the next instead of reading every key
+        filenames = set()
+        cursor = ""
+        with self.lock:
+            while cursor is not None:
+                row = self.conn.execute(
+                    "SELECT key FROM state WHERE key >= ? ORDER BY key LIMIT 1", (cursor,)
+                ).fetchone()
+                if row is None:
+                    break
+                filename = filename_for_key(row[0])
+                filenames.add(filename)
+                if row[0].startswith(filename + constants.INDEX_SEPARATOR):
+                    cursor = prefix_upper_bound(filename + constants.INDEX_SEPARATOR)
+                else:
+                    cursor = row[0] + "\x00"
+        return sorted(filenames)
+
+    def has_file(self, filename):
+        condition, params = self.__range(filename + constants.INDEX_SEPARATOR)
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT 1 FROM state WHERE key = ? OR ({condition}) LIMIT 1", (filename, *params)
+            ).fetchone()
+        return row is not None
+
+    def delete_file(self, filename):
+        condition, params = self.__range(filename + constants.INDEX_SEPARATOR)
+        with self.lock:
+            self.conn.execute(f"DELETE FROM state WHERE key = ? OR ({condition})", (filename, *params))
+
+    def snapshot(self, path):
+        target = sqlite3.connect(str(Path(path).joinpath(DB_NAME)))
+        try:
+            with self.lock:
+                self.conn.backup(target)
+        finally:
+            target.close()
+
+    def __pragma(self, name):
+        return self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+    def compact(self, filename):
+        # All files share the database and its free pages, so compacting any of them gives back the space of all
+        with self.lock:
+            if not self.has_file(filename) or self.__pragma("freelist_count") == 0:
+                return None
+
+            # Checkpointed first, so the sizes are of everything committed
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            before = os.path.getsize(self.db_path)
+            if self.__pragma("auto_vacuum") == 2:
+                # Stepped to the end by executescript; execute would free a single page
+                self.conn.executescript("PRAGMA incremental_vacuum;")
+            else:
+                # Databases created before incremental vacuuming was enabled are rewritten, which enables it
+                self.conn.execute("VACUUM")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return before, os.path.getsize(self.db_path)
+
+    def file_stats(self, filename):
+        stats = super().file_stats(filename)
+        if stats is None:
+            return None
+
+        # Sizes are of the whole database
+        with self.lock:
+            free_bytes = self.__pragma("freelist_count") * self.__pragma("page_size")
+        return {**stats, "bytes": os.path.getsize(self.db_path), "free_bytes": free_bytes}
+
+    def flush(self):
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def sync(self):
+        # With synchronous=NORMAL, commits are only synced when checkpointed. Syncing the WAL file, where they are
+        # until then, makes them as durable as with synchronous=FULL.
+        with self.lock:
+            try:
+                fd = os.open(f"{self.db_path}-wal", os.O_RDONLY)
+            except FileNotFoundError:
+                return
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM state")
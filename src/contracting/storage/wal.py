@@ -0,0 +1,234 @@
+from contracting.storage.backend import BackendWrapper
+from contracting.storage.export import write_varint
+from collections import defaultdict
+
+import os
+import struct
+import zlib
+
+FILE_NAME = "state.wal"
+
+# Write-ahead log format, one record per write set:
+#
+#   header:  payload length and crc32 of block and payload as unsigned 32 bit ints, block as signed 64 bit int,
+#            all big endian
+#   payload: per write, varint key length, key, a value type byte, and for values varint length and value
+#
+# A record that is cut short or doesn't match its checksum ends the log, as when the process died appending it.
+
+HEADER = struct.Struct('>IIq')
+
+VALUE_DELETED = 0
+VALUE_TEXT = 1
+VALUE_BYTES = 2
+
+
+def encode_writes(writes):
+    payload = bytearray()
+    for key, value in writes.items():
+        key = key.encode()
+        write_varint(payload, len(key))
+        payload += key
+
+        if value is None:
+            payload.append(VALUE_DELETED)
+            continue
+
+        if isinstance(value, bytes):
+            payload.append(VALUE_BYTES)
+        else:
+            payload.append(VALUE_TEXT)
+            value = value.encode()
+        write_varint(payload, len(value))
+        payload += value
+
+    return bytes(payload)
+
+
+def read_varint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def decode_writes(payload):
+    writes = {}
+    pos = 0
+    while pos < len(payload):
+        length, pos = read_varint(payload, pos)
+        key = payload[pos:pos + length].decode()
+        pos += length
+
+        kind = payload[pos]
+        pos += 1
+        if kind == VALUE_DELETED:
+            writes[key] = None
+            continue
+
+        length, pos = read_varint(payload, pos)
+        value = payload[pos:pos + length]
+        pos += length
+        writes[key] = value.decode() if kind == VALUE_TEXT else value
+
+    return writes
+
+
+class WriteAheadLog:
+    """
+    Append-only log of encoded write sets. Appends are flushed to the OS as they are made, so they survive the
+    process dying, and fsynced once every sync_every appends, so that many write sets share the cost of an fsync
+    at the risk of losing the last sync_every - 1 of them to a power failure.
+    """
+
+    def __init__(self, path, sync_every=1):
+        self.path = str(path)
+        self.sync_every = sync_every
+        self.unsynced = 0
+        self.file = None
+
+    def __open(self):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.file = open(self.path, 'ab')
+        return self.file
+
+    def append(self, writes, block_num=None):
+        payload = encode_writes(writes)
+        block = block_num if block_num is not None else -1
+        checksum = zlib.crc32(payload, zlib.crc32(struct.pack('>q', block)))
+
+        f = self.__open()
+        f.write(HEADER.pack(len(payload), checksum, block) + payload)
+        f.flush()
+
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        if self.file is not None and self.unsynced > 0:
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def records(self):
+        """
+        Yield the (block, writes) records of the log in the order they were appended, up to the first incomplete
+        or corrupted one.
+        """
+        if not os.path.isfile(self.path):
+            return
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        pos = 0
+        while pos + HEADER.size <= len(data):
+            length, checksum, block = HEADER.unpack_from(data, pos)
+            start = pos + HEADER.size
+            payload = data[start:start + length]
+            if len(payload) != length or zlib.crc32(payload, zlib.crc32(struct.pack('>q', block))) != checksum:
+                return
+
+            yield block, decode_writes(payload)
+            pos = start + length
+
+    def truncate(self):
+        """
+        Empty the log, once the write sets in it are applied elsewhere and synced to stable storage there: a
+        truncation that reaches the disk before the writes it covers would lose them. Not fsynced itself: if the
+        truncation is lost, replaying write sets that were already applied just applies them again.
+        """
+        f = self.__open()
+        f.truncate(0)
+        self.unsynced = 0
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+
+class LoggedBackend(BackendWrapper):
+    """
+    Backend that appends every write set to a write-ahead log before it is applied to the backend it wraps, so a
+    write set is either applied whole or, if the process dies part way, applied from the log by replay the next
+    time the state is opened.
+
+    Write sets are held in memory and applied together once apply_every of them are logged, so the expensive
+    random writes to the backend are batched and keys written again are only written once.
+    """
+
+    def __init__(self, backend, path, sync_every=1, apply_every=1):
+        super().__init__(backend)
+        self.log = WriteAheadLog(path, sync_every)
+        self.apply_every = apply_every
+        self.unapplied = []
+
+    def replay(self):
+        """
+        Apply the write sets left in the log by a process that didn't get to apply them, and return them as
+        (block, writes) pairs in order.
+        """
+        records = list(self.log.records())
+        for block, writes in records:
+            self.backend.write_batch(writes, block)
+        self.backend.sync()
+        self.log.truncate()
+        return records
+
+    def apply(self):
+        """
+        Apply the write sets held in memory to the backend and empty the log.
+        """
+        if len(self.unapplied) == 0:
+            return
+
+        # Keys written by several of the write sets are only written once, with the block of the last one
+        latest = {}
+        for block, writes in self.unapplied:
+            for key, value in writes.items():
+                latest[key] = (value, block)
+
+        batches = defaultdict(dict)
+        for key, (value, block) in latest.items():
+            batches[block][key] = value
+        for block, writes in batches.items():
+            self.backend.write_batch(writes, block)
+        # Synced before the log is emptied, so a power failure can't keep the truncation and lose the writes
+        self.backend.sync()
+        self.log.truncate()
+
+        self.unapplied = []
+        self.overlay = {}
+
+    def settle(self):
+        self.apply()
+
+    def write_batch(self, writes, block_num=None):
+        self.log.append(writes, block_num)
+        self.unapplied.append((block_num, writes))
+        self.hold(writes, block_num)
+
+        if len(self.unapplied) >= self.apply_every:
+            self.apply()
+
+    def barrier(self):
+        # Logged write sets are persisted once the log is synced, whether or not they are applied yet
+        self.log.sync()
+
+    def close(self):
+        super().close()
+        self.log.close()
+
+    def clear(self):
+        self.unapplied = []
+        self.overlay = {}
+        self.log.truncate()
+        self.backend.clear()
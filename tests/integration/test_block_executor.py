@@ -0,0 +1,147 @@
+from unittest import TestCase
+from contracting.storage.driver import Driver
+from contracting.execution.executor import Executor
+from contracting.execution.parallel import BlockExecutor, RecordingDriver, changed_keys
+from contracting.stdlib.bridge.time import Datetime
+import os
+
+
+def submission_kwargs_for_file(f):
+    # Get the file name only by splitting off directories
+    split = f.split('/')
+    split = split[-1]
+
+    # Now split off the .s
+    split = split.split('.')
+    contract_name = split[0]
+
+    with open(f) as file:
+        contract_code = file.read()
+
+    return {
+        'name': f'con_{contract_name}',
+        'code': contract_code,
+    }
+
+
+def transfer(sender, amount, to):
+    return {
+        'sender': sender,
+        'contract_name': 'con_currency',
+        'function_name': 'transfer',
+        'kwargs': {'amount': amount, 'to': to},
+        'stamps': 1000
+    }
+
+
+class TestBlockExecutor(TestCase):
+    maxDiff = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.d = Driver()
+        cls.e = Executor(driver=cls.d, currency_contract='con_currency')
+        cls.block_executor = BlockExecutor(cls.e, processes=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.block_executor.close()
+        cls.d.flush_full()
+
+    def setUp(self):
+        self.d.flush_full()
+
+        with open(os.path.join(os.path.dirname(__file__), "test_contracts", "submission.s.py")) as f:
+            self.d.set_contract(name='submission', code=f.read())
+        self.d.commit()
+
+        with open(os.path.join(os.path.dirname(__file__), "test_contracts", "currency.s.py")) as f:
+            self.e.execute(sender='stu', contract_name='submission', function_name='submit_contract',
+                           kwargs={'name': 'con_currency', 'code': f.read()}, metering=False, auto_commit=True)
+
+    def assert_same_as_sequential(self, transactions, reexecutions):
+        sequential = [self.e.execute(**t) for t in transactions]
+        pending_writes = dict(self.d.pending_writes)
+        pending_reads = dict(self.d.pending_reads)
+
+        self.d.flush_cache()
+        before = self.block_executor.reexecutions
+        parallel = self.block_executor.execute(transactions)
+        self.assertEqual(self.block_executor.reexecutions - before, reexecutions)
+
+        self.assertEqual(len(parallel), len(sequential))
+        self.assertIn(0, [s['status_code'] for s in sequential])
+        for p, s in zip(parallel, sequential):
+            self.assertEqual(p['status_code'], s['status_code'])
+            self.assertEqual(str(p['result']), str(s['result']))
+            self.assertEqual(p['stamps_used'], s['stamps_used'])
+            self.assertEqual(p['writes'], s['writes'])
+            self.assertEqual(p['events'], s['events'])
+            self.assertIs(p['reads'], self.d.pending_reads)
+
+        self.assertEqual(self.d.pending_writes, pending_writes)
+        self.assertEqual(self.d.pending_reads, pending_reads)
+
+    def test_independent_transactions(self):
+        self.assert_same_as_sequential([
+            transfer('stu', 10, 'a'),
+            transfer('colin', 5, 'b'),
+        ], reexecutions=0)
+
+    def test_conflicting_transactions(self):
+        self.assert_same_as_sequential([
+            transfer('stu', 10, 'a'),
+            transfer('stu', 20, 'b'),
+            transfer('a', 5, 'c'),
+            transfer('colin', 500, 'd'),
+            transfer('colin', 5, 'stu'),
+            transfer('b', 1, 'a'),
+        ], reexecutions=4)
+
+    def test_deploy_and_call_in_one_block(self):
+        path = os.path.join(os.path.dirname(__file__), "test_contracts", "erc20_clone.s.py")
+        self.assert_same_as_sequential([
+            {
+                'sender': 'stu',
+                'contract_name': 'submission',
+                'function_name': 'submit_contract',
+                'kwargs': submission_kwargs_for_file(path),
+                'environment': {'now': Datetime(2024, 1, 1)},
+                'stamps': 1000
+            },
+            {
+                'sender': 'stu',
+                'contract_name': 'con_erc20_clone',
+                'function_name': 'transfer',
+                'kwargs': {'amount': 10, 'to': 'a'},
+                'stamps': 1000
+            },
+            transfer('colin', 5, 'b'),
+        ], reexecutions=1)
+
+    def test_state_committed_between_blocks_is_seen(self):
+        self.assertEqual(self.block_executor.execute([transfer('stu', 1000, 'a')])[0]['status_code'], 0)
+        self.d.commit()
+
+        output = self.block_executor.execute([transfer('a', 10, 'b')])[0]
+        self.assertEqual(output['status_code'], 0)
+        self.assertEqual(self.d.get('con_currency.balances:b'), 10)
+
+    def test_auto_commit_is_rejected(self):
+        with self.assertRaises(AssertionError):
+            self.block_executor.execute([dict(transfer('stu', 10, 'a'), auto_commit=True)])
+
+    def test_changed_keys(self):
+        a = {'x': 1}
+        self.assertEqual(changed_keys({'x': 1, 'y': a}, {'x': 1, 'y': {'x': 1}, 'z': None}), {'z'})
+        self.assertEqual(changed_keys({'x': 1}, {'x': 2}), {'x'})
+
+    def test_recording_driver_reads_as_of_a_block(self):
+        driver = RecordingDriver(history=2)
+        driver.set('con_a.x', 1)
+        driver.hard_apply(1)
+        driver.set('con_a.x', 2)
+        driver.hard_apply(2)
+
+        self.assertEqual(driver.get('con_a.x', at=1), 1)
+        self.assertIn('con_a.x', driver.read_keys)
@@ -0,0 +1,123 @@
+from unittest import TestCase
+from contracting.storage.driver import Driver
+from contracting.execution.executor import Executor
+from contracting.execution import runtime
+import os
+
+
+def submission_kwargs_for_file(f):
+    # Get the file name only by splitting off directories
+    split = f.split('/')
+    split = split[-1]
+
+    # Now split off the .s
+    split = split.split('.')
+    contract_name = split[0]
+
+    with open(f) as file:
+        contract_code = file.read()
+
+    return {
+        'name': f'con_{contract_name}',
+        'code': contract_code,
+    }
+
+
+def transfer(sender, amount, to):
+    return {
+        'sender': sender,
+        'contract_name': 'con_currency',
+        'function_name': 'transfer',
+        'kwargs': {'amount': amount, 'to': to},
+        'stamps': 1000
+    }
+
+
+class TestExecuteBatch(TestCase):
+    maxDiff = None
+
+    def setUp(self):
+        self.d = Driver()
+        self.d.flush_full()
+
+        with open(os.path.join(os.path.dirname(__file__), "test_contracts", "submission.s.py")) as f:
+            self.d.set_contract(name='submission', code=f.read())
+        self.d.commit()
+
+        self.e = Executor(driver=self.d, currency_contract='con_currency')
+
+        for name in ('currency', 'i_use_env'):
+            path = os.path.join(os.path.dirname(__file__), "test_contracts", f"{name}.s.py")
+            self.e.execute(sender='stu', contract_name='submission', function_name='submit_contract',
+                           kwargs=submission_kwargs_for_file(path), metering=False, auto_commit=True)
+
+    def tearDown(self):
+        self.d.flush_full()
+
+    def test_same_as_sequential(self):
+        transactions = [
+            transfer('stu', 100, 'a'),
+            transfer('stu', 20, 'b'),
+            transfer('a', 5, 'c'),
+            transfer('a', 500, 'c'),
+            transfer('nobody', 1, 'c'),
+            transfer('colin', 5, 'stu'),
+        ]
+
+        sequential = [self.e.execute(**t) for t in transactions]
+        pending_writes = dict(self.d.pending_writes)
+        pending_reads = dict(self.d.pending_reads)
+
+        self.d.flush_cache()
+        batch = self.e.execute_batch(transactions)
+
+        self.assertEqual([o['status_code'] for o in sequential], [0, 0, 0, 1, 1, 0])
+        self.assertEqual(len(batch), len(sequential))
+        for b, s in zip(batch, sequential):
+            self.assertEqual(b['status_code'], s['status_code'])
+            self.assertEqual(str(b['result']), str(s['result']))
+            self.assertEqual(b['stamps_used'], s['stamps_used'])
+            self.assertEqual(b['writes'], s['writes'])
+            self.assertEqual(b['events'], s['events'])
+
+        self.assertEqual(self.d.pending_writes, pending_writes)
+        self.assertEqual(self.d.pending_reads, pending_reads)
+
+    def test_failed_transaction_is_reverted_alone(self):
+        outputs = self.e.execute_batch([
+            transfer('stu', 100, 'a'),
+            transfer('a', 500, 'b'),
+            transfer('a', 5, 'b'),
+        ], auto_commit=True)
+
+        self.assertEqual([o['status_code'] for o in outputs], [0, 1, 0])
+        self.assertEqual(self.d.pending_writes, {})
+        self.assertLess(self.d.get('con_currency.balances:a'), 95)
+        self.assertEqual(self.d.get('con_currency.balances:b'), 5)
+
+    def test_transaction_environment_does_not_leak(self):
+        env_var = {
+            'sender': 'stu',
+            'contract_name': 'con_i_use_env',
+            'function_name': 'env_var',
+            'kwargs': {},
+            'metering': False
+        }
+
+        outputs = self.e.execute_batch([
+            env_var,
+            dict(env_var, environment={'this_is_a_passed_in_variable': 2}),
+            env_var,
+        ], environment={'this_is_a_passed_in_variable': 1})
+
+        self.assertEqual([o['result'] for o in outputs], [1, 2, 1])
+
+        outputs = self.e.execute_batch([env_var])
+        self.assertEqual(outputs[0]['status_code'], 1)
+
+    def test_runtime_is_cleaned_up(self):
+        self.e.execute_batch([transfer('stu', 10, 'a')], environment={'block_num': 1})
+
+        self.assertEqual(runtime.rt.env, {'__Driver': self.d})
+        self.assertEqual(runtime.rt.loaded_modules, [])
+        self.assertFalse(runtime.rt.tracer.is_started())
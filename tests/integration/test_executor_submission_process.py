@@ -1,6 +1,8 @@
 from unittest import TestCase
 from contracting.storage.driver import Driver
 from contracting.execution.executor import Executor
+from contracting.execution.tracer import Tracer, ContractTracer
+from contracting.execution import runtime
 from contracting.compilation.compiler import ContractingCompiler
 import os
 
@@ -343,3 +345,91 @@ def get_v():
         output = e.execute('stu', 'i_use_env', 'env_var', kwargs={}, environment=env)
 
         self.assertEqual(output['status_code'], 1)
+
+    def test_mutable_default_arguments_are_fresh_every_call(self):
+        code = '''def g(x: list = []):
+    x.append(1)
+    return len(x)
+
+@export
+def f():
+    return g()
+'''
+        self.d.set('currency.balances:stu', 1000000)
+        self.d.commit()
+
+        for metering in (False, True):
+            e = Executor(metering=metering)
+            name = f'con_defaults_{int(metering)}'
+            e.execute(**TEST_SUBMISSION_KWARGS, kwargs={'name': name, 'code': code}, auto_commit=True)
+
+            results = [e.execute('stu', name, 'f', kwargs={})['result'] for _ in range(4)]
+            self.assertEqual(results, [1, 1, 1, 1])
+
+    def test_attributes_set_on_objects_are_not_kept_across_transactions(self):
+        code = '''v = Variable()
+
+@export
+def poke():
+    v.flag = 1
+
+@export
+def peek():
+    return v.flag
+'''
+        other = '''import con_poke
+
+@export
+def shadow():
+    con_poke.peek.flag = 1
+
+@export
+def look():
+    return con_poke.peek.flag
+'''
+        self.d.set('currency.balances:stu', 1000000)
+        self.d.commit()
+
+        e = Executor(metering=False)
+        e.execute(**TEST_SUBMISSION_KWARGS, kwargs={'name': 'con_poke', 'code': code}, auto_commit=True)
+        e.execute(**TEST_SUBMISSION_KWARGS, kwargs={'name': 'con_shadow', 'code': other}, auto_commit=True)
+
+        self.assertEqual(e.execute('stu', 'con_poke', 'poke', kwargs={})['status_code'], 0)
+        output = e.execute('stu', 'con_poke', 'peek', kwargs={})
+        self.assertEqual(output['status_code'], 1)
+        self.assertIsInstance(output['result'], AttributeError)
+
+        self.assertEqual(e.execute('stu', 'con_shadow', 'shadow', kwargs={})['status_code'], 0)
+        output = e.execute('stu', 'con_shadow', 'look', kwargs={})
+        self.assertEqual(output['status_code'], 1)
+        self.assertIsInstance(output['result'], AttributeError)
+
+    def test_tracers_reject_the_same_transactions(self):
+        # Most lines run outside the contract, in the ORM and the driver, and count towards the call limit
+        code = '''v = Hash(default_value=0)
+
+@export
+def spin(n: int):
+    for i in range(n):
+        v[i] = v[i] + 1
+'''
+        self.d.set('currency.balances:stu', 1000000)
+        self.d.commit()
+
+        e = Executor(metering=False)
+        e.execute(**TEST_SUBMISSION_KWARGS, kwargs={'name': 'con_spin', 'code': code}, auto_commit=True)
+
+        previous = runtime.rt.tracer
+        try:
+            Executor(metering=True, tracer=Tracer()).execute('stu', 'con_spin', 'spin', kwargs={'n': 200})
+
+            for tracer in (Tracer(), ContractTracer()):
+                tracer.max_call_count = 20000
+                e = Executor(metering=True, tracer=tracer)
+
+                self.assertEqual(e.execute('stu', 'con_spin', 'spin', kwargs={'n': 10})['status_code'], 0)
+                output = e.execute('stu', 'con_spin', 'spin', kwargs={'n': 200})
+                self.assertEqual(output['status_code'], 1)
+                self.assertIn('Call count exceeded', str(output['result']))
+        finally:
+            runtime.rt.use_tracer(previous)
@@ -0,0 +1,352 @@
+"""
+Benchmarks of the executor, driver, metering and encoder.
+
+Run from the repository root:
+
+    python -m tests.performance.benchmark --output results.json
+    python -m tests.performance.benchmark --baseline tests/performance/baseline.json
+
+Each benchmark runs --repeat times against fresh state and the best run is kept. Results are written as JSON with
+the time per operation of every benchmark. With --baseline, they are compared against a stored result and the
+exit status is 1 if any benchmark got slower than the baseline by more than --tolerance. Baselines are only
+meaningful on the machine they were recorded on; record one with --output on the reference machine.
+"""
+from contracting.storage.driver import Driver
+from contracting.storage.backend import HDF5Backend
+from contracting.storage.orm import Hash
+from contracting.storage.encoder import encode, decode, encode_binary
+from contracting.execution.executor import Executor
+from contracting.execution.module import install_database_loader, uninstall_database_loader, clear_module_cache
+from contracting.execution.runtime import rt
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+from contracting.stdlib.bridge.time import Datetime
+from contextlib import contextmanager
+from pathlib import Path
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+CONTRACTS = Path(__file__).parent.joinpath('test_contracts')
+
+# Name -> function of a BenchmarkContext, in the order they run
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(f):
+        BENCHMARKS[name] = f
+        return f
+    return register
+
+
+class BenchmarkContext:
+    """
+    Fresh state for one run of a benchmark. The benchmark sets up what it needs, then times its work with
+    measure, once per run.
+    """
+
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.storage_home = Path(tempfile.mkdtemp())
+        self.driver = None
+        self.result = None
+
+    def ops(self, n):
+        # Operation counts are cut down together with --quick
+        return max(1, int(n * self.scale))
+
+    def make_driver(self, **kwargs):
+        backend = HDF5Backend(self.storage_home.joinpath('contract_state'), self.storage_home.joinpath('run_state'))
+        self.driver = Driver(storage_home=self.storage_home, backend=backend, **kwargs)
+        return self.driver
+
+    def make_executor(self, metering=True):
+        driver = self.driver or self.make_driver()
+        with open(CONTRACTS.joinpath('submission.s.py')) as f:
+            driver.set_contract(name='submission', code=f.read())
+        driver.set('currency.balances:stu', 10 ** 12)
+        driver.commit()
+        return Executor(driver=driver, metering=metering)
+
+    @contextmanager
+    def measure(self, ops):
+        start = time.perf_counter()
+        yield
+        self.result = (ops, time.perf_counter() - start)
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.flush_full()
+            self.driver.backend.close()
+        shutil.rmtree(self.storage_home, ignore_errors=True)
+
+
+def submit(executor, name, filename='erc20_clone.s.py', metering=None):
+    with open(CONTRACTS.joinpath(filename)) as f:
+        code = f.read()
+    output = executor.execute(sender='stu', contract_name='submission', function_name='submit_contract',
+                              kwargs={'name': name, 'code': code}, metering=metering, auto_commit=True)
+    assert output['status_code'] == 0, output['result']
+
+
+@benchmark('submission')
+def bench_submission(ctx):
+    executor = ctx.make_executor()
+    n = ctx.ops(50)
+    with ctx.measure(n):
+        for i in range(n):
+            submit(executor, f'con_token_{i}')
+
+
+def bench_transfers(ctx, metering):
+    executor = ctx.make_executor(metering)
+    submit(executor, 'con_erc20_clone')
+    n = ctx.ops(2000)
+    transactions = [{
+        'sender': 'stu',
+        'contract_name': 'con_erc20_clone',
+        'function_name': 'transfer',
+        'kwargs': {'amount': 1, 'to': f'recipient_{i}'}
+    } for i in range(n)]
+
+    with ctx.measure(n):
+        outputs = executor.execute_batch(transactions, auto_commit=True)
+    assert all(o['status_code'] == 0 for o in outputs)
+
+
+@benchmark('call_metered')
+def bench_call_metered(ctx):
+    bench_transfers(ctx, metering=True)
+
+
+@benchmark('call_unmetered')
+def bench_call_unmetered(ctx):
+    bench_transfers(ctx, metering=False)
+
+
+def fill_hash(ctx, size):
+    driver = ctx.make_driver()
+    for i in range(size):
+        driver.set(f'con_a.balances:account_{i}', ContractingDecimal(i))
+    driver.commit()
+    return driver, Hash('con_a', 'balances', driver=driver)
+
+
+def bench_hash_reads(ctx, size, cached):
+    driver, h = fill_hash(ctx, size)
+    n = ctx.ops(10000)
+    keys = [f'account_{i % size}' for i in range(n)]
+    if not cached:
+        driver.cache.clear()
+
+    with ctx.measure(n):
+        for key in keys:
+            h[key]
+
+
+def bench_hash_writes(ctx, size):
+    driver, h = fill_hash(ctx, size)
+    n = ctx.ops(10000)
+    keys = [f'account_{(i * 7) % size}' for i in range(n)]
+
+    with ctx.measure(n):
+        for key in keys:
+            h[key] = 1
+        driver.commit()
+
+
+for _size in (1000, 10000):
+    benchmark(f'hash_read_{_size}_cached')(lambda ctx, size=_size: bench_hash_reads(ctx, size, cached=True))
+    benchmark(f'hash_read_{_size}_disk')(lambda ctx, size=_size: bench_hash_reads(ctx, size, cached=False))
+    benchmark(f'hash_write_{_size}')(lambda ctx, size=_size: bench_hash_writes(ctx, size))
+
+
+def bench_commit(ctx, n):
+    driver = ctx.make_driver()
+    n = ctx.ops(n)
+    for i in range(n):
+        driver.set(f'con_a.balances:account_{i}', i)
+
+    with ctx.measure(n):
+        driver.commit()
+
+
+for _n in (100, 1000, 10000):
+    benchmark(f'driver_commit_{_n}')(lambda ctx, n=_n: bench_commit(ctx, n))
+
+
+@benchmark('prefix_scan')
+def bench_prefix_scan(ctx):
+    driver = ctx.make_driver()
+    size = ctx.ops(10000)
+    for i in range(size):
+        driver.set(f'con_a.balances:account_{i}', i)
+        driver.set(f'con_a.allowances:account_{i}', i)
+    driver.commit()
+
+    with ctx.measure(size):
+        items = driver.items('con_a.balances:')
+    assert len(items) == size
+
+
+SAMPLE_VALUES = [
+    'stu', 42, 2 ** 80, True, None, ContractingDecimal('123.456'), Datetime(2024, 1, 2, 3, 4, 5),
+    b'\x00\x01\x02', ['a', 1, ContractingDecimal('0.5')], {'owner': 'stu', 'amounts': [1, 2, 3], 'nested': {'a': 1}},
+]
+
+
+def bench_codec(ctx, encoder):
+    n = ctx.ops(20000)
+    values = [SAMPLE_VALUES[i % len(SAMPLE_VALUES)] for i in range(n)]
+
+    with ctx.measure(n):
+        for value in values:
+            decode(encoder(value))
+
+
+@benchmark('codec_json')
+def bench_codec_json(ctx):
+    bench_codec(ctx, encode)
+
+
+@benchmark('codec_binary')
+def bench_codec_binary(ctx):
+    bench_codec(ctx, encode_binary)
+
+
+def bench_import(ctx, cold):
+    executor = ctx.make_executor()
+    submit(executor, 'con_erc20_clone')
+    clear_module_cache()
+    n = ctx.ops(500)
+
+    install_database_loader(ctx.driver)
+    try:
+        with ctx.measure(n):
+            for _ in range(n):
+                if cold:
+                    clear_module_cache()
+                importlib.import_module('con_erc20_clone')
+                rt.clean_up_transaction()
+    finally:
+        uninstall_database_loader()
+        clear_module_cache()
+
+
+@benchmark('import_cold')
+def bench_import_cold(ctx):
+    bench_import(ctx, cold=True)
+
+
+@benchmark('import_cached')
+def bench_import_cached(ctx):
+    bench_import(ctx, cold=False)
+
+
+def run(names=None, repeat=3, scale=1):
+    """
+    Run the benchmarks of the given names, or all of them, and return their results.
+    """
+    results = {}
+    for name, f in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+
+        best = None
+        for _ in range(repeat):
+            ctx = BenchmarkContext(scale)
+            try:
+                f(ctx)
+            finally:
+                ctx.close()
+            if best is None or ctx.result[1] < best[1]:
+                best = ctx.result
+
+        ops, seconds = best
+        results[name] = {
+            'ops': ops,
+            'seconds': seconds,
+            'us_per_op': seconds / ops * 1e6,
+            'ops_per_second': ops / seconds if seconds > 0 else None,
+        }
+
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': repeat,
+            'scale': scale,
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Compare results against a baseline of the same format. Returns (name, baseline us/op, us/op, ratio) for every
+    benchmark in both, and the names of those slower than the baseline by more than tolerance.
+    """
+    rows = []
+    regressions = []
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+
+        ratio = result['us_per_op'] / base['us_per_op']
+        rows.append((name, base['us_per_op'], result['us_per_op'], ratio))
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the contracting benchmarks.')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run, all by default: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='slowdown over the baseline reported as a regression (default 0.2, i.e. 20%%)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the best is kept (default 3)')
+    parser.add_argument('--quick', action='store_true', help='run a tenth of the operations')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    results = run(args.names, args.repeat, 0.1 if args.quick else 1)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.tolerance)
+
+        print(f'{"benchmark":<28}{"baseline us/op":>16}{"us/op":>12}{"change":>10}')
+        for name, base, current, ratio in rows:
+            flag = '  REGRESSION' if name in regressions else ''
+            print(f'{name:<28}{base:>16.2f}{current:>12.2f}{ratio - 1:>+10.1%}{flag}')
+        return 1 if regressions else 0
+
+    for name, result in results['results'].items():
+        print(f'{name:<28}{result["us_per_op"]:>12.2f} us/op{result["ops_per_second"]:>14.0f} ops/s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
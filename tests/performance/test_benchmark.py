@@ -0,0 +1,21 @@
+from unittest import TestCase
+from tests.performance import benchmark
+
+
+class TestBenchmark(TestCase):
+    def test_run_reports_time_per_op(self):
+        results = benchmark.run(['codec_json', 'driver_commit_100'], repeat=1, scale=0.1)
+
+        self.assertEqual(set(results['results']), {'codec_json', 'driver_commit_100'})
+        self.assertEqual(results['results']['driver_commit_100']['ops'], 10)
+        self.assertGreater(results['results']['codec_json']['us_per_op'], 0)
+
+    def test_compare_flags_regressions_over_tolerance(self):
+        baseline = {'results': {'a': {'us_per_op': 10.0}, 'b': {'us_per_op': 10.0}, 'gone': {'us_per_op': 1.0}}}
+        results = {'results': {'a': {'us_per_op': 11.0}, 'b': {'us_per_op': 13.0}, 'new': {'us_per_op': 1.0}}}
+
+        rows, regressions = benchmark.compare(results, baseline, tolerance=0.2)
+
+        self.assertEqual([row[0] for row in rows], ['a', 'b'])
+        self.assertAlmostEqual(rows[1][3], 1.3)
+        self.assertEqual(regressions, ['b'])
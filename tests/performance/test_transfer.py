@@ -55,11 +55,12 @@ class TestSandbox(TestCase):
         e.execute(**TEST_SUBMISSION_KWARGS,
                   kwargs=submission_kwargs_for_file(os.path.join(self.script_dir, "test_contracts", "erc20_clone.s.py")))
 
-        for r in self.recipients:
-            e.execute(sender='stu',
-                      contract_name='con_erc20_clone',
-                      function_name='transfer',
-                      kwargs={
-                          'amount': 1,
-                          'to': r
-                      })
\ No newline at end of file
+        e.execute_batch([{
+            'sender': 'stu',
+            'contract_name': 'con_erc20_clone',
+            'function_name': 'transfer',
+            'kwargs': {
+                'amount': 1,
+                'to': r
+            }
+        } for r in self.recipients])
@@ -0,0 +1,285 @@
+import unittest
+import tempfile
+import shutil
+import pickle
+import sqlite3
+from pathlib import Path
+from contracting.storage.backend import HDF5Backend, parse_key
+from contracting.storage import hdf5
+from contracting.storage.sqlite import SQLiteBackend, prefix_upper_bound
+from contracting.storage.driver import Driver
+
+
+class BackendTests:
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.backend = self.make_backend()
+
+    def tearDown(self):
+        self.backend.clear()
+        self.backend.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        self.backend.set('con_a.balances:stu', '100')
+        self.assertEqual(self.backend.get('con_a.balances:stu'), '100')
+
+        self.backend.delete('con_a.balances:stu')
+        self.assertIsNone(self.backend.get('con_a.balances:stu'))
+
+    def test_write_batch_sets_block(self):
+        self.backend.write_batch({'con_a.x': '1', 'con_b.y': '2'}, block_num=10)
+
+        self.assertEqual(self.backend.get('con_a.x'), '1')
+        self.assertEqual(self.backend.get('con_b.y'), '2')
+        self.assertEqual(self.backend.get_block('con_a.x'), 10)
+
+    def test_iter_keys_is_ordered_and_prefixed(self):
+        self.backend.write_batch({
+            'con_a.balances:c': '1',
+            'con_a.balances:a': '2',
+            'con_a.balances:b:x': '3',
+            'con_a.owner': '"stu"',
+            'con_ab.balances:a': '4',
+        })
+
+        self.assertEqual(list(self.backend.iter_keys('con_a.balances:')),
+                         ['con_a.balances:a', 'con_a.balances:b:x', 'con_a.balances:c'])
+        self.assertEqual(list(self.backend.iter_keys('con_a.balances:', length=2)),
+                         ['con_a.balances:a', 'con_a.balances:b:x'])
+        self.assertEqual(len(list(self.backend.iter_keys('con_a'))), 5)
+        self.assertEqual(dict(self.backend.iter_items('con_ab.')), {'con_ab.balances:a': '4'})
+
+    def test_iter_records(self):
+        self.backend.write_batch({'con_a.balances:a': '1', 'con_a.balances:b': '2'}, block_num=7)
+        self.backend.write_batch({'con_a.balances:c': '3', 'con_a.balances:b': None})
+
+        self.assertEqual(list(self.backend.iter_records('con_a.')),
+                         [('con_a.balances:a', '1', 7), ('con_a.balances:c', '3', -1)])
+        self.assertEqual(list(self.backend.iter_records('con_a.', start_after='con_a.balances:a')),
+                         [('con_a.balances:c', '3', -1)])
+
+    def test_binary_values(self):
+        value = b'\xc1\x00\x05a\x00'
+        self.backend.write_batch({'con_a.x': value, 'con_a.y': '1'}, block_num=3)
+
+        self.assertEqual(self.backend.get('con_a.x'), value)
+        self.assertEqual(list(self.backend.iter_records('con_a.')), [('con_a.x', value, 3), ('con_a.y', '1', 3)])
+
+    def test_files(self):
+        self.backend.write_batch({'con_a.x': '1', 'con_b.y': '2', '__run__.z': '3'})
+
+        self.assertEqual(self.backend.filenames(), ['__run__', 'con_a', 'con_b'])
+        self.assertTrue(self.backend.has_file('con_a'))
+
+        self.backend.delete_file('con_a')
+        self.assertFalse(self.backend.has_file('con_a'))
+        self.assertIsNone(self.backend.get('con_a.x'))
+        self.assertEqual(self.backend.get('con_b.y'), '2')
+
+    def test_snapshot(self):
+        self.backend.set('con_a.x', '1')
+        target = self.dir.joinpath('snapshot')
+        target.mkdir()
+
+        self.backend.snapshot(target)
+        self.assertTrue(any(target.iterdir()))
+
+    def test_file_stats_and_compact(self):
+        self.backend.write_batch({'con_a.x': '1', 'con_a.y': '2', 'con_ab.z': '3'})
+        self.backend.delete('con_a.y')
+
+        self.assertEqual(self.backend.file_stats('con_a')['live'], 1)
+        self.assertIsNone(self.backend.file_stats('con_b'))
+
+        self.backend.compact('con_a')
+        self.assertEqual(self.backend.file_stats('con_a')['dead'], 0)
+        self.assertEqual(self.backend.get('con_a.x'), '1')
+        self.assertEqual(list(self.backend.iter_keys('con_a')), ['con_a.x', 'con_ab.z'])
+
+    def test_sync(self):
+        self.backend.write_batch({'con_a.x': '1', '__run__.y': '2'})
+        self.backend.sync()
+        self.backend.barrier()
+
+        self.assertEqual(self.backend.get('con_a.x'), '1')
+
+    def test_driver_round_trip(self):
+        driver = Driver(storage_home=self.dir, backend=self.backend)
+        driver.set('con_a.balances:stu', 5)
+        driver.set('con_a.balances:raghu', 7)
+        driver.commit()
+
+        self.assertEqual(driver.get('con_a.balances:stu'), 5)
+        self.assertEqual(driver.items('con_a.balances:'), {'con_a.balances:stu': 5, 'con_a.balances:raghu': 7})
+        self.assertEqual(driver.get_contract_files(), ['con_a'])
+
+    def test_codecs_read_each_others_values(self):
+        json_driver = Driver(storage_home=self.dir, backend=self.backend, codec='json')
+        json_driver.set('con_a.x', {'a': 1})
+        json_driver.commit()
+
+        binary_driver = Driver(storage_home=self.dir, backend=self.backend, codec='binary')
+        self.assertEqual(binary_driver.get('con_a.x'), {'a': 1})
+        binary_driver.set('con_a.y', 2)
+        binary_driver.commit()
+
+        self.assertIsInstance(self.backend.get('con_a.y'), bytes)
+        self.assertEqual(Driver(storage_home=self.dir, backend=self.backend).get('con_a.y'), 2)
+
+
+class TestHDF5Backend(BackendTests, unittest.TestCase):
+    def make_backend(self):
+        return HDF5Backend(self.dir.joinpath('contract_state'), self.dir.joinpath('run_state'))
+
+    def test_parse_key(self):
+        self.assertEqual(parse_key('con_a.balances:stu:raghu'), ('con_a', 'balances/stu/raghu'))
+        self.assertEqual(parse_key('con_a'), ('con_a', 'con_a'))
+
+    def test_index_follows_writes(self):
+        self.backend.write_batch({'con_a.balances:a': '1'})
+        self.assertEqual(list(self.backend.iter_keys('con_a.balances:')), ['con_a.balances:a'])
+
+        self.backend.write_batch({'con_a.balances:b': '2', 'con_a.balances:a': None})
+        self.assertEqual(list(self.backend.iter_keys('con_a.balances:')), ['con_a.balances:b'])
+
+    def test_index_is_persisted_on_close(self):
+        self.backend.write_batch({'con_a.balances:a': '1'})
+        list(self.backend.iter_keys('con_a.'))
+        self.backend.close()
+        self.backend.indexes.clear()
+
+        self.assertTrue(self.backend.index_home.joinpath('con_a').is_file())
+        self.assertFalse(self.backend.get_index('con_a').dirty)
+        self.assertEqual(list(self.backend.iter_keys('con_a.')), ['con_a.balances:a'])
+
+    def test_driver_close_persists_the_index(self):
+        driver = Driver(storage_home=self.dir, backend=self.backend)
+        driver.set('con_a.balances:a', 1)
+        driver.commit()
+        list(self.backend.iter_keys('con_a.'))
+        driver.close()
+
+        self.assertTrue(self.backend.index_home.joinpath('con_a').is_file())
+
+    def test_driver_compacts_files(self):
+        driver = Driver(storage_home=self.dir, backend=self.backend)
+        for i in range(200):
+            driver.set(f'con_a.balances:{i}', i)
+        driver.commit()
+        list(self.backend.iter_keys('con_a.'))
+        for i in range(150):
+            driver.delete(f'con_a.balances:{i}')
+        driver.commit()
+
+        self.assertEqual(driver.file_stats(['con_a'])['con_a']['dead'], 150)
+
+        before, after = driver.compact()['con_a']
+        self.assertLess(after, before)
+        self.assertEqual(driver.file_stats()['con_a']['live'], 50)
+        self.assertEqual(self.backend.filenames(), ['con_a'])
+
+        driver.cache.clear()
+        self.assertEqual(driver.get('con_a.balances:199'), 199)
+        self.assertEqual(len(driver.keys('con_a.balances:')), 50)
+
+        # The index is saved again for the compacted file
+        self.backend.close()
+        self.backend.indexes.clear()
+        self.assertFalse(self.backend.get_index('con_a').dirty)
+
+
+class TestShardedHDF5Backend(BackendTests, unittest.TestCase):
+    def make_backend(self):
+        return HDF5Backend(self.dir.joinpath('contract_state'), self.dir.joinpath('run_state'), shards=4)
+
+    def test_keys_are_spread_over_shards(self):
+        self.backend.write_batch({f'con_a.balances:{i}': str(i) for i in range(100)})
+        self.backend.write_batch({'__run__.x': '1'})
+
+        shards = self.dir.joinpath('contract_state', 'con_a')
+        self.assertEqual(sorted(p.name for p in shards.iterdir()), ['0', '1', '2', '3'])
+        self.assertTrue(self.dir.joinpath('run_state', '__run__').is_file())
+        self.assertEqual(self.backend.filenames(), ['__run__', 'con_a'])
+
+        keys = sorted(f'con_a.balances:{i}' for i in range(100))
+        self.assertEqual(list(self.backend.iter_keys('con_a.balances:')), keys)
+        self.assertEqual(list(self.backend.iter_keys('con_a.', length=3)), keys[:3])
+        self.assertEqual(self.backend.file_stats('con_a')['live'], 100)
+
+    def test_shard_of_a_key_is_stable(self):
+        self.backend.write_batch({'con_a.balances:stu': '1'})
+        self.backend.close()
+
+        reopened = pickle.loads(pickle.dumps(self.backend))
+        self.assertEqual(reopened.shards, 4)
+        self.assertEqual(reopened.get('con_a.balances:stu'), '1')
+
+    def test_driver_routes_keys_to_shards(self):
+        driver = Driver(storage_home=self.dir, shards=4)
+        driver.set('con_a.balances:stu', 5)
+        driver.set('con_a.balances:raghu', 7)
+        driver.commit()
+        driver.cache.clear()
+
+        self.assertEqual(driver.get('con_a.balances:stu'), 5)
+        self.assertEqual(driver.items('con_a.balances:'), {'con_a.balances:stu': 5, 'con_a.balances:raghu': 7})
+        self.assertTrue(self.dir.joinpath('contract_state', 'con_a').is_dir())
+
+    def test_state_is_opened_with_the_shards_it_was_written_with(self):
+        self.backend.write_batch({'con_a.balances:stu': '1'})
+        self.backend.close()
+
+        with self.assertRaises(ValueError):
+            Driver(storage_home=self.dir)
+        with self.assertRaises(ValueError):
+            Driver(storage_home=self.dir, shards=2)
+        self.assertEqual(Driver(storage_home=self.dir, shards=4).get('con_a.balances:stu'), 1)
+
+    def test_pool_makes_room_for_the_shards(self):
+        self.assertGreaterEqual(hdf5.MAX_OPEN_FILES, hdf5.OPEN_CONTRACTS * 4)
+
+
+class TestSQLiteBackend(BackendTests, unittest.TestCase):
+    def make_backend(self):
+        return SQLiteBackend(self.dir.joinpath('state.db'))
+
+    def test_compact_gives_back_freed_pages(self):
+        self.backend.write_batch({f'con_a.balances:{i}': 'x' * 500 for i in range(2000)})
+        self.backend.write_batch({f'con_a.balances:{i}': None for i in range(1950)})
+
+        stats = self.backend.file_stats('con_a')
+        self.assertEqual(stats['live'], 50)
+        self.assertGreater(stats['free_bytes'], 0)
+
+        before, after = self.backend.compact('con_a')
+        self.assertLess(after, before - stats['free_bytes'] // 2)
+        self.assertEqual(self.backend.file_stats('con_a')['free_bytes'], 0)
+        self.assertIsNone(self.backend.compact('con_a'))
+        self.assertEqual(self.backend.get('con_a.balances:1999'), 'x' * 500)
+
+    def test_compact_enables_incremental_vacuum_on_old_databases(self):
+        self.backend.close()
+        db_path = self.dir.joinpath('old.db')
+        conn = sqlite3.connect(str(db_path))
+        conn.execute("CREATE TABLE state (key TEXT PRIMARY KEY, value NOT NULL, block INTEGER NOT NULL) WITHOUT ROWID")
+        conn.executemany("INSERT INTO state VALUES (?, ?, 1)", [(f'con_a.{i}', 'x' * 500) for i in range(2000)])
+        conn.execute("DELETE FROM state WHERE key > 'con_a.1'")
+        conn.commit()
+        conn.close()
+
+        self.backend = SQLiteBackend(db_path)
+        before, after = self.backend.compact('con_a')
+        self.assertLess(after, before)
+        self.assertEqual(self.backend.conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+
+    def test_prefix_upper_bound(self):
+        self.assertEqual(prefix_upper_bound('con_a.'), 'con_a/')
+        self.assertIsNone(prefix_upper_bound(''))
+
+
+if __name__ == '__main__':
+    unittest.main()
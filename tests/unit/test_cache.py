@@ -0,0 +1,76 @@
+import unittest
+from contracting.storage.cache import StateCache, MISSING
+
+
+class TestStateCache(unittest.TestCase):
+    def test_get_counts_hits_and_misses(self):
+        cache = StateCache(max_bytes=1024)
+        cache['a'] = 1
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_size_is_key_plus_encoded_value(self):
+        cache = StateCache(max_bytes=1024)
+        cache['key'] = 'value'
+
+        self.assertEqual(cache.size, len('key') + len('"value"'))
+
+        cache.set('key', 'x', size=100)
+        self.assertEqual(cache.size, 103)
+
+    def test_evicts_least_recently_used(self):
+        cache = StateCache(max_bytes=30)
+        cache.set('a', 1, size=9)
+        cache.set('b', 2, size=9)
+        cache.set('c', 3, size=9)
+        cache.get('a')
+        cache.set('d', 4, size=9)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.size, 30)
+
+    def test_oversized_values_are_not_cached(self):
+        cache = StateCache(max_bytes=10)
+        cache.set('a', 'x' * 100)
+
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.size, 0)
+
+    def test_setting_none_removes(self):
+        cache = StateCache(max_bytes=1024)
+        cache['a'] = 1
+        cache['a'] = None
+
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.size, 0)
+
+    def test_missing_entries_count_as_negative_hits(self):
+        cache = StateCache(max_bytes=1024)
+        cache.set('a', MISSING)
+
+        self.assertIs(cache.get('a'), MISSING)
+        self.assertEqual(cache.size, 1)
+        self.assertEqual(cache.stats()['negative_hits'], 1)
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_cost_size_is_kept_with_the_entry(self):
+        cache = StateCache(max_bytes=1024)
+        cache.set('a', 1, size=1)
+        self.assertIsNone(cache.get_cost_size('a'))
+
+        cache.set_cost_size('a', 5)
+        self.assertEqual(cache.get_cost_size('a'), 5)
+        self.assertEqual(cache.size, 2)
+
+        cache.set('a', 2, size=1, cost_size=3)
+        self.assertEqual(cache.get_cost_size('a'), 3)
+        self.assertIsNone(cache.get_cost_size('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 from unittest import TestCase
-from contracting.storage.encoder import encode, decode, safe_repr, convert_dict, MONGO_MAX_INT, MONGO_MIN_INT
+from contracting.storage.encoder import encode, decode, safe_repr, convert_dict, MONGO_MAX_INT, MONGO_MIN_INT, \
+    encode_binary, is_binary, BINARY_PREFIX
 from contracting.stdlib.bridge.time import Datetime, Timedelta
 from datetime import datetime
 from contracting.stdlib.bridge.decimal import ContractingDecimal
@@ -340,3 +341,52 @@ class TestEncode(TestCase):
         d2 = convert_dict(d)
 
         self.assertEqual(expected, d2)
+
+
+class TestBinaryEncode(TestCase):
+    values = [
+        0, 63, 64, -1, MONGO_MAX_INT + 1, MONGO_MIN_INT - 1, 2 ** 300,
+        True, False, None, 1.5, '', 'hello', 'h' * 200, 'ünïcode',
+        b'', b'\x00\xc1\xff',
+        ContractingDecimal('0.0044997618965276'), ContractingDecimal('123.000000'),
+        Datetime(2019, 1, 1, 12, 30, 5, 10), Timedelta(weeks=1, days=1, seconds=5), Timedelta(days=-3),
+        [1, 'a', [None, {'b': b'x'}]], (1, 2), {'a': {'b': [ContractingDecimal('1.1')]}, 'c': {}},
+    ]
+
+    def test_round_trip_matches_json(self):
+        for value in self.values:
+            encoded = encode_binary(value)
+
+            self.assertTrue(encoded.startswith(BINARY_PREFIX))
+            self.assertEqual(decode(encoded), decode(encode(value)))
+            self.assertEqual(encode(decode(encoded)), encode(value))
+
+    def test_dict_keys_are_strings_as_in_json(self):
+        d = {1: 'a', True: 'b', None: 'c', 1.5: 'd'}
+
+        self.assertEqual(decode(encode_binary(d)), decode(encode(d)))
+
+    def test_dicts_like_encoded_types_decode_as_in_json(self):
+        d = {'x': {'__fixed__': '1.5'}}
+
+        self.assertEqual(decode(encode_binary(d)), decode(encode(d)))
+
+    def test_deterministic_and_compact(self):
+        self.assertEqual(encode_binary({'a': 1, 'b': [2, 3]}), encode_binary({'a': 1, 'b': [2, 3]}))
+        self.assertEqual(encode_binary(5), b'\xc1\x03\x0a')
+        self.assertLess(len(encode_binary(ContractingDecimal('1.5'))), len(encode(ContractingDecimal('1.5'))))
+
+    def test_json_is_not_binary(self):
+        self.assertFalse(is_binary(encode('hello').encode()))
+        self.assertTrue(is_binary(encode_binary('hello')))
+        self.assertEqual(decode(b'"hello"'), 'hello')
+
+    def test_malformed_decodes_to_none(self):
+        self.assertIsNone(decode(b'\xc1'))
+        self.assertIsNone(decode(b'\xc1\x05\x09abc'))
+        self.assertIsNone(decode(b'\xc1\x03\x0a\x00'))
+        self.assertIsNone(decode(b'\xc1\xff'))
+
+    def test_unsupported_type(self):
+        with self.assertRaises(TypeError):
+            encode_binary(object())
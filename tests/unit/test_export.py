@@ -0,0 +1,123 @@
+import unittest
+import tempfile
+import shutil
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+from contracting.storage import export, hdf5
+from contracting.storage.backend import HDF5Backend
+from contracting.storage.sqlite import SQLiteBackend
+from contracting.storage.driver import Driver
+
+
+class TestExportFormat(unittest.TestCase):
+    records = [('con_a.x', '1', 5), ('con_a.y', '{"a":"ü"}', -1), ('__run__.z', '"' + 'x' * 300 + '"', 2 ** 62),
+               ('con_b.x', b'\xc1\x06\x01\xff', 3)]
+
+    def test_round_trip(self):
+        f = BytesIO()
+        self.assertEqual(export.write_records(f, iter(self.records)), 4)
+
+        f.seek(0)
+        self.assertEqual(list(export.read_records(f)), self.records)
+
+    def test_corruption_is_detected(self):
+        f = BytesIO()
+        export.write_records(f, self.records)
+        data = f.getvalue()
+
+        corrupted = data.replace(b'con_a.y', b'con_a.Y')
+        with self.assertRaises(ValueError):
+            list(export.read_records(BytesIO(corrupted)))
+
+        with self.assertRaises(ValueError):
+            list(export.read_records(BytesIO(data[:-10])))
+
+        with self.assertRaises(ValueError):
+            list(export.read_records(BytesIO(b'nothing')))
+
+
+class TestDriverExport(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.driver = Driver(storage_home=self.dir.joinpath('a'),
+                             backend=HDF5Backend(self.dir.joinpath('a', 'contract_state'),
+                                                 self.dir.joinpath('a', 'run_state')))
+        self.driver.set('con_a.balances:stu', 1)
+        self.driver.set('con_a.balances:raghu', {'a': [1, 2]})
+        self.driver.set('con_a-b.owner', 'stu')
+        self.driver.set('__latest_block.height', 3)
+        self.driver.commit()
+        self.driver.set('con_a.balances:stu', 2)
+        self.driver.hard_apply(123)
+
+    def tearDown(self):
+        self.driver.flush_full()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_iter_state_in_chunks(self):
+        chunks = list(self.driver.iter_state(chunk_size=2))
+        keys = [k for chunk in chunks for k, _, _ in chunk]
+
+        self.assertEqual([len(c) for c in chunks], [2, 2])
+        # File by file, so 'con_a-b.owner' comes after the keys of con_a
+        self.assertEqual(keys, ['__latest_block.height', 'con_a.balances:raghu', 'con_a.balances:stu',
+                                'con_a-b.owner'])
+        self.assertEqual(self.driver.pending_reads, {})
+
+        resumed = [k for chunk in self.driver.iter_state(chunk_size=2, start_after=keys[1]) for k, _, _ in chunk]
+        self.assertEqual(resumed, keys[2:])
+
+        contract_keys = [k for chunk in self.driver.iter_state(run_state=False) for k, _, _ in chunk]
+        self.assertEqual(contract_keys, keys[1:])
+
+    def test_iter_state_reads_only_the_keys_of_each_file(self):
+        for name in ('con_t', 'con_t1', 'con_t12'):
+            self.driver.set(f'{name}.balances:stu', 1)
+        self.driver.set('con_t', 'bare')
+        self.driver.commit()
+
+        with mock.patch('contracting.storage.hdf5.get_record', wraps=hdf5.get_record) as get_record:
+            keys = [k for chunk in self.driver.iter_state(run_state=False) for k, _, _ in chunk]
+
+        self.assertEqual(keys, ['con_a.balances:raghu', 'con_a.balances:stu', 'con_a-b.owner', 'con_t',
+                                'con_t.balances:stu', 'con_t1.balances:stu', 'con_t12.balances:stu'])
+        self.assertEqual(get_record.call_count, 6)
+
+    def test_export_and_import(self):
+        path = self.dir.joinpath('state.export')
+        self.assertEqual(self.driver.export_state(path), 4)
+
+        target = Driver(storage_home=self.dir.joinpath('b'), backend=SQLiteBackend(self.dir.joinpath('b', 'state.db')),
+                        state_root=True)
+        self.assertEqual(target.import_state(path, batch_size=1), 4)
+
+        self.assertEqual(target.get('con_a.balances:raghu'), {'a': [1, 2]})
+        self.assertEqual(target.get('con_a.balances:stu'), 2)
+        self.assertEqual(target.get('__latest_block.height'), 3)
+        self.assertEqual(target.backend.get_block('con_a.balances:stu'), 123)
+
+        root = target.state_root()
+        target.rebuild_state_root()
+        self.assertEqual(target.state_root(), root)
+
+        target.flush_full()
+        target.commitment.close()
+        target.backend.close()
+
+    def test_corrupted_export_is_not_imported(self):
+        path = self.dir.joinpath('state.export')
+        self.driver.export_state(path)
+        data = path.read_bytes()
+        path.write_bytes(data.replace(b'con_a.balances:stu', b'con_a.balances:Stu'))
+
+        target = Driver(storage_home=self.dir.joinpath('b'), backend=SQLiteBackend(self.dir.joinpath('b', 'state.db')))
+        with self.assertRaises(ValueError):
+            target.import_state(path, batch_size=1)
+
+        self.assertEqual(target.backend.filenames(), [])
+        target.backend.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+import os
+import tempfile
+import shutil
+import subprocess
+import sys
+import threading
+from contracting.storage import hdf5
+
+
+class TestHDF5HandlePool(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.dir, 'con_test')
+
+    def tearDown(self):
+        hdf5.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_set_and_get_reuses_handle(self):
+        hdf5.set_value_to_disk(self.file_path, 'balances/stu', 100)
+        f = hdf5.file_handles[self.file_path]
+
+        self.assertEqual(hdf5.get_value_from_disk(self.file_path, 'balances/stu'), 100)
+        self.assertIs(hdf5.file_handles[self.file_path], f)
+
+    def test_read_handle_is_reopened_writable(self):
+        hdf5.set_value_to_disk(self.file_path, 'x', 1)
+        hdf5.close()
+
+        hdf5.get_value_from_disk(self.file_path, 'x')
+        self.assertEqual(hdf5.file_handles[self.file_path].mode, 'r')
+
+        hdf5.set_value_to_disk(self.file_path, 'x', 2)
+        self.assertEqual(hdf5.file_handles[self.file_path].mode, 'r+')
+        self.assertEqual(hdf5.get_value_from_disk(self.file_path, 'x'), 2)
+
+    def test_missing_file_is_not_created_on_read(self):
+        self.assertIsNone(hdf5.get_value_from_disk(self.file_path, 'x'))
+        self.assertEqual(hdf5.get_groups(self.file_path), [])
+        self.assertFalse(os.path.exists(self.file_path))
+
+    def test_pool_is_bounded(self):
+        for i in range(hdf5.MAX_OPEN_FILES + 5):
+            hdf5.set_value_to_disk(os.path.join(self.dir, f'con_{i}'), 'x', i)
+
+        self.assertEqual(len(hdf5.file_handles), hdf5.MAX_OPEN_FILES)
+        self.assertEqual(hdf5.get_value_from_disk(os.path.join(self.dir, 'con_0'), 'x'), 0)
+
+    def test_handles_in_use_are_not_evicted(self):
+        hdf5.set_value_to_disk(self.file_path, 'x', 1)
+        in_use = hdf5.file_handles[self.file_path]
+
+        # Another thread using the file holds its lock
+        acquired, done = threading.Event(), threading.Event()
+
+        def use():
+            with hdf5.get_file_lock(self.file_path):
+                acquired.set()
+                done.wait(timeout=5)
+
+        user = threading.Thread(target=use)
+        user.start()
+        acquired.wait(timeout=5)
+        for i in range(hdf5.MAX_OPEN_FILES + 5):
+            hdf5.set_value_to_disk(os.path.join(self.dir, f'con_{i}'), 'x', i)
+        self.assertTrue(in_use.id.valid)
+        done.set()
+        user.join()
+
+        hdf5.set_value_to_disk(os.path.join(self.dir, 'con_last'), 'x', 0)
+        self.assertFalse(in_use.id.valid)
+        self.assertEqual(len(hdf5.file_handles), hdf5.MAX_OPEN_FILES)
+
+    def test_files_are_used_without_waiting_for_each_other(self):
+        other_path = os.path.join(self.dir, 'con_other')
+        hdf5.set_value_to_disk(self.file_path, 'x', 1)
+        hdf5.set_value_to_disk(other_path, 'x', 2)
+
+        values = []
+        with hdf5.get_file_lock(self.file_path):
+            reader = threading.Thread(target=lambda: values.append(hdf5.get_value_from_disk(other_path, 'x')))
+            reader.start()
+            reader.join(timeout=5)
+            self.assertEqual(values, [2])
+
+    def read_in_other_process(self):
+        # Reads x in a new process, printing the value or the type of the error raised
+        script = (
+            'import sys\n'
+            'from contracting.storage import hdf5\n'
+            'try:\n'
+            '    print(hdf5.get_value_from_disk(sys.argv[1], "x"))\n'
+            'except Exception as e:\n'
+            '    print(type(e).__name__)\n'
+        )
+        return subprocess.run([sys.executable, '-c', script, self.file_path], capture_output=True, text=True,
+                              check=True).stdout.strip()
+
+    def test_flush_lets_other_processes_read(self):
+        hdf5.set_value_to_disk(self.file_path, 'x', 100)
+        hdf5.flush()
+
+        self.assertEqual(hdf5.file_handles, {})
+        self.assertEqual(self.read_in_other_process(), '100')
+        self.assertEqual(hdf5.get_value_from_disk(self.file_path, 'x'), 100)
+        self.assertEqual(hdf5.file_handles[self.file_path].mode, 'r')
+
+    def test_locked_file_is_not_read_as_missing(self):
+        hdf5.set_value_to_disk(self.file_path, 'x', 100)
+
+        self.assertNotEqual(self.read_in_other_process(), 'None')
+
+    def test_close_releases_handles(self):
+        hdf5.set_value_to_disk(self.file_path, 'x', 1)
+        hdf5.flush(self.file_path)
+        hdf5.close(self.file_path)
+
+        self.assertNotIn(self.file_path, hdf5.file_handles)
+        self.assertEqual(hdf5.get_value_from_disk(self.file_path, 'x'), 1)
+
+    def test_write_batch_applies_batch(self):
+        hdf5.set_value_to_disk(self.file_path, 'balances/old', 5)
+        hdf5.write_batch(self.file_path, [
+            ('balances/stu', '100'),
+            ('balances/raghu', '50'),
+            ('balances/old', None),
+        ], 7)
+
+        self.assertEqual(hdf5.get_value_from_disk(self.file_path, 'balances/stu'), 100)
+        self.assertEqual(hdf5.get_value_from_disk(self.file_path, 'balances/raghu'), 50)
+        self.assertEqual(hdf5.get_block(self.file_path, 'balances/stu'), 7)
+        self.assertIsNone(hdf5.get_value_from_disk(self.file_path, 'balances/old'))
+
+
+class TestHDF5Compaction(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.dir, 'con_test')
+
+    def tearDown(self):
+        hdf5.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_compact_drops_dead_groups(self):
+        hdf5.write_batch(self.file_path, [(f'balances/{i}', str(i)) for i in range(100)] + [('meta/x', b'\xc1\x00')], 3)
+        hdf5.write_batch(self.file_path, [(f'balances/{i}', None) for i in range(90)] + [('meta/x', None)])
+
+        stats = hdf5.file_stats(self.file_path)
+        self.assertEqual((stats['live'], stats['dead']), (10, 92))
+
+        before, after = hdf5.compact(self.file_path)
+        self.assertLess(after, before)
+        self.assertEqual(hdf5.file_stats(self.file_path)['dead'], 0)
+        self.assertFalse(os.path.exists(self.file_path + '.compact'))
+
+        self.assertEqual(hdf5.get_value(self.file_path, 'balances/95'), '95')
+        self.assertEqual(hdf5.get_block(self.file_path, 'balances/95'), 3)
+        self.assertEqual(len(hdf5.get_keys(self.file_path)), 10)
+
+    def test_values_keep_their_types(self):
+        long_value = 'x' * (hdf5.ATTR_LEN_MAX + 1)
+        hdf5.write_batch(self.file_path, [('a', '"ü"'), ('b', b'\xc1\x05\x00'), ('c', long_value)], 1)
+
+        hdf5.compact(self.file_path)
+        self.assertEqual(hdf5.get_value(self.file_path, 'a'), '"ü"')
+        self.assertEqual(hdf5.get_value(self.file_path, 'b'), b'\xc1\x05\x00')
+        self.assertEqual(hdf5.get_value(self.file_path, 'c'), long_value)
+
+    def test_missing_file(self):
+        self.assertIsNone(hdf5.file_stats(self.file_path))
+        self.assertIsNone(hdf5.compact(self.file_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
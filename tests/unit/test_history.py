@@ -0,0 +1,69 @@
+import unittest
+from contracting.storage.history import StateHistory
+
+
+class TestStateHistory(unittest.TestCase):
+    def test_lookup(self):
+        history = StateHistory(max_blocks=4)
+        history.record(1, {'a': None})
+        history.record(2, {'a': 1, 'b': None})
+        history.record(3, {'b': 2})
+
+        self.assertEqual(history.lookup('a', 1), (True, 1))
+        self.assertEqual(history.lookup('b', 1), (True, None))
+        self.assertEqual(history.lookup('b', 2), (True, 2))
+        self.assertEqual(history.lookup('a', 3), (False, None))
+
+        with self.assertRaises(ValueError):
+            history.lookup('a', 0)
+
+    def test_evicts_oldest_blocks(self):
+        history = StateHistory(max_blocks=2)
+        history.record(1, {'a': None})
+        history.record(2, {'a': 1})
+        history.record(None, {'a': 2})
+        history.record(None, {'a': 3, 'b': None})
+        history.record(3, {'a': 4})
+
+        self.assertEqual(len(history), 2)
+        self.assertEqual(len(history.entries), 3)
+        self.assertEqual(history.oldest(), 1)
+        self.assertEqual(history.lookup('a', 1), (True, 1))
+        self.assertEqual(history.lookup('b', 2), (True, None))
+
+        history.record(4, {'a': 5})
+        with self.assertRaises(ValueError):
+            history.lookup('a', 1)
+
+    def test_pop_since(self):
+        history = StateHistory(max_blocks=4)
+        history.record(1, {'a': None})
+        history.record(2, {'a': 1, 'b': None})
+        history.record(None, {'b': 2})
+        history.record(3, {'a': 3})
+
+        self.assertEqual(history.pop_since(2), {'a': 1, 'b': None})
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history.pop_since(1), {'a': None})
+        self.assertEqual(len(history.entries), 0)
+
+    def test_pop_since_evicted_block_raises(self):
+        history = StateHistory(max_blocks=1)
+        history.record(1, {'a': None})
+        history.record(2, {'a': 1})
+
+        with self.assertRaises(ValueError):
+            history.pop_since(1)
+        self.assertEqual(history.pop_since(2), {'a': 1})
+
+    def test_disabled(self):
+        history = StateHistory(max_blocks=0)
+        history.record(1, {'a': None})
+
+        self.assertEqual(len(history.entries), 0)
+        with self.assertRaises(ValueError):
+            history.lookup('a', 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import os
+import tempfile
+import shutil
+from contracting.storage.index import KeyIndex, REBUILD_THRESHOLD
+
+
+class TestKeyIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = KeyIndex(['con.balances:c', 'con.balances:a', 'con.owner', 'con.balances:b:x'])
+
+    def test_keys_are_sorted(self):
+        self.assertEqual(self.index.keys, ['con.balances:a', 'con.balances:b:x', 'con.balances:c', 'con.owner'])
+
+    def test_iter_prefix(self):
+        self.assertEqual(list(self.index.iter_prefix('con.balances:')),
+                         ['con.balances:a', 'con.balances:b:x', 'con.balances:c'])
+        self.assertEqual(list(self.index.iter_prefix('con.balances:', length=1)), ['con.balances:a'])
+        self.assertEqual(list(self.index.iter_prefix('con.nothing')), [])
+
+    def test_iter_range(self):
+        self.assertEqual(list(self.index.iter_range('con.balances:b', 'con.owner')),
+                         ['con.balances:b:x', 'con.balances:c'])
+
+    def test_add_and_remove(self):
+        self.index.add('con.balances:aa')
+        self.index.add('con.balances:aa')
+        self.index.remove('con.owner')
+        self.index.remove('con.missing')
+
+        self.assertEqual(self.index.keys, ['con.balances:a', 'con.balances:aa', 'con.balances:b:x', 'con.balances:c'])
+        self.assertIn('con.balances:aa', self.index)
+        self.assertNotIn('con.owner', self.index)
+
+    def test_large_update_rebuilds(self):
+        added = [f'con.balances:{i:05}' for i in range(REBUILD_THRESHOLD + 1)]
+        self.index.update(added=added, removed=['con.owner'])
+
+        self.assertEqual(len(self.index), REBUILD_THRESHOLD + 4)
+        self.assertEqual(self.index.keys, sorted(self.index.keys))
+        self.assertNotIn('con.owner', self.index)
+
+    def test_save_and_load(self):
+        d = tempfile.mkdtemp()
+        try:
+            source = os.path.join(d, 'con')
+            with open(source, 'w') as f:
+                f.write('state')
+
+            path = os.path.join(d, 'con.index')
+            self.index.save(path, source)
+            self.assertEqual(KeyIndex.load(path, source).keys, self.index.keys)
+
+            with open(source, 'a') as f:
+                f.write('changed')
+            self.assertIsNone(KeyIndex.load(path, source))
+        finally:
+            shutil.rmtree(d)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+from contracting.storage.merkle import StateCommitment, verify_proof, empty_hashes
+from contracting.storage.backend import HDF5Backend
+from contracting.storage.driver import Driver
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+
+
+class TestStateCommitment(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.commitment = StateCommitment(self.dir.joinpath('a.db'), depth=4)
+
+    def tearDown(self):
+        self.commitment.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_empty_root(self):
+        self.assertEqual(self.commitment.root(), empty_hashes(4)[-1].hex())
+
+    def test_root_depends_on_state_only(self):
+        other = StateCommitment(self.dir.joinpath('b.db'), depth=4)
+
+        self.commitment.update({'con_a.x': '1', 'con_a.y': '2'})
+        self.commitment.update({'con_b.z': '3', 'con_a.x': '4'})
+
+        other.update({'con_b.z': '3', 'con_c.w': '5'})
+        other.update({'con_a.y': '2', 'con_a.x': '4', 'con_c.w': None})
+
+        self.assertEqual(self.commitment.root(), other.root())
+
+        other.update({'con_a.x': '5'})
+        self.assertNotEqual(self.commitment.root(), other.root())
+        other.close()
+
+    def test_deleting_everything_restores_empty_root(self):
+        self.commitment.update({'con_a.x': '1', 'con_a.y': '2', 'con_ab.y': '3'})
+        self.commitment.delete_prefix('con_a.')
+        self.commitment.update({'con_ab.y': None})
+
+        self.assertEqual(self.commitment.root(), empty_hashes(4)[-1].hex())
+        self.assertEqual(self.commitment.conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0], 0)
+
+    def test_proofs(self):
+        self.commitment.update({f'con_a.balances:{i}': str(i) for i in range(50)})
+        root = self.commitment.root()
+
+        proof = self.commitment.prove('con_a.balances:7')
+        self.assertTrue(verify_proof(root, 'con_a.balances:7', '7', proof))
+        self.assertFalse(verify_proof(root, 'con_a.balances:7', '8', proof))
+        self.assertFalse(verify_proof(root, 'con_a.balances:7', None, proof))
+
+        proof = self.commitment.prove('con_a.balances:x')
+        self.assertTrue(verify_proof(root, 'con_a.balances:x', None, proof))
+        self.assertFalse(verify_proof(root, 'con_a.balances:x', '1', proof))
+
+        proof['siblings'][0] = '00' * 32
+        self.assertFalse(verify_proof(root, 'con_a.balances:x', None, proof))
+
+    def test_persists(self):
+        self.commitment.update({'con_a.x': '1'})
+        root = self.commitment.root()
+        self.commitment.close()
+
+        self.commitment = StateCommitment(self.dir.joinpath('a.db'), depth=4)
+        self.assertEqual(self.commitment.root(), root)
+
+
+class TestDriverStateRoot(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        backend = HDF5Backend(self.dir.joinpath('contract_state'), self.dir.joinpath('run_state'))
+        self.driver = Driver(storage_home=self.dir, backend=backend, state_root=True)
+
+    def tearDown(self):
+        self.driver.flush_full()
+        self.driver.commitment.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_updated_on_commit_and_hard_apply(self):
+        empty = self.driver.state_root()
+
+        self.driver.set('con_a.balances:stu', 1)
+        self.driver.set('__latest_block.height', 1)
+        self.driver.commit()
+        committed = self.driver.state_root()
+        self.assertNotEqual(committed, empty)
+
+        self.driver.set('__latest_block.height', 2)
+        self.driver.hard_apply(2)
+        self.assertEqual(self.driver.state_root(), committed)
+
+        self.driver.set('con_a.balances:stu', 2)
+        self.driver.hard_apply(3)
+        self.assertTrue(verify_proof(self.driver.state_root(), 'con_a.balances:stu', '2',
+                                     self.driver.prove('con_a.balances:stu')))
+
+        self.driver.flush_file('con_a')
+        self.assertEqual(self.driver.state_root(), empty)
+
+    def test_rebuild_matches_incremental(self):
+        self.driver.set('con_a.balances:stu', 1)
+        self.driver.set('con_a.balances:raghu', {'a': [1, 2]})
+        self.driver.set('con_b.owner', 'stu')
+        self.driver.commit()
+        root = self.driver.state_root()
+
+        self.driver.rebuild_state_root()
+        self.assertEqual(self.driver.state_root(), root)
+
+    def test_root_does_not_depend_on_codec(self):
+        self.driver.set('con_a.balances:stu', ContractingDecimal('1.5'))
+        self.driver.set('con_a.owners', {'a': [1, b'x']})
+        self.driver.commit()
+        root = self.driver.state_root()
+
+        binary = Driver(storage_home=self.dir.joinpath('binary'), state_root=True, codec='binary')
+        binary.set('con_a.balances:stu', ContractingDecimal('1.5'))
+        binary.set('con_a.owners', {'a': [1, b'x']})
+        binary.commit()
+        self.assertEqual(binary.state_root(), root)
+
+        binary.rebuild_state_root()
+        self.assertEqual(binary.state_root(), root)
+        binary.flush_full()
+        binary.commitment.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 from unittest import TestCase
 from contracting.execution.module import *
 from contracting.storage.driver import Driver
+from contracting.execution.runtime import rt
+from contracting.execution.tracer import cost_tables
 import types
 import glob
 import os
@@ -68,6 +70,76 @@ class TestDatabaseLoader(TestCase):
         self.assertEqual(self.dl.module_repr(module), "<module 'howdy' (smart contract)>")
 
 
+class TestModuleCache(TestCase):
+    def setUp(self):
+        self.dl = DatabaseLoader()
+        self.dl.d.flush_full()
+        clear_module_cache()
+
+    def tearDown(self):
+        self.dl.d.flush_full()
+        clear_module_cache()
+        rt.env.clear()
+
+    def test_cacheable_module_is_reused_with_current_env(self):
+        self.dl.d.set_contract('cached', 'b = 1337\ndef f():\n    return now')
+
+        rt.env.update({'now': 1})
+        first = types.ModuleType('cached')
+        self.dl.exec_module(first)
+
+        rt.env.update({'now': 2})
+        second = types.ModuleType('cached')
+        self.dl.exec_module(second)
+
+        self.assertIn('cached', MODULE_CACHE)
+        self.assertIs(first.f, second.f)
+        self.assertEqual(second.f(), 2)
+        self.assertEqual(second.b, 1337)
+
+    def test_mutable_globals_are_not_cached(self):
+        self.assertTrue(is_cacheable('a = 1\nb = (1, "x")\ndef f():\n    pass'))
+        self.assertFalse(is_cacheable('a = []'))
+        self.assertFalse(is_cacheable('import currency'))
+        self.assertFalse(is_cacheable('a = f()'))
+
+        self.assertTrue(is_cacheable('@__export("con_a")\ndef f(x: int = 1, *, y: str = "a") -> int:\n    pass'))
+        self.assertTrue(is_cacheable('@construct\ndef seed(x=(1, 2)):\n    pass'))
+        self.assertFalse(is_cacheable('def g(x: list = []):\n    pass'))
+        self.assertFalse(is_cacheable('def g(*, x={}):\n    pass'))
+        self.assertFalse(is_cacheable('def g(x: f() = 1):\n    pass'))
+        self.assertFalse(is_cacheable('@memo\ndef g():\n    pass'))
+
+        self.dl.d.set_contract('uncached', 'a = []')
+        first = types.ModuleType('uncached')
+        self.dl.exec_module(first)
+        first.a.append(1)
+
+        second = types.ModuleType('uncached')
+        self.dl.exec_module(second)
+        self.assertEqual(second.a, [])
+
+    def test_code_objects_are_reused_with_cost_tables(self):
+        self.dl.d.set_contract('coded', 'a = []')
+        self.dl.exec_module(types.ModuleType('coded'))
+
+        blob, code = CODE_CACHE['coded']
+        self.assertIs(load_code('coded', blob), code)
+        self.assertIs(cost_tables[id(code)][0], code)
+
+    def test_changed_code_is_not_reused(self):
+        self.dl.d.set_contract('changing', 'b = 1')
+        first = types.ModuleType('changing')
+        self.dl.exec_module(first)
+
+        self.dl.d.flush_full()
+        self.dl.d.set_contract('changing', 'b = 2')
+        second = types.ModuleType('changing')
+        self.dl.exec_module(second)
+
+        self.assertEqual(second.b, 2)
+
+
 class TestInstallLoader(TestCase):
     def test_install_loader(self):
         uninstall_database_loader()
@@ -3,6 +3,10 @@ import os
 from shutil import rmtree
 from datetime import datetime
 from contracting.storage.driver import Driver
+from contracting.storage.cache import MISSING
+from contracting.storage.encoder import encode
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+from contracting.execution.runtime import rt
 
 class TestDriver(unittest.TestCase):
 
@@ -97,6 +101,212 @@ class TestDriver(unittest.TestCase):
         retrieved_value = self.driver.get(key)
         self.assertEqual(retrieved_value, value)
 
+    def test_commit_writes_and_deletes_across_files(self):
+        self.driver.set('con_a.balances:stu', 1)
+        self.driver.set('con_a.balances:raghu', 2)
+        self.driver.set('con_b.owner', 'stu')
+        self.driver.commit()
+
+        self.driver.delete('con_a.balances:stu')
+        self.driver.commit()
+
+        self.assertIsNone(self.driver.value_from_disk('con_a.balances:stu'))
+        self.assertEqual(self.driver.value_from_disk('con_a.balances:raghu'), 2)
+        self.assertEqual(self.driver.value_from_disk('con_b.owner'), 'stu')
+
+    def test_hard_apply_writes_to_disk(self):
+        self.driver.set('con_a.balances:stu', 1)
+        self.driver.hard_apply(1)
+        self.driver.set('con_a.balances:stu', 2)
+        self.driver.hard_apply(2)
+
+        self.assertEqual(self.driver.value_from_disk('con_a.balances:stu'), 2)
+        self.assertEqual(self.driver.pending_deltas, {})
+
+    def test_get_as_of_block(self):
+        driver = Driver(history=2)
+        driver.set('con_a.balances:stu', 1)
+        driver.hard_apply(1)
+        driver.set('con_a.balances:stu', 2)
+        driver.set('con_a.balances:raghu', 3)
+        driver.hard_apply(2)
+        driver.set('con_a.balances:stu', 4)
+        driver.commit()
+
+        self.assertEqual(driver.get('con_a.balances:stu', at=1), 1)
+        self.assertIsNone(driver.get('con_a.balances:raghu', at=1))
+        self.assertEqual(driver.get('con_a.balances:stu', at=2), 2)
+        self.assertEqual(driver.get('con_a.balances:stu'), 4)
+        self.assertEqual(driver.pending_reads, {'con_a.balances:stu': 4})
+
+        driver.set('con_a.balances:stu', 5)
+        driver.hard_apply(3)
+        driver.set('con_a.balances:stu', 6)
+        driver.hard_apply(4)
+        self.assertEqual(driver.get('con_a.balances:stu', at=2), 2)
+        with self.assertRaises(ValueError):
+            driver.get('con_a.balances:stu', at=1)
+
+    def test_rollback_undoes_blocks_on_disk(self):
+        driver = Driver(history=4)
+        driver.set('con_a.balances:stu', 1)
+        driver.hard_apply(1)
+        driver.set('con_a.balances:stu', 2)
+        driver.set('con_a.balances:raghu', 3)
+        driver.hard_apply(2)
+        driver.set('con_a.balances:stu', 3)
+        driver.hard_apply(3)
+        driver.set('con_a.balances:stu', 9)
+
+        driver.rollback(2)
+
+        self.assertEqual(driver.pending_writes, {})
+        self.assertEqual(driver.value_from_disk('con_a.balances:stu'), 1)
+        self.assertEqual(driver.backend.get_block('con_a.balances:stu'), 1)
+        self.assertIsNone(driver.value_from_disk('con_a.balances:raghu'))
+        self.assertEqual(driver.get('con_a.balances:stu'), 1)
+        self.assertEqual(len(driver.history), 1)
+
+    def test_cache_is_updated_on_commit(self):
+        self.driver.set('con_a.balances:stu', 1)
+        self.driver.commit()
+
+        self.assertEqual(self.driver.cache.get('con_a.balances:stu'), 1)
+
+        self.driver.delete('con_a.balances:stu')
+        self.driver.commit()
+
+        self.assertIs(self.driver.cache.get('con_a.balances:stu'), MISSING)
+
+    def test_committed_values_read_as_from_disk(self):
+        self.driver.set('con_a.x', (1, 2))
+        self.driver.set('con_a.y', {1: 'a', 'b': (3,)})
+        self.driver.commit()
+
+        warm = [self.driver.get('con_a.x'), self.driver.get('con_a.y')]
+        self.driver.cache.clear()
+        cold = [self.driver.get('con_a.x'), self.driver.get('con_a.y')]
+
+        self.assertEqual(warm, [[1, 2], {'1': 'a', 'b': [3]}])
+        self.assertEqual(warm, cold)
+
+    def test_reads_are_cached(self):
+        self.driver.set('con_a.balances:stu', {'a': 1})
+        self.driver.commit()
+        self.driver.cache.clear()
+
+        first = self.driver.get('con_a.balances:stu')
+        first['a'] = 2
+        hits = self.driver.cache.hits
+
+        self.assertEqual(self.driver.get('con_a.balances:stu'), {'a': 1})
+        self.assertEqual(self.driver.cache.hits, hits + 1)
+
+    def test_pending_values_are_not_shared(self):
+        self.driver.set('con_a.balances:stu', {'a': [1]})
+
+        self.driver.get('con_a.balances:stu')['a'].append(2)
+        self.driver.items('con_a.balances:')['con_a.balances:stu']['a'].append(3)
+
+        self.assertEqual(self.driver.get('con_a.balances:stu'), {'a': [1]})
+
+    def test_rollback_savepoint(self):
+        self.driver.set('con_a.x', 1)
+        self.driver.set('con_a.y', 2)
+
+        self.driver.begin_savepoint()
+        self.driver.set('con_a.x', 3)
+        self.driver.set('con_a.x', 4)
+        self.driver.set('con_a.z', 5)
+        self.driver.delete('con_a.y')
+        self.assertEqual(set(self.driver.savepoints[-1]), {'con_a.x', 'con_a.y', 'con_a.z'})
+        self.driver.rollback_savepoint()
+
+        self.assertEqual(self.driver.pending_writes, {'con_a.x': 1, 'con_a.y': 2})
+        self.assertEqual(self.driver.savepoints, [])
+
+    def test_nested_savepoints(self):
+        self.driver.set('con_a.x', 1)
+
+        self.driver.begin_savepoint()
+        self.driver.set('con_a.x', 2)
+
+        self.driver.begin_savepoint()
+        self.driver.set('con_a.y', 3)
+        self.driver.release_savepoint()
+
+        self.driver.begin_savepoint()
+        self.driver.set('con_a.x', 4)
+        self.driver.rollback_savepoint()
+
+        self.assertEqual(self.driver.pending_writes, {'con_a.x': 2, 'con_a.y': 3})
+
+        self.driver.rollback_savepoint()
+        self.assertEqual(self.driver.pending_writes, {'con_a.x': 1})
+
+    def test_commit_inside_savepoint(self):
+        self.driver.begin_savepoint()
+        self.driver.set('con_a.x', 1)
+        self.driver.commit()
+        self.driver.set('con_a.y', 2)
+        self.driver.rollback_savepoint()
+
+        self.assertEqual(self.driver.pending_writes, {})
+        self.assertEqual(self.driver.get('con_a.x'), 1)
+
+    def test_reads_and_writes_are_charged_by_json_size(self):
+        key = 'con_a.balances:stu'
+        self.driver.set(key, ContractingDecimal('1.5'))
+        self.driver.commit()
+        self.assertEqual(self.driver.cache.get_cost_size(key), len(encode(ContractingDecimal('1.5'))))
+
+        rt.set_up(stmps=10000, meter=True)
+        try:
+            self.driver.get(key)
+            self.driver.get(key)
+            read_cost = rt.tracer.cost
+            self.driver.set(key, 2.25)
+            write_cost = rt.tracer.cost - read_cost
+        finally:
+            rt.clean_up_transaction()
+
+        self.assertEqual(read_cost, 2 * (len(key) + len(encode(ContractingDecimal('1.5')))))
+        self.assertEqual(write_cost, (len(key) + len(encode(2.25))) * 25)
+        self.assertEqual(self.driver.pending_writes[key], ContractingDecimal('2.25'))
+
+    def test_binary_codec_charges_as_json(self):
+        driver = Driver(codec='binary')
+        driver.set('con_a.owners', {'stu': [1, 2]})
+        driver.set('con_a.balances:stu', ContractingDecimal('1.5'))
+        driver.commit()
+        driver.cache.clear()
+
+        rt.set_up(stmps=10000, meter=True)
+        try:
+            driver.get('con_a.owners')
+            driver.get('con_a.balances:stu')
+            cost = rt.tracer.cost
+        finally:
+            rt.clean_up_transaction()
+
+        self.assertEqual(cost, len('con_a.owners') + len(encode({'stu': [1, 2]})) +
+                         len('con_a.balances:stu') + len(encode(ContractingDecimal('1.5'))))
+
+    def test_misses_are_cached_until_written(self):
+        self.assertIsNone(self.driver.get('con_a.balances:stu'))
+        self.assertIsNone(self.driver.get('con_a.balances:stu'))
+        self.assertEqual(self.driver.cache.negative_hits, 1)
+
+        self.driver.set('con_a.balances:stu', 1)
+        self.driver.commit()
+        self.assertEqual(self.driver.get('con_a.balances:stu'), 1)
+
+        self.driver.delete('con_a.balances:stu')
+        self.driver.commit()
+        negative_hits = self.driver.cache.negative_hits
+        self.assertIsNone(self.driver.get('con_a.balances:stu'))
+        self.assertEqual(self.driver.cache.negative_hits, negative_hits + 1)
+
     def test_get_all_contract_state(self):
         key = 'contract.key'
         value = 'contract_value'
@@ -166,6 +166,26 @@ class TestHash(TestCase):
         val = driver.get('blah.scoob:stu:raghu')
         self.assertEqual(val, 1000)
 
+    def test_keys_of_equal_values_are_not_confused(self):
+        h = Hash('blah', 'scoob', driver=driver)
+        h['1', 'a'] = 1
+        h[1, 'a'] = 2
+        h[True, 'a'] = 3
+
+        self.assertEqual(h['1', 'a'], 2)
+        self.assertEqual(driver.get('blah.scoob:True:a'), 3)
+
+        for _ in range(2):
+            with self.assertRaises(AssertionError):
+                h['stu', 'raghu:1'] = 1
+
+    def test_foreign_hash_keys_use_the_foreign_prefix(self):
+        h = Hash('blah', 'scoob', driver=driver)
+        h['stu', 'raghu'] = 5
+
+        f = ForeignHash('other', 'scoob', 'blah', 'scoob', driver=driver)
+        self.assertEqual(f['stu', 'raghu'], 5)
+
     def test_setitem_delimiter_illegal(self):
         contract = 'blah'
         name = 'scoob'
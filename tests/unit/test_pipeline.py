@@ -0,0 +1,147 @@
+import unittest
+import tempfile
+import shutil
+import threading
+from pathlib import Path
+from contracting.storage.pipeline import PipelinedBackend
+from contracting.storage.sqlite import SQLiteBackend
+from contracting.storage.driver import Driver
+
+
+class GatedBackend(SQLiteBackend):
+    # Holds every write until the gate is opened, so writes can be seen in flight
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.gate = threading.Event()
+        self.fail = False
+
+    def write_batch(self, writes, block_num=None):
+        self.gate.wait()
+        if self.fail:
+            raise IOError('disk full')
+        super().write_batch(writes, block_num)
+
+
+class TestPipelinedBackend(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.inner = GatedBackend(self.dir.joinpath('state.db'))
+        self.backend = PipelinedBackend(self.inner)
+
+    def tearDown(self):
+        self.inner.gate.set()
+        self.inner.fail = False
+        self.backend.clear()
+        self.backend.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_in_flight_writes_are_read_from_the_overlay(self):
+        writes = {'con_a.x': '1', 'con_a.y': '2'}
+        self.backend.write_batch(writes, 1)
+        self.backend.write_batch({'con_a.x': None}, 2)
+
+        # The write set handed over is a copy
+        writes['con_a.y'] = '3'
+
+        self.assertIsNone(self.inner.get('con_a.y'))
+        self.assertIsNone(self.backend.get('con_a.x'))
+        self.assertEqual(self.backend.get('con_a.y'), '2')
+
+        self.inner.gate.set()
+        self.backend.barrier()
+        self.assertEqual(self.backend.overlay, {})
+        self.assertEqual(self.inner.get('con_a.y'), '2')
+        self.assertIsNone(self.inner.get('con_a.x'))
+        self.assertEqual(self.inner.get_block('con_a.y'), 1)
+
+    def test_scans_wait_for_writes_in_flight(self):
+        self.inner.gate.set()
+        self.backend.write_batch({'con_a.x': '1'})
+
+        self.assertEqual(list(self.backend.iter_keys('con_a.')), ['con_a.x'])
+
+    def test_write_errors_are_raised_by_the_barrier(self):
+        self.inner.fail = True
+        self.inner.gate.set()
+        self.backend.write_batch({'con_a.x': '1'})
+
+        with self.assertRaises(IOError):
+            self.backend.barrier()
+
+        # Kept readable, as it never reached the backend
+        self.assertEqual(self.backend.get('con_a.x'), '1')
+
+        # Until cleared, the overlay holds writes the backend doesn't have, so the error stays
+        self.inner.fail = False
+        with self.assertRaises(IOError):
+            self.backend.barrier()
+        with self.assertRaises(IOError):
+            self.backend.write_batch({'con_a.y': '2'})
+        self.assertIsNone(self.inner.get('con_a.y'))
+
+        self.backend.clear()
+        self.backend.write_batch({'con_a.y': '2'})
+        self.backend.barrier()
+        self.assertEqual(self.inner.get('con_a.y'), '2')
+        self.assertIsNone(self.backend.get('con_a.x'))
+
+
+class TestDriverBackgroundCommit(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_blocks_are_committed_in_the_background(self):
+        inner = GatedBackend(self.dir.joinpath('state.db'))
+        driver = Driver(storage_home=self.dir, backend=inner, background_commit=True)
+
+        driver.set('con_a.balances:stu', 1)
+        driver.hard_apply(1)
+        driver.set('con_a.balances:stu', 2)
+        driver.set('con_a.balances:raghu', 3)
+        driver.hard_apply(2)
+
+        driver.cache.clear()
+        self.assertEqual(driver.get('con_a.balances:stu'), 2)
+        self.assertIsNone(inner.get('con_a.balances:stu'))
+
+        inner.gate.set()
+        driver.barrier()
+        self.assertEqual(inner.get('con_a.balances:raghu'), '3')
+        self.assertEqual(driver.items('con_a.balances:'), {'con_a.balances:stu': 2, 'con_a.balances:raghu': 3})
+
+        driver.close()
+
+    def test_close_writes_what_is_queued(self):
+        inner = GatedBackend(self.dir.joinpath('state.db'))
+        driver = Driver(storage_home=self.dir, backend=inner, background_commit=True)
+
+        driver.set('con_a.balances:stu', 1)
+        driver.hard_apply(1)
+        self.assertIsNone(inner.get('con_a.balances:stu'))
+
+        inner.gate.set()
+        driver.close()
+        self.assertIsNone(driver.backend.worker)
+
+        restarted = Driver(storage_home=self.dir, backend=SQLiteBackend(self.dir.joinpath('state.db')))
+        self.assertEqual(restarted.get('con_a.balances:stu'), 1)
+        restarted.close()
+
+    def test_composes_with_the_write_ahead_log(self):
+        driver = Driver(storage_home=self.dir, backend=SQLiteBackend(self.dir.joinpath('state.db')),
+                        background_commit=True, wal=True, wal_apply_every=10)
+
+        driver.set('con_a.x', 'a')
+        driver.hard_apply(1)
+        driver.barrier()
+        self.assertEqual(list(driver.backend.backend.log.records()), [(1, {'con_a.x': '"a"'})])
+        self.assertEqual(driver.get('con_a.x'), 'a')
+
+        driver.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,13 @@
 from unittest import TestCase
-from contracting.execution import runtime
+from contracting.execution import runtime, tracer
+from contracting.execution.executor import Executor
+from contracting.execution.tracer import Tracer, ContractTracer, MAX_MEMORY_USAGE, MEMORY_CHECK_INTERVAL
 import sys
 import psutil
 import os
+import math
+import types
+import dis
 
 
 class TestRuntime(TestCase):
@@ -137,4 +142,130 @@ class TestRuntime(TestCase):
         with self.assertRaises(AssertionError):
             runtime.rt.deduct_write('a', 'b' * 32 * 1024)
 
-        runtime.rt.clean_up()
\ No newline at end of file
+        runtime.rt.clean_up()
+
+METERED_CODE = '''
+def loop(n):
+    total = 0
+    for i in range(n):
+        if i % 3 == 0:
+            continue
+        total += i
+    while n > 0: n -= 1
+    return total
+
+def fail(n):
+    try:
+        x = {'a': 1}['b']
+    except KeyError:
+        x = sorted([n, 1])
+    return x
+
+def main():
+    for i in range(10):
+        loop(i)
+        fail(i)
+    return [i * 2 for i in range(5) if i]
+'''
+
+
+class TestContractTracer(TestCase):
+    def run_metered(self, tracer, stamps=1000000):
+        scope = {'__contract__': True}
+        exec(METERED_CODE, scope)
+
+        tracer.set_stamp(stamps)
+        tracer.start()
+        try:
+            scope['main']()
+        finally:
+            tracer.stop()
+        return tracer
+
+    def test_costs_match_tracer(self):
+        reference = self.run_metered(Tracer())
+        contract = self.run_metered(ContractTracer())
+
+        self.assertGreater(reference.get_stamp_used(), 0)
+        self.assertEqual(contract.get_stamp_used(), reference.get_stamp_used())
+
+    def test_call_count_matches_tracer(self):
+        reference = self.run_metered(Tracer())
+        contract = self.run_metered(ContractTracer())
+
+        self.assertEqual(contract.call_count, reference.call_count)
+
+    def test_exceeding_stamps_raises(self):
+        with self.assertRaises(AssertionError):
+            self.run_metered(ContractTracer(), stamps=100)
+
+    def test_executor_installs_tracer(self):
+        tracer = ContractTracer()
+        previous = runtime.rt.tracer
+        try:
+            Executor(tracer=tracer)
+            self.assertIs(runtime.rt.tracer, tracer)
+        finally:
+            runtime.rt.use_tracer(previous)
+
+
+class GrowingTracer(ContractTracer):
+    def __init__(self, growth):
+        super().__init__()
+        self.growth = growth
+        self.samples = 0
+
+    def get_memory_usage(self):
+        self.samples += 1
+        return 1024 + self.samples * self.growth
+
+
+class TestMemoryAccounting(TestCase):
+    def run_metered(self, tracer):
+        scope = {'__contract__': True}
+        exec(METERED_CODE, scope)
+
+        tracer.set_stamp(1000000)
+        tracer.start()
+        try:
+            scope['main']()
+        finally:
+            tracer.stop()
+        return tracer
+
+    def test_memory_is_sampled_not_read_per_line(self):
+        tracer = self.run_metered(GrowingTracer(growth=1))
+
+        self.assertGreater(tracer.samples, 1)
+        self.assertEqual(tracer.samples, math.ceil(tracer.call_count / MEMORY_CHECK_INTERVAL))
+        self.assertEqual(tracer.get_total_mem_usage(), tracer.samples - 1)
+
+    def test_memory_ceiling_is_enforced(self):
+        with self.assertRaises(AssertionError):
+            self.run_metered(GrowingTracer(growth=MAX_MEMORY_USAGE // 2))
+
+
+class TestCostTables(TestCase):
+    def test_costs_match_instructions(self):
+        code = compile(METERED_CODE, '<contract>', 'exec')
+        loop = [c for c in code.co_consts if isinstance(c, types.CodeType) and c.co_name == 'loop'][0]
+
+        costs = tracer.cost_table(loop)
+
+        for instruction in dis.get_instructions(loop):
+            self.assertEqual(costs[instruction.offset // 2], tracer.cu_costs.get(instruction.opcode, 1))
+
+    def test_precompute_costs_covers_nested_code(self):
+        code = compile(METERED_CODE, '<contract>', 'exec')
+        tracer.precompute_costs(code)
+
+        nested = [c for c in code.co_consts if isinstance(c, types.CodeType)]
+        self.assertEqual(len(nested), 3)
+        for c in [code] + nested:
+            self.assertIs(tracer.cost_tables[id(c)][0], c)
+
+    def test_cost_tables_are_bounded(self):
+        for i in range(tracer.COST_TABLES_SIZE + 10):
+            tracer.cost_table(compile(f'x = {i}', '<contract>', 'exec'))
+
+        self.assertLessEqual(len(tracer.cost_tables), tracer.COST_TABLES_SIZE)
@@ -0,0 +1,109 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+from contracting.storage.snapshot import write_snapshot, SnapshotDriver
+from contracting.storage.sqlite import SQLiteBackend
+from contracting.storage.driver import Driver
+from contracting.storage.encoder import encode_binary
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+
+
+class TestSnapshotFormat(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.path = self.dir.joinpath('state.snap')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write(self, records, **kwargs):
+        with open(self.path, 'wb') as f:
+            return write_snapshot(f, records, **kwargs)
+
+    def test_lookups_through_the_sparse_index(self):
+        records = [(f'con_a.balances:{i:04}', str(i), i) for i in range(1000)]
+        self.assertEqual(self.write(records, block=7, index_interval=16), 1000)
+
+        snap = SnapshotDriver(self.path)
+        self.assertEqual((len(snap), snap.block, len(snap.index_keys)), (1000, 7, 63))
+
+        for i in (0, 15, 16, 17, 500, 999):
+            self.assertEqual(snap.get(f'con_a.balances:{i:04}'), i)
+            self.assertEqual(snap.get_block(f'con_a.balances:{i:04}'), i)
+        self.assertIsNone(snap.get('con_a.balances:1000'))
+        self.assertIsNone(snap.get('con_a.balances:00005'))
+        self.assertIsNone(snap.get('a'))
+        self.assertIsNone(snap.get('z'))
+
+        self.assertEqual(snap.keys('con_a.balances:012'), [f'con_a.balances:{i:04}' for i in range(120, 130)])
+        self.assertEqual(len(snap.items('con_a.')), 1000)
+        self.assertEqual(snap.items('con_b.'), {})
+        snap.close()
+
+    def test_prefix_starting_at_an_indexed_record(self):
+        self.write([('con_a.a', '1', 1), ('con_a.b', '2', 1), ('con_a.x:1', '3', 1), ('con_a.x:2', '4', 1),
+                    ('con_a.y', '5', 1)], index_interval=2)
+
+        snap = SnapshotDriver(self.path)
+        self.assertEqual(snap.keys('con_a.x'), ['con_a.x:1', 'con_a.x:2'])
+        self.assertEqual(snap.keys('con_a.x:'), ['con_a.x:1', 'con_a.x:2'])
+        self.assertEqual(snap.keys('con_a.c'), [])
+        self.assertEqual(snap.get('con_a.b'), 2)
+        self.assertIsNone(snap.get('con_a.x'))
+        snap.close()
+
+    def test_values_of_either_codec(self):
+        self.write([('con_a.x', '{"__fixed__":"1.5"}', 1), ('con_a.y', encode_binary('hü'), 2),
+                    ('con_a.\xfc', '"\xfc"', 3)])
+
+        snap = SnapshotDriver(self.path)
+        self.assertEqual(snap.get('con_a.x'), ContractingDecimal('1.5'))
+        self.assertEqual(snap.items('con_a.'), {'con_a.x': ContractingDecimal('1.5'), 'con_a.y': 'hü', 'con_a.ü': 'ü'})
+        snap.close()
+
+    def test_empty_and_invalid_files(self):
+        self.write([])
+        snap = SnapshotDriver(self.path)
+        self.assertIsNone(snap.get('con_a.x'))
+        self.assertEqual(snap.keys(), [])
+        snap.close()
+
+        with self.assertRaises(ValueError):
+            self.write([('con_a.y', '1', 1), ('con_a.x', '2', 1)])
+
+        self.path.write_bytes(b'nothing at all, not a snapshot')
+        with self.assertRaises(ValueError):
+            SnapshotDriver(self.path)
+
+
+class TestDriverSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_export_snapshot(self):
+        driver = Driver(storage_home=self.dir, backend=SQLiteBackend(self.dir.joinpath('state.db')))
+        driver.set('con_a.balances:stu', 1)
+        driver.set('con_a.balances:raghu', {'a': [1, 2]})
+        driver.set('con_a-b.owner', 'stu')
+        driver.set('__latest_block.height', 3)
+        driver.hard_apply(123)
+        driver.set('con_a.balances:stu', 5)
+
+        path = self.dir.joinpath('123.snap')
+        self.assertEqual(driver.export_snapshot(path, block=123, run_state=False), 3)
+
+        snap = SnapshotDriver(path)
+        self.assertEqual(snap.block, 123)
+        self.assertEqual(snap.keys(), ['con_a-b.owner', 'con_a.balances:raghu', 'con_a.balances:stu'])
+        self.assertEqual(snap.get_var('con_a', 'balances', ['stu']), 1)
+        self.assertEqual(snap.items('con_a.balances:'), driver.items('con_a.balances:') | {'con_a.balances:stu': 1})
+        self.assertIsNone(snap.get('__latest_block.height'))
+        snap.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+from contracting.storage.wal import WriteAheadLog, LoggedBackend
+from contracting.storage.sqlite import SQLiteBackend
+from contracting.storage.driver import Driver
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.log = WriteAheadLog(self.dir.joinpath('state.wal'), sync_every=2)
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_records_round_trip(self):
+        self.log.append({'con_a.x': '1', 'con_a.y': None}, 5)
+        self.log.append({'con_a.z': b'\xc1\x00', 'con_a.ü': '"ü"'})
+
+        self.assertEqual(list(self.log.records()), [
+            (5, {'con_a.x': '1', 'con_a.y': None}),
+            (-1, {'con_a.z': b'\xc1\x00', 'con_a.ü': '"ü"'})
+        ])
+
+        self.log.truncate()
+        self.assertEqual(list(self.log.records()), [])
+
+    def test_torn_record_ends_the_log(self):
+        self.log.append({'con_a.x': '1'}, 1)
+        self.log.append({'con_a.x': '2'}, 2)
+        self.log.close()
+
+        path = self.dir.joinpath('state.wal')
+        data = path.read_bytes()
+        path.write_bytes(data[:-1])
+        self.assertEqual(list(self.log.records()), [(1, {'con_a.x': '1'})])
+
+        path.write_bytes(data[:-1] + b'9')
+        self.assertEqual(list(self.log.records()), [(1, {'con_a.x': '1'})])
+
+    def test_appends_are_synced_in_groups(self):
+        self.log.append({'con_a.x': '1'})
+        self.assertEqual(self.log.unsynced, 1)
+        self.log.append({'con_a.x': '2'})
+        self.assertEqual(self.log.unsynced, 0)
+
+
+class SyncedBackend(SQLiteBackend):
+    # Records the size of the log whenever it is synced
+    def __init__(self, db_path, log_path):
+        super().__init__(db_path)
+        self.log_path = log_path
+        self.synced_log_sizes = []
+
+    def sync(self):
+        super().sync()
+        self.synced_log_sizes.append(self.log_path.stat().st_size)
+
+
+class TestLoggedBackend(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.inner = SQLiteBackend(self.dir.joinpath('state.db'))
+        self.backend = LoggedBackend(self.inner, self.dir.joinpath('state.wal'), apply_every=3)
+
+    def tearDown(self):
+        self.backend.log.close()
+        self.inner.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_writes_are_applied_in_batches(self):
+        self.backend.write_batch({'con_a.x': '1', 'con_a.y': '2'}, 1)
+        self.backend.write_batch({'con_a.x': None}, 2)
+
+        self.assertIsNone(self.inner.get('con_a.y'))
+        self.assertIsNone(self.backend.get('con_a.x'))
+        self.assertEqual(self.backend.get('con_a.y'), '2')
+        self.assertEqual(self.backend.get_block('con_a.y'), 1)
+        self.assertIsNone(self.backend.get_block('con_a.x'))
+        self.assertEqual(len(self.backend.unapplied), 2)
+
+        self.backend.write_batch({'con_a.z': '3'}, 3)
+        self.assertEqual(self.inner.get('con_a.y'), '2')
+        self.assertIsNone(self.inner.get('con_a.x'))
+        self.assertEqual(self.inner.get_block('con_a.z'), 3)
+        self.assertEqual(list(self.backend.log.records()), [])
+
+    def test_applied_writes_are_synced_before_the_log_is_emptied(self):
+        log_path = self.dir.joinpath('synced.wal')
+        inner = SyncedBackend(self.dir.joinpath('synced.db'), log_path)
+        backend = LoggedBackend(inner, log_path)
+
+        backend.write_batch({'con_a.x': '1'}, 1)
+        self.assertEqual(len(inner.synced_log_sizes), 1)
+        self.assertGreater(inner.synced_log_sizes[0], 0)
+        self.assertEqual(log_path.stat().st_size, 0)
+
+        backend.log.close()
+        inner.close()
+
+    def test_scans_apply_held_writes_first(self):
+        self.backend.write_batch({'con_a.x': '1'})
+
+        self.assertEqual(list(self.backend.iter_keys('con_a.')), ['con_a.x'])
+        self.assertEqual(self.inner.get('con_a.x'), '1')
+
+    def test_replay_applies_what_was_logged(self):
+        self.backend.write_batch({'con_a.x': '1'}, 1)
+        self.backend.write_batch({'con_a.x': '2', 'con_a.y': '3'}, 2)
+        self.assertIsNone(self.inner.get('con_a.x'))
+
+        # Another process opening the state after this one died
+        reopened = LoggedBackend(self.inner, self.dir.joinpath('state.wal'))
+        self.assertEqual([block for block, _ in reopened.replay()], [1, 2])
+        self.assertEqual(self.inner.get('con_a.x'), '2')
+        self.assertEqual(self.inner.get_block('con_a.y'), 2)
+        self.assertEqual(reopened.replay(), [])
+        reopened.log.close()
+
+
+class TestDriverWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_unapplied_blocks_are_replayed_on_startup(self):
+        backend = SQLiteBackend(self.dir.joinpath('state.db'))
+        driver = Driver(storage_home=self.dir, backend=backend, wal=True, wal_apply_every=10, state_root=True)
+        driver.set('con_a.balances:stu', 1)
+        driver.hard_apply(1)
+        driver.set('con_a.balances:stu', 2)
+        driver.set('con_a.balances:raghu', 3)
+        driver.hard_apply(2)
+        root = driver.state_root()
+
+        driver.cache.clear()
+        self.assertEqual(driver.get('con_a.balances:stu'), 2)
+        self.assertIsNone(backend.get('con_a.balances:stu'))
+
+        restarted = Driver(storage_home=self.dir, backend=SQLiteBackend(self.dir.joinpath('state.db')), wal=True,
+                           state_root=True)
+        self.assertEqual(restarted.get('con_a.balances:stu'), 2)
+        self.assertEqual(restarted.get('con_a.balances:raghu'), 3)
+        self.assertEqual(restarted.state_root(), root)
+
+        self.assertEqual(driver.items('con_a.balances:'), {'con_a.balances:stu': 2, 'con_a.balances:raghu': 3})
+
+        restarted.commitment.close()
+        driver.commitment.close()
+        driver.backend.log.close()
+        restarted.backend.log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()